@@ -1,9 +1,19 @@
-import spacy
+from .model_registry import registry
 
-# Load the small English model (efficient for CPU)
-nlp = spacy.load("en_core_web_sm")
+# en_core_web_sm components the aspect logic never reads (it only needs
+# POS tags and the dependency parse). Skipping them is most of the speedup.
+UNUSED_PIPES = ("ner", "lemmatizer")
 
 class AspectEngine:
+    _shared = None
+
+    @classmethod
+    def shared(cls):
+        """One engine per process (the lookup tables never change)."""
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
     def __init__(self):
         # Define keywords we care about (The "Aspects")
         # You can expand this list based on your specific business
@@ -14,13 +24,46 @@ class AspectEngine:
             "delivery": ["shipping", "delivery", "arrive", "tracking", "package"]
         }
 
+        # Reverse index word -> category, built once: one dict lookup per
+        # adjective instead of scanning every category's list.
+        # (First category wins if a word is listed twice, like the old scan.)
+        self.word_to_category = {}
+        for category, keywords in self.target_aspects.items():
+            for keyword in keywords:
+                self.word_to_category.setdefault(keyword, category)
+
+        # Simple hardcoded lexicons for speed (sets: O(1) membership)
+        self.pos_words = frozenset(["good", "great", "fast", "friendly", "cheap", "easy", "clean", "nice", "excellent"])
+        self.neg_words = frozenset(["bad", "slow", "rude", "expensive", "hard", "broken", "dirty", "terrible", "buggy"])
+
+    def _disabled(self, nlp):
+        return [name for name in UNUSED_PIPES if name in nlp.pipe_names]
+
     def get_aspect_sentiment(self, text):
         """
         Finds nouns (Aspects) and their linked adjectives (Sentiment).
         Returns: { 'price': 'Negative', 'support': 'Positive' }
         """
-        doc = nlp(text.lower())
+        # Small English model (efficient for CPU), loaded once by the registry
+        nlp = registry.get_spacy_nlp()
+        return self._aspects_from_doc(nlp(text.lower(), disable=self._disabled(nlp)))
+
+    def get_aspect_sentiment_batch(self, texts, batch_size=64, n_process=1):
+        """
+        Same as get_aspect_sentiment for many texts at once (spaCy nlp.pipe).
+        n_process > 1 parses in worker processes (worth it for large backfills).
+        Returns one dict per text, in order.
+        """
+        nlp = registry.get_spacy_nlp()
+        docs = nlp.pipe(
+            (text.lower() for text in texts),
+            batch_size=batch_size, n_process=n_process, disable=self._disabled(nlp),
+        )
+        return [self._aspects_from_doc(doc) for doc in docs]
+
+    def _aspects_from_doc(self, doc):
         results = {}
+        word_to_category = self.word_to_category
 
         # 1. Iterate through every word in the email
         for token in doc:
@@ -30,10 +73,8 @@ class AspectEngine:
                 
                 # 3. Find which Noun this adjective describes (Dependency Parsing)
                 # 'token.head' gives the word this adjective is attached to
-                noun = token.head.text
-                
                 # 4. Check if this Noun is one of our Target Aspects
-                category = self._map_noun_to_category(noun)
+                category = word_to_category.get(token.head.text)
                 
                 if category:
                     # We found a match! (e.g., "expensive" -> linked to -> "price")
@@ -47,22 +88,15 @@ class AspectEngine:
 
     def _map_noun_to_category(self, noun):
         """Maps a word like 'bill' to the category 'price'."""
-        for category, keywords in self.target_aspects.items():
-            if noun in keywords:
-                return category
-        return None
+        return self.word_to_category.get(noun)
 
     def _get_adj_polarity(self, adjective):
         """
         Simple lookup for adjective polarity. 
         In a real app, you could use VADER score here too.
         """
-        # Simple hardcoded lists for speed
-        pos_words = ["good", "great", "fast", "friendly", "cheap", "easy", "clean", "nice", "excellent"]
-        neg_words = ["bad", "slow", "rude", "expensive", "hard", "broken", "dirty", "terrible", "buggy"]
-        
-        if adjective in pos_words: return "Positive"
-        if adjective in neg_words: return "Negative"
+        if adjective in self.pos_words: return "Positive"
+        if adjective in self.neg_words: return "Negative"
         return "Neutral"
 
 # --- Test Block ---
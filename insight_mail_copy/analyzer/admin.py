@@ -1,10 +1,34 @@
 from django.contrib import admin
-from .models import Email, AnalysisResult
+from .models import Email, AnalysisResult, AnalysisCacheEntry, AnalysisJob, EmailThread, InboxRollup, MailboxSyncState
 
 @admin.register(Email)
 class EmailAdmin(admin.ModelAdmin):
-    list_display = ('subject', 'sender', 'is_analyzed', 'received_at')
+    list_display = ('subject', 'sender', 'is_analyzed', 'analysis_status', 'received_at')
 
 @admin.register(AnalysisResult)
 class AnalysisResultAdmin(admin.ModelAdmin):
     list_display = ('email', 'sentiment', 'risk_score', 'suggested_category')
+
+@admin.register(AnalysisCacheEntry)
+class AnalysisCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('key', 'model_version', 'hits', 'created_at', 'last_hit_at')
+    list_filter = ('model_version',)
+
+@admin.register(AnalysisJob)
+class AnalysisJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'email', 'status', 'priority', 'attempts', 'locked_by', 'run_after', 'updated_at')
+    list_filter = ('status',)
+
+@admin.register(EmailThread)
+class EmailThreadAdmin(admin.ModelAdmin):
+    list_display = ('root_subject', 'message_count', 'reply_count', 'forward_count', 'last_received_at')
+    search_fields = ('root_subject',)
+
+@admin.register(InboxRollup)
+class InboxRollupAdmin(admin.ModelAdmin):
+    list_display = ('recipient', 'day', 'dimension', 'value', 'count')
+    list_filter = ('dimension',)
+
+@admin.register(MailboxSyncState)
+class MailboxSyncStateAdmin(admin.ModelAdmin):
+    list_display = ('account', 'mailbox', 'owner', 'uidvalidity', 'last_uid', 'last_synced_at')
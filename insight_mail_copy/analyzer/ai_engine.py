@@ -1,30 +1,32 @@
-import json
 import re
 import os
-import pickle
-import nltk
-import gensim
-from gensim import corpora
-from nltk.corpus import stopwords
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
-import google.generativeai as genai
-from django.conf import settings
 from .absa_engine import AspectEngine
 
 # --- PHASE 2 IMPORT: The SVR Engine ---
 from .engagement_engine import EngagementEngine
 
-from .keywords import DANGER_KEYWORDS, COMPLAINT_KEYWORDS, FINANCE_KEYWORDS
+# Shared, lazily-loaded models (spaCy, VADER, LDA, SVR)
+from .model_registry import registry, MODEL_PATH
 
-# ---------------------------------------------------------
-# CONFIGURATION
-# ---------------------------------------------------------
-# SECURITY NOTE: In production, use os.environ.get('GOOGLE_API_KEY')
-GOOGLE_API_KEY = "YOUR_GEMINI_API" 
-genai.configure(api_key=GOOGLE_API_KEY)
+# Precompiled matcher over DANGER / COMPLAINT / FINANCE keywords
+from .keyword_matcher import keyword_matcher
+
+# Gemini calls: pooled, rate-limited, cached (API key lives in settings.GOOGLE_API_KEY)
+from .reply_service import get_reply_service
+
+# Per-phase timing spans (exported at /metrics)
+from .metrics import span, timed
 
-# Global paths for saving ML models
-MODEL_PATH = os.path.join(settings.BASE_DIR, 'ml_models')
+# Results for content we have already analyzed (keyed on content + model versions)
+from .analysis_cache import analysis_cache
+
+# Long bodies are analyzed on their first ANALYSIS_MAX_TEXT_CHARS characters
+from .mime import analysis_text
+
+# Batch VADER (registry.get_sentiment_scorer) and the label thresholds
+from .sentiment import NEGATIVE_THRESHOLD, POSITIVE_THRESHOLD
+
+# Make sure the folder for saving ML models exists
 os.makedirs(MODEL_PATH, exist_ok=True)
 
 # ---------------------------------------------------------
@@ -37,139 +39,125 @@ def clean_text(text):
     text = text.lower()
     text = re.sub(r'<.*?>', '', text) 
     text = re.sub(r'[^a-zA-Z\s]', '', text) 
-    stop_words = set(stopwords.words('english'))
+    stop_words = registry.get_stopwords()
     tokens = [word for word in text.split() if word not in stop_words and len(word) > 2]
     return tokens
 
-def get_vader_sentiment(text):
-    """Phase 1: VADER Sentiment"""
-    sia = SentimentIntensityAnalyzer()
-    scores = sia.polarity_scores(text)
-    compound = scores['compound']
-    
-    if compound >= 0.05:
+def _sentiment_label(compound):
+    if compound >= POSITIVE_THRESHOLD:
         return "Positive", compound
-    elif compound <= -0.05:
+    elif compound <= NEGATIVE_THRESHOLD:
         return "Negative", compound
     else:
         return "Neutral", compound
 
+def get_vader_sentiment(text):
+    """Phase 1: VADER Sentiment"""
+    return get_vader_sentiment_batch([text])[0]
+
+def get_vader_sentiment_batch(texts):
+    """Batch version of get_vader_sentiment: [(label, compound), ...]"""
+    scorer = registry.get_sentiment_scorer()
+    return [_sentiment_label(compound) for compound in scorer.compound_batch(texts)]
+
+# Placeholder mapping - You update this after looking at your Topics
+TOPIC_MAP = {0: "Operations", 1: "Finance", 2: "General"}
+
 def predict_topic_lda(text_tokens):
     """Phase 1: LDA Prediction"""
     try:
-        dictionary = corpora.Dictionary.load(os.path.join(MODEL_PATH, 'lda_dict.gensim'))
-        lda_model = gensim.models.LdaModel.load(os.path.join(MODEL_PATH, 'lda_model.gensim'))
+        dictionary, lda_model = registry.get_lda()
+        if lda_model is None:
+            return None
         bow_vector = dictionary.doc2bow(text_tokens)
         topics = lda_model.get_document_topics(bow_vector)
         dominant_topic = sorted(topics, key=lambda x: x[1], reverse=True)[0]
         
-        # Placeholder mapping - You update this after looking at your Topics
-        topic_map = {0: "Operations", 1: "Finance", 2: "General"} 
-        return topic_map.get(dominant_topic[0], "General")
+        return TOPIC_MAP.get(dominant_topic[0], "General")
     except Exception:
         return None
 
-# ---------------------------------------------------------
-# MAIN ENGINE (Phase 1 + Phase 2 Merged)
-# ---------------------------------------------------------
-
-def analyze_email_content(email_obj, history=[], agent_name="Support Team"):
+def predict_topic_lda_batch(token_lists):
     """
-    Revised Engine: 
-    1. SVR Filter (Phase 2) -> Filters out 'Individual' noise.
-    2. VADER/LDA (Phase 1) -> Analyzes 'Interested' emails.
-    3. Gemini (LLM) -> Drafts replies for valid threads.
+    Batch version of predict_topic_lda.
+    Runs one variational inference over the whole corpus instead of one per email;
+    the dominant topic is the argmax of each document's topic weights.
     """
-    
-    # Extract text from the object
-    subject = email_obj.subject
-    body = email_obj.body
-    full_text = f"{subject} {body}"
-    clean_tokens = clean_text(full_text)
-
-    # ============================================================
-    # PHASE 2: ENGAGEMENT FILTER (SVR)
-    # ============================================================
-    eng_engine = EngagementEngine()
-    # This checks DB for Reply Count (Rc), Forward Count (Fc), Time (T)
-    engagement_class = eng_engine.predict_engagement(email_obj)
-    
-    # ============================================================
-# PHASE 3: ASPECT ANALYSIS (ABSA)
-# ============================================================
-    absa_engine = AspectEngine()
-    aspect_sentiments = absa_engine.get_aspect_sentiment(full_text)
+    if not token_lists:
+        return []
+    try:
+        dictionary, lda_model = registry.get_lda()
+        if lda_model is None:
+            return [None] * len(token_lists)
+        corpus = [dictionary.doc2bow(tokens) for tokens in token_lists]
+        gamma, _ = lda_model.inference(corpus)
+        return [TOPIC_MAP.get(int(topic_id), "General") for topic_id in gamma.argmax(axis=1)]
+    except Exception:
+        return [None] * len(token_lists)
 
-    # Format for display/prompt
-    # e.g., "Price: Negative, Support: Positive"
-    aspect_display = ", ".join([f"{k.capitalize()}: {v}" for k, v in aspect_sentiments.items()])
+# ---------------------------------------------------------
+# SHARED STEPS (used by the single and the batch engine)
+# ---------------------------------------------------------
 
-    if not aspect_display:
-        aspect_display = "None detected"
-    
-    # [OPTIMIZATION] If it's just "Individual" (Noise), skip the heavy AI
-    if engagement_class == "Individual":
-        # We return early to save API costs and processing time
-        return {
-            "summary": "Skipped Deep Analysis (Low Engagement / Noise).",
-            "sentiment": "Neutral",
-            "tone": "Neutral",
-            "risk_score": 0,
-            "flagged_keywords": "",
-            "suggested_category": "Individual",
-            "suggested_reply": "No reply generated for individual broadcast."
-        }
+SKIPPED_RESULT = {
+    "summary": "Skipped Deep Analysis (Low Engagement / Noise).",
+    "sentiment": "Neutral",
+    "tone": "Neutral",
+    "risk_score": 0,
+    "flagged_keywords": "",
+    "suggested_category": "Individual",
+    "suggested_reply": "No reply generated for individual broadcast."
+}
 
-    # ============================================================
-    # PHASE 1: SENTIMENT & CATEGORY (VADER + LDA)
-    # ============================================================
-    
-    # --- 1. SENTIMENT (VADER) ---
-    sentiment_label, sentiment_score = get_vader_sentiment(full_text)
+def format_aspects(aspect_sentiments):
+    """e.g., "Price: Negative, Support: Positive" """
+    aspect_display = ", ".join([f"{k.capitalize()}: {v}" for k, v in aspect_sentiments.items()])
+    return aspect_display or "None detected"
 
-    # --- 2. TONE (Heuristic) ---
+def get_tone(full_text, body, sentiment_score):
+    """Phase 1: TONE (Heuristic)"""
     if full_text.isupper() or body.count("!") > 3:
-        tone = "Aggressive / Urgent"
+        return "Aggressive / Urgent"
     elif sentiment_score < -0.4:
-        tone = "Frustrated"
+        return "Frustrated"
     elif sentiment_score > 0.6:
-        tone = "Excited"
+        return "Excited"
     else:
-        tone = "Professional"
+        return "Professional"
 
-    # --- 3. CATEGORY (LDA + Keyword Fallback) ---
-    category = predict_topic_lda(clean_tokens)
-    
+def score_keywords(full_text, lda_category, sentiment_label, sentiment_score):
+    """
+    CATEGORY (LDA + Keyword Fallback) and RISK SCORE.
+    Returns (category, risk_score, flagged_display).
+    """
+    # One pass over the text finds every keyword (whole words / phrases only)
+    keyword_hits = keyword_matcher.find_by_category(full_text)
+
+    category = lda_category
     if not category or category == "General":
         category = "Inquiry" 
-        if any(w in full_text.lower() for w in FINANCE_KEYWORDS): category = "Finance"
-        if any(w in full_text.lower() for w in COMPLAINT_KEYWORDS): category = "Complaint"
-        if any(w in full_text.lower() for w in DANGER_KEYWORDS): category = "Compliance Issue"
+        if keyword_hits.get('finance'): category = "Finance"
+        if keyword_hits.get('complaint'): category = "Complaint"
+        if keyword_hits.get('danger'): category = "Compliance Issue"
 
-    # --- 4. RISK SCORE ---
     risk_score = 10
-    flagged = []
+    flagged = keyword_hits.get('danger', [])
     
-    for word in DANGER_KEYWORDS:
-        if word in full_text.lower():
-            risk_score += 30
-            flagged.append(word)
+    # +30 for every distinct danger keyword
+    risk_score += 30 * len(flagged)
     
     if sentiment_label == "Negative":
         risk_score += int(abs(sentiment_score) * 30)
         
     if risk_score > 99: risk_score = 99
-    flagged_display = ", ".join(list(set(flagged))[:5])
+    return category, risk_score, ", ".join(flagged[:5])
 
-    # ============================================================
-    # GENERATE REPLY (Gemini Cloud) - Only for Interested/Uninterested
-    # ============================================================
+def build_reply_prompt(full_text, history, agent_name, engagement_class, aspect_display,
+                       sentiment_label, sentiment_score, category, risk_score):
     history_text = "\n".join([f"- {msg['sender']}: {msg['body']}" for msg in history]) if history else "No context."
     
-    model = genai.GenerativeModel('models/gemini-2.0-flash')
-    
     # We feed the "Engagement Class" into the prompt so Gemini knows if it's a "Hot Lead" or "Churn Risk"
-    prompt = f"""
+    return f"""
     Act as '{agent_name}'. Write a professional reply.
     
     METADATA:
@@ -190,14 +178,86 @@ def analyze_email_content(email_obj, history=[], agent_name="Support Team"):
     - If Engagement is 'Uninterested', try to re-engage them or be concise.
     - Keep it under 100 words.
     """
+
+def fallback_reply(category):
+    return f"Received. We are reviewing your email about {category}."
+
+def generate_reply(prompt, category):
+    """GENERATE REPLY (Gemini Cloud)"""
+    return get_reply_service().generate(prompt, fallback=fallback_reply(category))
+
+# ---------------------------------------------------------
+# MAIN ENGINE (Phase 1 + Phase 2 Merged)
+# ---------------------------------------------------------
+
+@timed("analysis.total")
+def analyze_email_content(email_obj, history=[], agent_name="Support Team"):
+    """
+    Revised Engine: 
+    1. SVR Filter (Phase 2) -> Filters out 'Individual' noise.
+    2. VADER/LDA (Phase 1) -> Analyzes 'Interested' emails.
+    3. Gemini (LLM) -> Drafts replies for valid threads.
+    """
     
-    try:
-        response = model.generate_content(prompt)
-        draft_reply = response.text.strip()
-    except:
-        draft_reply = f"Received. We are reviewing your email about {category}."
+    # Extract text from the object
+    subject = email_obj.subject
+    body = analysis_text(email_obj.body)
+    full_text = f"{subject} {body}"
 
-    return {
+    # ============================================================
+    # PHASE 2: ENGAGEMENT FILTER (SVR)
+    # ============================================================
+    eng_engine = EngagementEngine()
+    # This checks DB for Reply Count (Rc), Forward Count (Fc), Time (T)
+    with span("analysis.engagement"):
+        engagement_class = eng_engine.predict_engagement(email_obj)
+    
+    # [OPTIMIZATION] If it's just "Individual" (Noise), skip the heavy AI
+    if engagement_class == "Individual":
+        # We return early to save API costs and processing time
+        return dict(SKIPPED_RESULT)
+
+    # [OPTIMIZATION] Same content already analyzed (newsletters, notifications)?
+    with span("analysis.cache"):
+        cache_key = analysis_cache.make_key(subject, body, engagement_class, agent_name, history)
+        cached = analysis_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    with span("analysis.clean_text"):
+        clean_tokens = clean_text(full_text)
+
+    # ============================================================
+    # PHASE 3: ASPECT ANALYSIS (ABSA)
+    # ============================================================
+    absa_engine = AspectEngine.shared()
+    with span("analysis.absa"):
+        aspect_display = format_aspects(absa_engine.get_aspect_sentiment(full_text))
+
+    # ============================================================
+    # PHASE 1: SENTIMENT & CATEGORY (VADER + LDA)
+    # ============================================================
+    with span("analysis.vader"):
+        sentiment_label, sentiment_score = get_vader_sentiment(full_text)
+    tone = get_tone(full_text, body, sentiment_score)
+    with span("analysis.lda"):
+        lda_category = predict_topic_lda(clean_tokens)
+    with span("analysis.keywords"):
+        category, risk_score, flagged_display = score_keywords(
+            full_text, lda_category, sentiment_label, sentiment_score
+        )
+
+    # ============================================================
+    # GENERATE REPLY (Gemini Cloud) - Only for Interested/Uninterested
+    # ============================================================
+    prompt = build_reply_prompt(
+        full_text, history, agent_name, engagement_class, aspect_display,
+        sentiment_label, sentiment_score, category, risk_score
+    )
+    with span("analysis.llm"):
+        draft_reply = generate_reply(prompt, category)
+
+    result = {
         "summary": f"[{engagement_class}] Aspects: [{aspect_display}]. VADER: {sentiment_label}. Topic: {category}.",
         "sentiment": sentiment_label,
         "tone": tone,
@@ -205,5 +265,110 @@ def analyze_email_content(email_obj, history=[], agent_name="Support Team"):
         "flagged_keywords": flagged_display,
         "suggested_category": category,
         "suggested_reply": draft_reply
-
     }
+    # A fallback reply means the LLM failed: don't pin that in the cache
+    if draft_reply != fallback_reply(category):
+        analysis_cache.set(cache_key, result)
+    return result
+
+@timed("analysis_batch.total")
+def analyze_email_contents(email_objs, histories=None, agent_names=None, with_replies=True):
+    """
+    Batch Engine: same steps and same output as analyze_email_content, but each
+    model runs once over the whole list (SVR on one feature matrix, spaCy via
+    nlp.pipe, VADER over a list, LDA inference over the whole corpus).
+    Returns one result dict per email, in the same order.
+    """
+    email_objs = list(email_objs)
+    if not email_objs:
+        return []
+    histories = histories or [[] for _ in email_objs]
+    agent_names = agent_names or ["Support Team"] * len(email_objs)
+
+    # Same truncation as the single-email path, so both give the same tones and cache keys
+    bodies = [analysis_text(e.body) for e in email_objs]
+    full_texts = [f"{e.subject} {body}" for e, body in zip(email_objs, bodies)]
+
+    # PHASE 2: ENGAGEMENT FILTER (SVR) - one predict() call
+    with span("analysis_batch.engagement"):
+        engagement_classes = EngagementEngine().predict_engagement_batch(email_objs)
+
+    results = [None] * len(email_objs)
+    keys = [None] * len(email_objs)
+    deep = [] # indexes of emails that get the full treatment
+    for i, engagement_class in enumerate(engagement_classes):
+        if engagement_class == "Individual":
+            results[i] = dict(SKIPPED_RESULT)
+        else:
+            deep.append(i)
+
+    # Content we have already analyzed: one cache lookup for the whole batch
+    with span("analysis_batch.cache"):
+        for i in deep:
+            keys[i] = analysis_cache.make_key(
+                email_objs[i].subject, bodies[i], engagement_classes[i], agent_names[i], histories[i]
+            )
+        cached = analysis_cache.get_many([keys[i] for i in deep])
+    for i in deep:
+        if keys[i] in cached:
+            results[i] = dict(cached[keys[i]]) # duplicates in one batch need their own dicts
+    deep = [i for i in deep if results[i] is None]
+
+    if not deep:
+        return results
+
+    # PHASE 3: ASPECT ANALYSIS (ABSA) - nlp.pipe
+    deep_texts = [full_texts[i] for i in deep]
+    with span("analysis_batch.absa"):
+        aspects = dict(zip(deep, AspectEngine.shared().get_aspect_sentiment_batch(deep_texts)))
+
+    # PHASE 1: SENTIMENT & CATEGORY (VADER + LDA) over the remaining emails
+    with span("analysis_batch.vader"):
+        sentiments = get_vader_sentiment_batch(deep_texts)
+    with span("analysis_batch.clean_text"):
+        deep_tokens = [clean_text(t) for t in deep_texts]
+    with span("analysis_batch.lda"):
+        lda_categories = predict_topic_lda_batch(deep_tokens)
+
+    prompts, fallbacks = [], []
+    for i, (sentiment_label, sentiment_score), lda_category in zip(deep, sentiments, lda_categories):
+        full_text = full_texts[i]
+        engagement_class = engagement_classes[i]
+        aspect_display = format_aspects(aspects[i])
+
+        tone = get_tone(full_text, bodies[i], sentiment_score)
+        category, risk_score, flagged_display = score_keywords(
+            full_text, lda_category, sentiment_label, sentiment_score
+        )
+
+        if with_replies:
+            prompts.append(build_reply_prompt(
+                full_text, histories[i], agent_names[i], engagement_class, aspect_display,
+                sentiment_label, sentiment_score, category, risk_score
+            ))
+        fallbacks.append(fallback_reply(category))
+
+        results[i] = {
+            "summary": f"[{engagement_class}] Aspects: [{aspect_display}]. VADER: {sentiment_label}. Topic: {category}.",
+            "sentiment": sentiment_label,
+            "tone": tone,
+            "risk_score": risk_score,
+            "flagged_keywords": flagged_display,
+            "suggested_category": category,
+            "suggested_reply": fallbacks[-1]
+        }
+
+    # GENERATE REPLIES: all prompts of the batch go out concurrently
+    if with_replies:
+        with span("analysis_batch.llm"):
+            replies = get_reply_service().generate_many(prompts, fallbacks)
+        for i, draft_reply in zip(deep, replies):
+            results[i]["suggested_reply"] = draft_reply
+
+        # Only real LLM replies are worth keeping (fallbacks mean the call failed)
+        analysis_cache.set_many({
+            keys[i]: results[i] for i, fallback in zip(deep, fallbacks)
+            if results[i]["suggested_reply"] != fallback
+        })
+
+    return results
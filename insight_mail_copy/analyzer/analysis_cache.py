@@ -0,0 +1,188 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import AnalysisCacheEntry
+from .model_registry import registry
+
+# ---------------------------------------------------------
+# CONFIGURATION (override in settings.py)
+# ---------------------------------------------------------
+ANALYSIS_CACHE_ENABLED = getattr(settings, 'ANALYSIS_CACHE_ENABLED', True)
+ANALYSIS_CACHE_SIZE = getattr(settings, 'ANALYSIS_CACHE_SIZE', 2048) # in-process LRU entries
+ANALYSIS_CACHE_TTL_DAYS = getattr(settings, 'ANALYSIS_CACHE_TTL_DAYS', 30) # prune() deletes rows unused this long
+
+PREFIX = "insightmail_analysis_cache"
+
+SPACES_RE = re.compile(r'\s+')
+
+def prune(ttl_days=ANALYSIS_CACHE_TTL_DAYS, keep_version=None):
+    """
+    Deletes rows nobody has used for ttl_days, and with keep_version every
+    row written by other models. Returns the number of rows deleted.
+    """
+    cutoff = timezone.now() - timedelta(days=ttl_days)
+    stale = Q(last_hit_at__lt=cutoff) | Q(last_hit_at__isnull=True, created_at__lt=cutoff)
+    if keep_version:
+        stale |= ~Q(model_version=keep_version)
+    deleted, _ = AnalysisCacheEntry.objects.filter(stale).delete()
+    return deleted
+
+def normalize(text):
+    """Collapses whitespace only. Case is kept: VADER and the tone heuristic read it."""
+    return SPACES_RE.sub(' ', text or '').strip()
+
+
+class AnalysisCache:
+    """
+    Content-addressed memo of engine results.
+
+    key = sha256(subject, body, engagement class, agent name, history, model fingerprint)
+
+    Lookups go to an in-process LRU first, then to the AnalysisCacheEntry
+    table (shared by every worker and host). The fingerprint hashes the
+    model files' contents, so hosts running the same models share keys.
+    When a retrain changes it, the LRU is dropped; new keys include the new
+    fingerprint, so stale results can never hit. Rows are not deleted here
+    (another host may still run the older models): prune() expires them.
+    """
+
+    def __init__(self, max_size=ANALYSIS_CACHE_SIZE, enabled=ANALYSIS_CACHE_ENABLED):
+        self.max_size = max_size
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.lru = OrderedDict()
+        self.version = None
+        self.counters = dict.fromkeys(
+            ('memory_hits', 'db_hits', 'misses', 'stores', 'evictions', 'invalidations'), 0
+        )
+
+    def make_key(self, subject, body, engagement_class, agent_name, history=()):
+        """None when the cache is disabled (get/set then do nothing)."""
+        if not self.enabled:
+            return None
+        self._check_version()
+        # The reply draft is signed with agent_name and written from the
+        # conversation history, so both are part of the content: the same
+        # email in another conversation must never get this one's reply
+        context = "\x1e".join(f"{msg['sender']}\x1d{normalize(msg['body'])}" for msg in history or ())
+        parts = (normalize(subject), normalize(body), engagement_class, agent_name, context, self.version)
+        return hashlib.sha256("\x1f".join(parts).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        """{key: result dict} for every key we have (one DB query for LRU misses)."""
+        keys = [k for k in keys if k]
+        if not keys:
+            return {}
+
+        found, missing = {}, []
+        with self.lock:
+            for key in keys:
+                if key in self.lru:
+                    self.lru.move_to_end(key)
+                    found[key] = self.lru[key]
+                    self.counters['memory_hits'] += 1
+                else:
+                    missing.append(key)
+
+        if missing:
+            rows = dict(AnalysisCacheEntry.objects.filter(key__in=missing).values_list('key', 'result'))
+            if rows:
+                AnalysisCacheEntry.objects.filter(key__in=list(rows)).update(
+                    hits=F('hits') + 1, last_hit_at=timezone.now()
+                )
+            with self.lock:
+                self.counters['db_hits'] += len(rows)
+                self.counters['misses'] += len(missing) - len(rows)
+                for key, result in rows.items():
+                    self._remember(key, result)
+            found.update(rows)
+
+        # Callers get their own copies to modify
+        return {key: dict(result) for key, result in found.items()}
+
+    def set_many(self, results):
+        """Stores {key: result dict}."""
+        results = {k: v for k, v in results.items() if k}
+        if not results:
+            return
+        AnalysisCacheEntry.objects.bulk_create(
+            [AnalysisCacheEntry(key=k, model_version=self.version, result=v) for k, v in results.items()],
+            ignore_conflicts=True, # another worker stored the same content first
+        )
+        with self.lock:
+            self.counters['stores'] += len(results)
+            for key, result in results.items():
+                self._remember(key, dict(result))
+
+    def set(self, key, result):
+        self.set_many({key: result})
+
+    def stats(self):
+        with self.lock:
+            snapshot = dict(self.counters, size=len(self.lru), max_size=self.max_size, model_version=self.version)
+        hits = snapshot['memory_hits'] + snapshot['db_hits']
+        lookups = hits + snapshot['misses']
+        snapshot['hit_rate'] = hits / lookups if lookups else 0.0
+        return snapshot
+
+    def render_prometheus(self):
+        s = self.stats()
+        lines = [
+            f"# HELP {PREFIX}_lookups_total Analysis cache lookups by outcome.",
+            f"# TYPE {PREFIX}_lookups_total counter",
+            f'{PREFIX}_lookups_total{{result="memory_hit"}} {s["memory_hits"]}',
+            f'{PREFIX}_lookups_total{{result="db_hit"}} {s["db_hits"]}',
+            f'{PREFIX}_lookups_total{{result="miss"}} {s["misses"]}',
+        ]
+        for metric, key, kind, help_text in (
+            ('stores_total', 'stores', 'counter', "Results written to the cache."),
+            ('evictions_total', 'evictions', 'counter', "Entries pushed out of the in-process LRU."),
+            ('invalidations_total', 'invalidations', 'counter', "Model changes that invalidated the cache."),
+            ('entries', 'size', 'gauge', "Entries in the in-process LRU."),
+            ('hit_ratio', 'hit_rate', 'gauge', "Hits / lookups since the process started."),
+        ):
+            lines.append(f"# HELP {PREFIX}_{metric} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{metric} {kind}")
+            lines.append(f"{PREFIX}_{metric} {s[key]}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        """Drops the in-process LRU (the table is left alone)."""
+        with self.lock:
+            self.lru.clear()
+
+    # ---------------------------------------------------------
+    # INTERNALS
+    # ---------------------------------------------------------
+
+    def _remember(self, key, result):
+        # Caller holds self.lock
+        self.lru[key] = result
+        self.lru.move_to_end(key)
+        while len(self.lru) > self.max_size:
+            self.lru.popitem(last=False)
+            self.counters['evictions'] += 1
+
+    def _check_version(self):
+        version = registry.fingerprint()
+        if version == self.version:
+            return
+        with self.lock:
+            if version == self.version:
+                return
+            if self.version is not None:
+                self.counters['invalidations'] += 1
+            self.lru.clear()
+            self.version = version
+
+
+# The one cache every module in this process shares
+analysis_cache = AnalysisCache()
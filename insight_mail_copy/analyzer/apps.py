@@ -6,4 +6,10 @@ class AnalyzerConfig(AppConfig):
 
     def ready(self):
         # Import signals when the app is ready
-        import analyzer.signals
\ No newline at end of file
+        import analyzer.signals
+
+        # Created after every migrate: the full-text search table + sync
+        # triggers (SQLite FTS5)
+        from django.db.models.signals import post_migrate
+        from .search import install_search_index
+        post_migrate.connect(install_search_index, sender=self)
\ No newline at end of file
@@ -0,0 +1,40 @@
+import numpy as np
+from .models import Email
+from .engagement_engine import EngagementEngine
+from .model_registry import registry
+
+# Research Phase 3: SVR score -> inbox label (same thresholds as training)
+IMPORTANT_THRESHOLD = 0.7
+CASUAL_THRESHOLD = 0.3
+
+def score_to_label(scores):
+    """Vectorized: array of SVR scores -> array of classification labels."""
+    scores = np.asarray(scores, dtype=float)
+    return np.where(
+        scores > IMPORTANT_THRESHOLD, "Important",
+        np.where(scores > CASUAL_THRESHOLD, "Casual", "Low Priority")
+    )
+
+def classify_ids(email_ids, model=None):
+    """
+    Classifies one chunk of emails:
+    one query for the emails, one for their thread features, ONE predict()
+    on the whole feature matrix, one bulk_update. Returns the number written.
+    """
+    model = model or registry.get_svr()
+    if model is None:
+        raise RuntimeError("Model not found! Run train_svr.py first.")
+
+    emails = list(Email.objects.filter(id__in=email_ids).only('id', 'subject').order_by('id'))
+    if not emails:
+        return 0
+
+    features = np.asarray(EngagementEngine().get_thread_features_batch(emails), dtype=float) # [[Rc, Fc, T], ...]
+    scores = model.predict(features)
+    labels = score_to_label(scores)
+
+    for email, score, label in zip(emails, scores, labels):
+        email.priority_score = float(score)
+        email.classification = str(label)
+    Email.objects.bulk_update(emails, ['priority_score', 'classification'], batch_size=500)
+    return len(emails)
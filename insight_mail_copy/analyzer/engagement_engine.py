@@ -1,27 +1,17 @@
 import os
-import pickle
-import numpy as np
-import pandas as pd
-from datetime import timedelta
-from sklearn.svm import SVR
-from django.db.models import Q
-from django.conf import settings
-from .models import Email
+from .models import EmailThread
+from .threads import normalize_subject
+from .model_registry import registry, MODEL_PATH, SVR_MODEL_FILE
 
 # Path to save/load the trained SVR model
-SVR_MODEL_PATH = os.path.join(settings.BASE_DIR, 'ml_models', 'svr_model.pkl')
+SVR_MODEL_PATH = os.path.join(MODEL_PATH, SVR_MODEL_FILE)
 
 class EngagementEngine:
-    def __init__(self):
-        self.model = self._load_model()
-
-    def _load_model(self):
-        """Loads the trained SVR model if it exists."""
-        try:
-            with open(SVR_MODEL_PATH, 'rb') as f:
-                return pickle.load(f)
-        except (FileNotFoundError, EOFError):
-            return None
+    @property
+    def model(self):
+        """The trained SVR (or None). Comes from the shared registry, so it is
+        loaded once per process and picks up retrains automatically."""
+        return registry.get_svr()
 
     def get_thread_features(self, email_obj):
         """
@@ -29,53 +19,79 @@ class EngagementEngine:
         Calculates Rc (Reply Count), Fc (Forward Count), and T (Time Span).
         """
         # 1. Group by Subject (Simple Threading)
-        # Normalize subject: Remove 'Re:', 'Fwd:' to find the root conversation
-        root_subject = email_obj.subject.replace("Re:", "").replace("Fwd:", "").strip()
-        
-        # Fetch all emails in this thread (sent or received by these users)
-        thread_emails = Email.objects.filter(
-            subject__icontains=root_subject
-        ).order_by('received_at')
+        # Normalize subject: Remove 'Re:', 'Fwd:' to find the root conversation.
+        # The counters are kept up to date on insert (see threads.py),
+        # so this is one indexed lookup instead of a scan of the Email table.
+        thread = EmailThread.objects.filter(
+            root_subject=normalize_subject(email_obj.subject)
+        ).values_list('reply_count', 'forward_count', 'first_received_at', 'last_received_at').first()
 
-        if not thread_emails.exists():
+        if thread is None:
             return [0, 0, 0]
 
-        # 2. Calculate Features
-        # Rc: Count emails starting with "Re:" (Replies)
-        reply_count = thread_emails.filter(subject__istartswith="Re:").count()
-        
-        # Fc: Count emails starting with "Fwd:" (Forwards)
-        forward_count = thread_emails.filter(subject__istartswith="Fwd:").count()
+        # 2. Features
+        reply_count, forward_count, start_time, end_time = thread
         
         # T: Time Span (Hours)
-        start_time = thread_emails.first().received_at
-        end_time = thread_emails.last().received_at
         duration = (end_time - start_time).total_seconds() / 3600 # Convert to hours
 
         return [reply_count, forward_count, duration]
 
+    def get_thread_features_batch(self, email_objs):
+        """get_thread_features for many emails with a single query."""
+        roots = [normalize_subject(e.subject) for e in email_objs]
+        threads = {
+            row[0]: row[1:] for row in EmailThread.objects.filter(root_subject__in=set(roots)).values_list(
+                'root_subject', 'reply_count', 'forward_count', 'first_received_at', 'last_received_at'
+            )
+        }
+
+        features = []
+        for root in roots:
+            if root not in threads:
+                features.append([0, 0, 0])
+                continue
+            reply_count, forward_count, start_time, end_time = threads[root]
+            features.append([reply_count, forward_count, (end_time - start_time).total_seconds() / 3600])
+        return features
+
     def predict_engagement(self, email_obj):
         """
         Predicts if the email is 'Interested', 'Uninterested', or 'Individual'.
         Returns: Class Label (str)
         """
-        features = self.get_thread_features(email_obj) # [Rc, Fc, T]
+        return self.predict_engagement_batch([email_obj])[0]
+
+    def predict_engagement_batch(self, email_objs):
+        """
+        Same as predict_engagement for a list of emails.
+        The SVR is called once on the whole feature matrix.
+        """
+        features = self.get_thread_features_batch(email_objs) # [[Rc, Fc, T], ...]
+        if not features:
+            return []
         
         # IF MODEL IS TRAINED: Use SVR
-        if self.model:
-            # SVR requires 2D array: [[Rc, Fc, T]]
-            prediction_score = self.model.predict([features])[0]
-            
-            # Map Score to Class (Thresholds from Research)
-            # Assuming we trained 1=Interested, 0.5=Uninterested, 0=Individual
-            if prediction_score > 0.7:
-                return "Interested"
-            elif prediction_score > 0.3:
-                return "Uninterested"
-            else:
-                return "Individual"
+        model = self.model
+        if model:
+            # SVR requires 2D array: [[Rc, Fc, T], ...]
+            prediction_scores = model.predict(features)
+            return [self._score_to_class(score) for score in prediction_scores]
 
         # FALLBACK (Rule-Based) if model not trained yet
+        return [self._rule_based_class(f) for f in features]
+
+    def _score_to_class(self, prediction_score):
+        # Map Score to Class (Thresholds from Research)
+        # Assuming we trained 1=Interested, 0.5=Uninterested, 0=Individual
+        if prediction_score > 0.7:
+            return "Interested"
+        elif prediction_score > 0.3:
+            return "Uninterested"
+        else:
+            return "Individual"
+
+    def _rule_based_class(self, features):
         # Research Logic: "Interested" if Replies > 2 and Forwards > 0
         rc, fc, t = features
         if rc > 2 and fc > 0:
@@ -83,4 +99,4 @@ class EngagementEngine:
         elif rc >= 1 or t < 24:
             return "Uninterested"
         else:
-            return "Individual"
\ No newline at end of file
+            return "Individual"
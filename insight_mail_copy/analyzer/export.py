@@ -0,0 +1,221 @@
+import csv
+import io
+import json
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import Email
+
+# ---------------------------------------------------------
+# CONFIGURATION (override in settings.py)
+# ---------------------------------------------------------
+# Rows fetched per round trip (PostgreSQL: per FETCH of the server-side
+# cursor) and written per CSV/NDJSON chunk or Parquet row group.
+EXPORT_CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+class ExportError(ValueError):
+    """Bad filter value, unknown format, or a format whose library is not installed."""
+
+
+# (output column, Email lookup) - one row per Email, analysis columns are
+# empty while the email has not been analyzed yet
+COLUMNS = [
+    ('id', 'id'),
+    ('received_at', 'received_at'),
+    ('sender', 'sender__username'),
+    ('recipient', 'recipient__username'),
+    ('subject', 'subject'),
+    ('body', 'body'),
+    ('is_read', 'is_read'),
+    ('analysis_status', 'analysis_status'),
+    ('priority_score', 'priority_score'),
+    ('classification', 'classification'),
+    ('summary', 'analysis__summary'),
+    ('sentiment', 'analysis__sentiment'),
+    ('tone', 'analysis__tone'),
+    ('risk_score', 'analysis__risk_score'),
+    ('flagged_keywords', 'analysis__flagged_keywords'),
+    ('category', 'analysis__suggested_category'),
+    ('suggested_reply', 'analysis__suggested_reply'),
+    ('analyzed_at', 'analysis__created_at'),
+]
+HEADER = [name for name, _ in COLUMNS]
+DATETIME_COLUMNS = {HEADER.index('received_at'), HEADER.index('analyzed_at')}
+
+# ---------------------------------------------------------
+# QUERY
+# ---------------------------------------------------------
+
+def _parse_moment(value, end_of_day=False):
+    """'2024-05-01' or an ISO datetime -> aware datetime. A bare date as an upper bound covers the whole day."""
+    if value in (None, ''):
+        return None
+    if isinstance(value, datetime):
+        moment = value
+    else:
+        # Bare date first: parse_datetime also accepts '2024-05-01' (as midnight)
+        day = parse_date(value)
+        if day is not None:
+            moment = datetime.combine(day + timedelta(days=1) if end_of_day else day, time.min)
+        else:
+            moment = parse_datetime(value)
+            if moment is None:
+                raise ExportError(f"Not a date: {value!r}")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+def export_queryset(user=None, since=None, until=None, recipient=None, risk_min=None, risk_max=None):
+    """
+    Rows to export, as a values_list (no model instances) ordered by id.
+    user: limit to that user's mailbox (sent or received); None = every email.
+    recipient: username. until: a bare date is inclusive, a datetime exclusive.
+    """
+    emails = Email.objects.all()
+    if user is not None:
+        emails = emails.filter(Q(recipient=user) | Q(sender=user))
+
+    start, end = _parse_moment(since), _parse_moment(until, end_of_day=True)
+    if start:
+        emails = emails.filter(received_at__gte=start)
+    if end:
+        emails = emails.filter(received_at__lt=end)
+    if recipient:
+        recipient_id = User.objects.filter(username=recipient).values_list('id', flat=True).first()
+        if recipient_id is None:
+            raise ExportError(f"User '{recipient}' not found.")
+        emails = emails.filter(recipient_id=recipient_id)
+    if risk_min is not None:
+        emails = emails.filter(analysis__risk_score__gte=risk_min)
+    if risk_max is not None:
+        emails = emails.filter(analysis__risk_score__lte=risk_max)
+
+    return emails.order_by('id').values_list(*(lookup for _, lookup in COLUMNS))
+
+def iter_chunks(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Lists of at most chunk_size row tuples.
+    .iterator() streams from the database instead of caching the whole
+    result (a server-side cursor on PostgreSQL, fetchmany() on SQLite),
+    so memory depends on chunk_size, not on the number of rows.
+    """
+    chunk = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# ---------------------------------------------------------
+# FORMATS (each turns chunks of rows into chunks of bytes)
+# ---------------------------------------------------------
+
+def _isoformat(row):
+    row = list(row)
+    for i in DATETIME_COLUMNS:
+        if row[i] is not None:
+            row[i] = row[i].isoformat()
+    return row
+
+def render_csv(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(HEADER)
+    for chunk in chunks:
+        writer.writerows(_isoformat(row) for row in chunk)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8') # header only: nothing matched
+
+def render_ndjson(chunks):
+    for chunk in chunks:
+        lines = (json.dumps(dict(zip(HEADER, _isoformat(row))), ensure_ascii=False) for row in chunk)
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+def _parquet_schema(pa):
+    tz = 'UTC' if settings.USE_TZ else None
+    types = {
+        'id': pa.int64(), 'is_read': pa.bool_(), 'priority_score': pa.float64(), 'risk_score': pa.int32(),
+        'received_at': pa.timestamp('us', tz=tz), 'analyzed_at': pa.timestamp('us', tz=tz),
+    }
+    return pa.schema([(name, types.get(name, pa.string())) for name in HEADER])
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ExportError("Parquet export needs pyarrow (pip install pyarrow).")
+    return pyarrow, pyarrow.parquet
+
+class _ParquetSink:
+    """
+    Write-only file for ParquetWriter that hands its bytes back on drain().
+    tell() keeps counting across drains: the footer stores column chunk
+    offsets from it. close() is a no-op so the footer can be drained too.
+    """
+    mode = 'wb'
+    closed = False
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self.parts.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def drain(self):
+        data, self.parts = b''.join(self.parts), []
+        return data
+
+def render_parquet(chunks):
+    """One row group per chunk; each is sent as soon as it is written (the footer comes last)."""
+    pa, pq = _import_pyarrow()
+    schema = _parquet_schema(pa)
+    sink = _ParquetSink()
+    with pq.ParquetWriter(sink, schema, compression='snappy') as writer:
+        for chunk in chunks:
+            columns = list(zip(*chunk))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema
+            ))
+            yield sink.drain()
+    yield sink.drain()
+
+# format -> (renderer, content type, file extension)
+FORMATS = {
+    'csv': (render_csv, 'text/csv; charset=utf-8', 'csv'),
+    'ndjson': (render_ndjson, 'application/x-ndjson; charset=utf-8', 'ndjson'),
+    'parquet': (render_parquet, 'application/vnd.apache.parquet', 'parquet'),
+}
+
+def stream_export(rows, fmt, chunk_size=EXPORT_CHUNK_SIZE):
+    """Bytes of the whole export, produced chunk by chunk (rows: from export_queryset)."""
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown format '{fmt}' (choose from {', '.join(FORMATS)}).")
+    if fmt == 'parquet':
+        _import_pyarrow() # fail before the response starts, not halfway through it
+    return FORMATS[fmt][0](iter_chunks(rows, chunk_size))
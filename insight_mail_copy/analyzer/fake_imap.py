@@ -0,0 +1,210 @@
+import asyncio
+import random
+import re
+
+# ---------------------------------------------------------
+# Local IMAP stand-in for testing the sync daemon (see run_fake_imap).
+# Speaks the subset of IMAP4rev1 our clients use: LOGIN, CAPABILITY,
+# SELECT/EXAMINE, UID SEARCH, UID FETCH (BODYSTRUCTURE, header fields,
+# one body part, partial <0.N> too), IDLE, NOOP, CLOSE, LOGOUT. Every username is its own
+# mailbox, created on first login, so one server can play hundreds of
+# accounts.
+# ---------------------------------------------------------
+
+TOKEN_RE = re.compile(r'"((?:[^"\\]|\\.)*)"|(\S+)')
+PARTIAL_RE = re.compile(r'\]<(\d+)\.(\d+)>')
+EXISTS_NOTICE = "* {} EXISTS"
+
+
+class FakeMailbox:
+    def __init__(self, uidvalidity):
+        self.uidvalidity = uidvalidity
+        self.messages = [] # (uid, raw header bytes, body bytes), oldest first
+        self.next_uid = 1
+        self.watchers = set() # asyncio.Queue of each IDLE session on this mailbox
+
+    def add(self, subject, sender, body):
+        header = f"From: {sender}\r\nSubject: {subject}\r\n\r\n".encode('utf-8')
+        self.messages.append((self.next_uid, header, body.encode('utf-8')))
+        self.next_uid += 1
+        for queue in self.watchers:
+            queue.put_nowait(len(self.messages))
+
+    def uids_in(self, uid_set):
+        """'1,4:6,9:*' -> matching (seq, message) pairs."""
+        highest = self.next_uid - 1
+        wanted = []
+        for part in uid_set.split(','):
+            low, _, high = part.partition(':')
+            low = highest if low == '*' else int(low)
+            high = low if not high else (highest if high == '*' else int(high))
+            wanted.append((min(low, high), max(low, high)))
+        return [
+            (seq, message) for seq, message in enumerate(self.messages, 1)
+            if any(low <= message[0] <= high for low, high in wanted)
+        ]
+
+
+class FakeImapServer:
+    """
+    mailboxes are filled by deliver() (or by the generator started with
+    run(rate=...)); IDLE sessions are told about new mail immediately.
+    login_failure_rate makes a fraction of logins fail, to exercise backoff.
+    """
+
+    def __init__(self, message_factory, initial_messages=0, login_failure_rate=0.0, seed=42):
+        self.message_factory = message_factory # () -> (subject, sender, body)
+        self.initial_messages = initial_messages
+        self.login_failure_rate = login_failure_rate
+        self.rng = random.Random(seed)
+        self.mailboxes = {}
+        self.stats = {'connections': 0, 'logins': 0, 'failed_logins': 0, 'delivered': 0, 'idle_sessions': 0}
+        self.server = None
+
+    def mailbox(self, username):
+        box = self.mailboxes.get(username)
+        if box is None:
+            box = self.mailboxes[username] = FakeMailbox(uidvalidity=self.rng.randint(1, 2 ** 31))
+            for _ in range(self.initial_messages):
+                box.add(*self.message_factory())
+        return box
+
+    def deliver(self, username, subject=None, sender=None, body=None):
+        if subject is None:
+            subject, sender, body = self.message_factory()
+        self.mailbox(username).add(subject, sender, body)
+        self.stats['delivered'] += 1
+
+    async def start(self, host='127.0.0.1', port=1143):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def generate(self, rate):
+        """Delivers `rate` messages per second to random existing mailboxes."""
+        while True:
+            await asyncio.sleep(1 / rate)
+            if self.mailboxes:
+                self.deliver(self.rng.choice(list(self.mailboxes)))
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    # ---------------------------------------------------------
+    # CONNECTION
+    # ---------------------------------------------------------
+
+    async def handle(self, reader, writer):
+        self.stats['connections'] += 1
+        session = {'user': None, 'box': None}
+
+        async def send(line):
+            writer.write(line.encode('utf-8') + b'\r\n' if isinstance(line, str) else line)
+            await writer.drain()
+
+        try:
+            await send("* OK [CAPABILITY IMAP4rev1 IDLE] Fake IMAP ready")
+            while True:
+                raw = await reader.readline()
+                if not raw:
+                    return
+                parts = raw.decode('utf-8', errors='replace').rstrip('\r\n').split(' ', 2)
+                if len(parts) < 2:
+                    await send("* BAD Missing command")
+                    continue
+                tag, command = parts[0], parts[1].upper()
+                args = parts[2] if len(parts) > 2 else ''
+                if command == 'LOGOUT':
+                    await send("* BYE Logging out")
+                    await send(f"{tag} OK LOGOUT completed")
+                    return
+                await self.dispatch(tag, command, args, session, send, reader)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, tag, command, args, session, send, reader):
+        if command == 'CAPABILITY':
+            await send("* CAPABILITY IMAP4rev1 IDLE")
+        elif command == 'NOOP' or command == 'CLOSE':
+            pass
+        elif command == 'LOGIN':
+            tokens = [quoted if quoted else atom for quoted, atom in TOKEN_RE.findall(args)]
+            self.stats['logins'] += 1
+            if len(tokens) != 2 or self.rng.random() < self.login_failure_rate:
+                self.stats['failed_logins'] += 1
+                await send(f"{tag} NO [AUTHENTICATIONFAILED] Invalid credentials")
+                return
+            session['user'] = tokens[0]
+        elif session['user'] is None:
+            await send(f"{tag} NO Not logged in")
+            return
+        elif command in ('SELECT', 'EXAMINE'):
+            box = session['box'] = self.mailbox(session['user'])
+            await send("* FLAGS (\\Seen)")
+            await send(f"* {len(box.messages)} EXISTS")
+            await send("* 0 RECENT")
+            await send(f"* OK [UIDVALIDITY {box.uidvalidity}] UIDs valid")
+            await send(f"* OK [UIDNEXT {box.next_uid}] Predicted next UID")
+            mode = 'READ-ONLY' if command == 'EXAMINE' else 'READ-WRITE'
+            await send(f"{tag} OK [{mode}] {command} completed")
+            return
+        elif session['box'] is None:
+            await send(f"{tag} NO No mailbox selected")
+            return
+        elif command == 'UID':
+            await self.uid_command(args, session['box'], send)
+        elif command == 'IDLE':
+            await self.idle(session['box'], send, reader)
+        else:
+            await send(f"{tag} BAD Unknown command {command}")
+            return
+        await send(f"{tag} OK {command} completed")
+
+    async def uid_command(self, args, box, send):
+        sub, _, rest = args.partition(' ')
+        if sub.upper() == 'SEARCH':
+            # "UNSEEN" (everything is unseen here) or "UID 5:*"
+            criteria = rest.split()
+            matches = box.uids_in(criteria[1]) if criteria and criteria[0].upper() == 'UID' else list(enumerate(box.messages, 1))
+            await send("* SEARCH" + "".join(f" {message[0]}" for _, message in matches))
+            return
+
+        uid_set, _, items = rest.partition(' ')
+        items = items.upper()
+        for seq, (uid, header, body) in box.uids_in(uid_set):
+            if 'BODYSTRUCTURE' in items:
+                lines = body.count(b'\n') + 1
+                await send(f'* {seq} FETCH (UID {uid} BODYSTRUCTURE ("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "8BIT" {len(body)} {lines}))')
+            elif 'HEADER.FIELDS' in items:
+                await send(f"* {seq} FETCH (UID {uid} BODY[HEADER.FIELDS (FROM SUBJECT)] {{{len(header)}}}".encode() + b'\r\n' + header + b')\r\n')
+            elif 'BODY.PEEK[1]' in items or 'BODY[1]' in items:
+                partial = PARTIAL_RE.search(items) # BODY.PEEK[1]<0.N>: the first N bytes only
+                name = 'BODY[1]'
+                if partial:
+                    offset, length = int(partial.group(1)), int(partial.group(2))
+                    body, name = body[offset:offset + length], f'BODY[1]<{offset}>'
+                await send(f"* {seq} FETCH (UID {uid} {name} {{{len(body)}}}".encode() + b'\r\n' + body + b')\r\n')
+
+    async def idle(self, box, send, reader):
+        """Pushes '* N EXISTS' for new mail until the client sends DONE."""
+        queue = asyncio.Queue()
+        box.watchers.add(queue)
+        self.stats['idle_sessions'] += 1
+        try:
+            await send("+ idling")
+            done = asyncio.ensure_future(reader.readline())
+            while True:
+                notice = asyncio.ensure_future(queue.get())
+                finished, _ = await asyncio.wait({done, notice}, return_when=asyncio.FIRST_COMPLETED)
+                if notice in finished:
+                    await send(EXISTS_NOTICE.format(notice.result()))
+                else:
+                    notice.cancel()
+                if done in finished:
+                    return # "DONE" (or the client went away)
+        finally:
+            box.watchers.discard(queue)
+            self.stats['idle_sessions'] -= 1
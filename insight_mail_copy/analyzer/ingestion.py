@@ -1,21 +1,38 @@
-import pandas as pd
 import re
-import nltk
-from nltk.corpus import stopwords
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
-import gensim
-from gensim import corpora
 
-# --- 1. Setup NLTK Resources ---
+# NLTK, gensim and pandas are imported where they are used: importing this
+# module must stay cheap, and must never hit the network.
+
+# --- 1. NLTK Resources ---
 # We need these for cleaning and VADER as per the methodology [cite: 901, 937]
-nltk.download('stopwords')
-nltk.download('vader_lexicon')
-nltk.download('punkt')
+NLTK_RESOURCES = (
+    ('corpora/stopwords', 'stopwords'),
+    ('sentiment/vader_lexicon.zip', 'vader_lexicon'),
+    ('tokenizers/punkt', 'punkt'),
+)
+
+def ensure_nltk_data():
+    """Downloads the resources above only if they are not installed yet."""
+    import nltk
+    for path, package in NLTK_RESOURCES:
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            nltk.download(package)
 
 class Phase1Ingestion:
     def __init__(self):
+        from nltk.corpus import stopwords
+        from nltk.sentiment.vader import SentimentIntensityAnalyzer
+        try:
+            from .sentiment import VaderScorer
+        except ImportError: # run as a script: python analyzer/ingestion.py
+            from sentiment import VaderScorer
+
+        ensure_nltk_data()
         self.stop_words = set(stopwords.words('english'))
         self.vader = SentimentIntensityAnalyzer()
+        self.scorer = VaderScorer(self.vader.lexicon) # scores whole batches
         self.lda_model = None
         self.dictionary = None
 
@@ -43,18 +60,26 @@ class Phase1Ingestion:
         """
         Assigns a baseline sentiment score (-1 to 1).
         """
-        if not isinstance(text, str):
-            return 0.0
-        
+        return self.get_vader_labels([text])[0]
+
+    def get_vader_labels(self, texts):
+        """
+        get_vader_label for a whole column at once (one NumPy pass instead of one call per email).
+        """
+        texts = list(texts)
+        strings = [text for text in texts if isinstance(text, str)]
         # VADER gives a 'compound' score
-        score = self.vader.polarity_scores(text)['compound']
-        return score
+        scores = iter(self.scorer.compound_batch(strings))
+        return [next(scores) if isinstance(text, str) else 0.0 for text in texts]
 
     # --- Topic Labeling (LDA) [cite: 916, 920, 935] ---
     def train_lda_and_label(self, df, num_topics=3):
         """
         Trains LDA on the current batch of emails to discover topics.
         """
+        import gensim
+        from gensim import corpora
+
         # Prepare data for Gensim
         # The 'clean_tokens' column is needed for LDA
         processed_docs = df['clean_tokens'].tolist()
@@ -88,6 +113,8 @@ class Phase1Ingestion:
 
 # --- Execution Simulation ---
 if __name__ == "__main__":
+    import pandas as pd
+
     # 1. Load Dummy Data (Simulating your raw email stream)
     data = {
         'thread_id': [101, 102, 103, 104, 105],
@@ -110,7 +137,7 @@ if __name__ == "__main__":
     
     # 4. Apply VADER (Sentiment)
     print("--- Applying VADER Sentiment ---")
-    df['sentiment_score'] = df['body'].apply(engine.get_vader_label)
+    df['sentiment_score'] = engine.get_vader_labels(df['body'])
 
     # 5. Apply LDA (Topics)
     print("--- Applying LDA Topic Modeling ---")
@@ -0,0 +1,326 @@
+import random
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, F, Count
+from django.db.models.query import QuerySet
+from django.utils import timezone
+from .models import Email, AnalysisResult, AnalysisJob
+from .metrics import registry as metrics_registry
+from .rollups import ROLLUP_FIELDS, record_analyses
+from .triage import triage_priority, triage_priorities, priority_band, slo, TIER2_SLO, HIGH_PRIORITY, NORMAL_PRIORITY
+
+# ---------------------------------------------------------
+# CONFIGURATION (override in settings.py)
+# ---------------------------------------------------------
+MAX_ATTEMPTS = getattr(settings, 'ANALYSIS_JOB_MAX_ATTEMPTS', 3)
+VISIBILITY_TIMEOUT = getattr(settings, 'ANALYSIS_JOB_VISIBILITY_TIMEOUT', 300) # seconds
+RETRY_BACKOFF = getattr(settings, 'ANALYSIS_JOB_RETRY_BACKOFF', 30) # seconds, doubled per attempt
+BATCH_CHUNK_SIZE = getattr(settings, 'ANALYSIS_BATCH_CHUNK_SIZE', 256) # emails per batch-engine call
+
+RESULT_FIELDS = [
+    'summary', 'sentiment', 'tone', 'risk_score',
+    'flagged_keywords', 'suggested_category', 'suggested_reply',
+]
+
+# ---------------------------------------------------------
+# PIPELINE: What a job actually does
+# ---------------------------------------------------------
+
+def get_history(email_obj, limit=3):
+    """Last few messages between the same two people (either direction)."""
+    previous_emails = Email.objects.filter(
+        (Q(sender=email_obj.sender) & Q(recipient=email_obj.recipient)) |
+        (Q(sender=email_obj.recipient) & Q(recipient=email_obj.sender))
+    ).exclude(id=email_obj.id).select_related('sender').order_by('-received_at')[:limit]
+
+    return [{'sender': e.sender.username, 'body': e.body} for e in previous_emails]
+
+def get_agent_name(user):
+    """Name the reply is signed with."""
+    if user.first_name:
+        return f"{user.first_name} {user.last_name}"
+    return user.username
+
+def save_analysis(email_obj, analysis_data):
+    """
+    Stores the engine output and flips the Email to 'done'. A job still
+    queued for the email (e.g. after a manual "Run Analysis Now") is
+    closed too, so the worker does not analyze it a second time.
+    """
+    with transaction.atomic():
+        # The Email row is the lock: an AnalysisResult may not exist yet, and
+        # two analyses of the same email must not both see "no previous result"
+        _lock_emails([email_obj.id])
+        # The previous result (if any), so the rollups can move this email out of its old buckets
+        old = AnalysisResult.objects.filter(email=email_obj).values(*ROLLUP_FIELDS).first()
+        AnalysisResult.objects.update_or_create(
+            email=email_obj,
+            defaults={field: analysis_data[field] for field in RESULT_FIELDS}
+        )
+        email_obj.is_analyzed = True
+        email_obj.analysis_status = Email.ANALYSIS_DONE
+        email_obj.save(update_fields=['is_analyzed', 'analysis_status'])
+        AnalysisJob.objects.filter(email=email_obj, status=AnalysisJob.STATUS_QUEUED).update(
+            status=AnalysisJob.STATUS_DONE
+        )
+        record_analyses([(email_obj, old, analysis_data)])
+
+def process_email(email_obj):
+    """Runs the full analysis for one email (history + engine + save)."""
+    from .ai_engine import analyze_email_content
+
+    analysis_data = analyze_email_content(
+        email_obj,
+        history=get_history(email_obj),
+        agent_name=get_agent_name(email_obj.recipient)
+    )
+    save_analysis(email_obj, analysis_data)
+    return analysis_data
+
+# ---------------------------------------------------------
+# BATCH PIPELINE: Backfills and multi-job claims
+# ---------------------------------------------------------
+
+def _iter_id_chunks(queryset_or_ids, chunk_size):
+    if isinstance(queryset_or_ids, QuerySet):
+        # Keyset pagination on id: constant memory, and safe while we write
+        # to the same tables between chunks.
+        last_id = 0
+        while True:
+            chunk = list(
+                queryset_or_ids.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size]
+            )
+            if not chunk:
+                return
+            yield chunk
+            last_id = chunk[-1]
+
+    chunk = []
+    for email_id in queryset_or_ids:
+        chunk.append(email_id)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _lock_emails(email_ids):
+    """
+    Row-locks the Emails (in id order, so two batches cannot deadlock) until
+    the end of the transaction. Every write of an AnalysisResult takes it
+    first, so the old values the rollups subtract are the ones really replaced.
+    """
+    list(Email.objects.select_for_update().filter(id__in=email_ids).order_by('id').values_list('id', flat=True))
+
+def save_analyses_bulk(email_objs, results):
+    """
+    Bulk version of save_analysis: one bulk_create for new results, one
+    bulk_update for re-analyzed ones, one UPDATE for the Email flags.
+    """
+    email_ids = [e.id for e in email_objs]
+    with transaction.atomic():
+        _lock_emails(email_ids)
+        existing = {
+            row['email_id']: row
+            for row in AnalysisResult.objects.filter(email_id__in=email_ids).values('email_id', 'id', *ROLLUP_FIELDS)
+        }
+        to_create, to_update, changes = [], [], []
+        for email_obj, analysis_data in zip(email_objs, results):
+            fields = {field: analysis_data[field] for field in RESULT_FIELDS}
+            old = existing.get(email_obj.id)
+            if old:
+                to_update.append(AnalysisResult(id=old['id'], email=email_obj, **fields))
+            else:
+                to_create.append(AnalysisResult(email=email_obj, **fields))
+            changes.append((email_obj, old, fields))
+            email_obj.is_analyzed = True
+            email_obj.analysis_status = Email.ANALYSIS_DONE
+
+        record_analyses(changes)
+        AnalysisResult.objects.bulk_create(to_create, batch_size=500)
+        AnalysisResult.objects.bulk_update(to_update, RESULT_FIELDS, batch_size=500)
+        Email.objects.filter(id__in=email_ids).update(is_analyzed=True, analysis_status=Email.ANALYSIS_DONE)
+        # Anything still queued for these emails is now redundant
+        AnalysisJob.objects.filter(email_id__in=email_ids, status=AnalysisJob.STATUS_QUEUED).update(
+            status=AnalysisJob.STATUS_DONE
+        )
+
+def analyze_emails_batch(queryset_or_ids, chunk_size=BATCH_CHUNK_SIZE, with_replies=True):
+    """
+    Runs the analysis pipeline over many emails (a queryset or a list of ids).
+    Works chunk by chunk, so a 100k-message backfill never holds everything in
+    memory, and every model runs once per chunk instead of once per email.
+    Set with_replies=False to skip the Gemini drafts (fast backfills).
+    Returns the number of emails analyzed.
+    """
+    from .ai_engine import analyze_email_contents
+
+    total = 0
+    for chunk in _iter_id_chunks(queryset_or_ids, chunk_size):
+        email_objs = list(
+            Email.objects.filter(id__in=chunk).select_related('sender', 'recipient').order_by('id')
+        )
+        if not email_objs:
+            continue
+
+        histories, agent_names = None, None
+        if with_replies:
+            histories = [get_history(e) for e in email_objs]
+            agent_names = [get_agent_name(e.recipient) for e in email_objs]
+
+        results = analyze_email_contents(email_objs, histories, agent_names, with_replies=with_replies)
+        save_analyses_bulk(email_objs, results)
+        total += len(email_objs)
+
+    return total
+
+# ---------------------------------------------------------
+# QUEUE OPERATIONS
+# ---------------------------------------------------------
+
+def enqueue_analysis(email_obj, max_attempts=None):
+    """
+    Adds a job for this email. Cheap: tier-1 triage (keywords, sender
+    history, subject) sets its priority, then a single INSERT.
+    """
+    return AnalysisJob.objects.create(
+        email=email_obj,
+        priority=triage_priority(email_obj),
+        max_attempts=max_attempts or MAX_ATTEMPTS,
+    )
+
+def enqueue_analysis_bulk(email_objs, max_attempts=None):
+    """enqueue_analysis for rows inserted with bulk_create (which skips post_save)."""
+    priorities = triage_priorities(email_objs)
+    return AnalysisJob.objects.bulk_create([
+        AnalysisJob(email=email_obj, priority=priority, max_attempts=max_attempts or MAX_ATTEMPTS)
+        for email_obj, priority in zip(email_objs, priorities)
+    ], batch_size=500)
+
+def queue_depth():
+    """{band: queued jobs} in one query (for /metrics)."""
+    queued = AnalysisJob.objects.filter(status=AnalysisJob.STATUS_QUEUED)
+    counts = queued.aggregate(
+        high=Count('id', filter=Q(priority__gte=HIGH_PRIORITY)),
+        normal=Count('id', filter=Q(priority__gte=NORMAL_PRIORITY, priority__lt=HIGH_PRIORITY)),
+        low=Count('id', filter=Q(priority__lt=NORMAL_PRIORITY)),
+    )
+    return counts
+
+def _claimable(now):
+    """Queued jobs that are due, plus running jobs whose lease has expired."""
+    return (
+        Q(status=AnalysisJob.STATUS_QUEUED, run_after__lte=now) |
+        Q(status=AnalysisJob.STATUS_RUNNING, locked_until__lt=now, attempts__lt=F('max_attempts'))
+    )
+
+def reap_expired_jobs():
+    """
+    Jobs whose worker died on the last allowed attempt can never be
+    claimed again, so mark them failed instead of leaving them 'running'.
+    """
+    now = timezone.now()
+    expired = AnalysisJob.objects.filter(
+        status=AnalysisJob.STATUS_RUNNING, locked_until__lt=now, attempts__gte=F('max_attempts')
+    )
+    email_ids = list(expired.values_list('email_id', flat=True))
+    if not email_ids:
+        return 0
+
+    count = expired.update(status=AnalysisJob.STATUS_FAILED, last_error="Visibility timeout expired on final attempt.")
+    Email.objects.filter(id__in=email_ids, is_analyzed=False).update(analysis_status=Email.ANALYSIS_FAILED)
+    return count
+
+def claim_jobs(worker_id, limit=1, visibility_timeout=None):
+    """
+    Leases up to `limit` jobs for `worker_id`, highest priority first
+    (so a legal threat never waits behind a burst of newsletters).
+    Each claim is a conditional UPDATE, so two workers racing for the same
+    row cannot both win (works on SQLite and PostgreSQL alike).
+    """
+    timeout = visibility_timeout or VISIBILITY_TIMEOUT
+    now = timezone.now()
+    candidate_ids = list(
+        AnalysisJob.objects.filter(_claimable(now))
+        .order_by('-priority', 'run_after', 'id')
+        .values_list('id', flat=True)[:limit * 2]
+    )
+
+    claimed = []
+    for job_id in candidate_ids:
+        won = AnalysisJob.objects.filter(_claimable(now), id=job_id).update(
+            status=AnalysisJob.STATUS_RUNNING,
+            locked_by=worker_id,
+            locked_until=now + timedelta(seconds=timeout),
+            attempts=F('attempts') + 1,
+        )
+        if won:
+            claimed.append(job_id)
+        if len(claimed) >= limit:
+            break
+
+    return list(AnalysisJob.objects.filter(id__in=claimed).select_related('email', 'email__sender', 'email__recipient'))
+
+def run_job(job):
+    """Executes a claimed job and records the outcome. Returns True on success."""
+    try:
+        process_email(job.email)
+    except Exception as e:
+        _mark_failed_attempt(job, f"{e}\n{traceback.format_exc()}")
+        return False
+
+    AnalysisJob.objects.filter(id=job.id, locked_by=job.locked_by).update(
+        status=AnalysisJob.STATUS_DONE, locked_until=None, last_error=""
+    )
+    _record_done([job])
+    return True
+
+def run_jobs(jobs):
+    """
+    Executes several claimed jobs through the batch engine in one go.
+    If the batch fails, falls back to running them one by one so a single
+    bad email only fails its own job. Returns [True/False, ...] per job.
+    """
+    if len(jobs) <= 1:
+        return [run_job(job) for job in jobs]
+
+    try:
+        analyze_emails_batch([job.email_id for job in jobs], chunk_size=len(jobs))
+    except Exception:
+        return [run_job(job) for job in jobs]
+
+    for job in jobs:
+        AnalysisJob.objects.filter(id=job.id, locked_by=job.locked_by).update(
+            status=AnalysisJob.STATUS_DONE, locked_until=None, last_error=""
+        )
+    _record_done(jobs)
+    return [True] * len(jobs)
+
+def _record_done(jobs):
+    """Tier-2 latency (enqueue -> analysis stored) per priority band, against its SLO."""
+    now = timezone.now()
+    for job in jobs:
+        band = priority_band(job.priority)
+        seconds = (now - job.created_at).total_seconds()
+        metrics_registry.observe(f"analysis.tier2.{band}", seconds)
+        slo.record('tier2', band, seconds, TIER2_SLO[band])
+
+def _mark_failed_attempt(job, error):
+    """Schedules a retry with exponential backoff + jitter, or gives up."""
+    if job.attempts >= job.max_attempts:
+        AnalysisJob.objects.filter(id=job.id).update(
+            status=AnalysisJob.STATUS_FAILED, locked_until=None, last_error=error
+        )
+        Email.objects.filter(id=job.email_id, is_analyzed=False).update(analysis_status=Email.ANALYSIS_FAILED)
+        return
+
+    delay = RETRY_BACKOFF * (2 ** (job.attempts - 1))
+    delay += random.uniform(0, delay / 2)
+    AnalysisJob.objects.filter(id=job.id).update(
+        status=AnalysisJob.STATUS_QUEUED,
+        run_after=timezone.now() + timedelta(seconds=delay),
+        locked_until=None,
+        last_error=error,
+    )
@@ -0,0 +1,107 @@
+import re
+from collections import namedtuple
+from .keywords import DANGER_KEYWORDS, COMPLAINT_KEYWORDS, FINANCE_KEYWORDS
+
+# Words are runs of letters/digits. "p&l" -> ["p", "l"], "zero-day" -> ["zero", "day"].
+# Matching whole tokens gives word-boundary semantics for free ("hell" != "hello")
+# and lets phrases match across any whitespace / punctuation between their words.
+TOKEN_RE = re.compile(r"\w+")
+
+KeywordHit = namedtuple('KeywordHit', ['keyword', 'category', 'start', 'end'])
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton over word tokens.
+
+    Built once from the keyword lists; `find()` walks the text's tokens a
+    single time and reports every (possibly overlapping) keyword/phrase hit
+    with its category and character offsets. Cost per email depends on the
+    email length, not on how many keywords the lexicons contain.
+    """
+
+    def __init__(self, lexicons):
+        # Node 0 is the root. goto[n] = {token: next_node}
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]] # node -> [(keyword, category, n_tokens)]
+
+        for category, keywords in lexicons.items():
+            for keyword in keywords:
+                self._add(keyword, category)
+        self._build_failure_links()
+
+    def _add(self, keyword, category):
+        tokens = TOKEN_RE.findall(keyword.lower())
+        if not tokens:
+            return
+        node = 0
+        for tok in tokens:
+            nxt = self.goto[node].get(tok)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][tok] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            node = nxt
+        entry = (keyword, category, len(tokens))
+        if entry not in self.output[node]:
+            self.output[node].append(entry)
+
+    def _build_failure_links(self):
+        # Breadth-first: a node's failure link is the longest proper suffix that is also in the trie
+        queue = list(self.goto[0].values())
+        i = 0
+        while i < len(queue):
+            node = queue[i]
+            i += 1
+            for tok, child in self.goto[node].items():
+                queue.append(child)
+                f = self.fail[node]
+                while f and tok not in self.goto[f]:
+                    f = self.fail[f]
+                target = self.goto[f].get(tok, 0)
+                self.fail[child] = target if target != child else 0
+                # Inherit the suffix's matches so the scan never has to follow links for output
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def find(self, text):
+        """Returns [KeywordHit, ...] ordered by where each hit ends (one linear pass)."""
+        if not text:
+            return []
+
+        goto, fail, output = self.goto, self.fail, self.output
+        hits = []
+        spans = [] # (start, end) of every token seen so far, for offsets
+        node = 0
+
+        for m in TOKEN_RE.finditer(text.lower()):
+            tok = m.group()
+            spans.append(m.span())
+            while node and tok not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(tok, 0)
+
+            for keyword, category, n_tokens in output[node]:
+                start = spans[-n_tokens][0]
+                hits.append(KeywordHit(keyword, category, start, spans[-1][1]))
+
+        return hits
+
+    def find_by_category(self, text):
+        """{category: [unique keywords, in order of first appearance]}"""
+        found = {}
+        for hit in self.find(text):
+            keywords = found.setdefault(hit.category, [])
+            if hit.keyword not in keywords:
+                keywords.append(hit.keyword)
+        return found
+
+
+# Built once per process from analyzer/keywords.py
+keyword_matcher = KeywordMatcher({
+    'danger': DANGER_KEYWORDS,
+    'complaint': COMPLAINT_KEYWORDS,
+    'finance': FINANCE_KEYWORDS,
+})
@@ -0,0 +1,410 @@
+import asyncio
+import json
+import os
+import random
+import re
+import ssl
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections
+from django.utils import timezone
+from .metrics import span
+from .utils import SYNC_BATCH_SIZE, open_imap, sync_mailbox
+
+# ---------------------------------------------------------
+# CONFIGURATION (override in settings.py)
+# ---------------------------------------------------------
+ACCOUNTS_FILE = getattr(settings, 'MAIL_SYNC_ACCOUNTS_FILE', os.path.join(settings.BASE_DIR, 'mail_accounts.json'))
+HEALTH_FILE = getattr(settings, 'MAIL_SYNC_HEALTH_FILE', os.path.join(settings.BASE_DIR, 'mail_sync_health.json'))
+SYNC_WORKERS = getattr(settings, 'MAIL_SYNC_WORKERS', 8) # syncs (IMAP fetch + DB insert) running at once
+IDLE_REFRESH = getattr(settings, 'MAIL_SYNC_IDLE_REFRESH', 25 * 60) # seconds; servers drop IDLE after 30 min (RFC 2177)
+POLL_INTERVAL = getattr(settings, 'MAIL_SYNC_POLL_INTERVAL', 300) # seconds, for servers without IDLE
+BACKOFF_BASE = getattr(settings, 'MAIL_SYNC_BACKOFF_BASE', 5) # seconds, doubled per consecutive failure
+BACKOFF_MAX = getattr(settings, 'MAIL_SYNC_BACKOFF_MAX', 900) # seconds
+NETWORK_TIMEOUT = getattr(settings, 'MAIL_SYNC_NETWORK_TIMEOUT', 60) # seconds per connect / command
+HEALTH_INTERVAL = 10 # seconds between health file writes
+
+PREFIX = "insightmail_mail_sync"
+
+EXISTS_RE = re.compile(rb'^\* \d+ (EXISTS|RECENT)', re.IGNORECASE)
+LITERAL_RE = re.compile(rb'\{(\d+)\}\r\n$')
+
+# ---------------------------------------------------------
+# ACCOUNTS
+# ---------------------------------------------------------
+
+class MailAccount:
+    """One mailbox to keep in sync, imported into `owner`'s inbox."""
+
+    def __init__(self, owner, username, password, host="imap.gmail.com", port=None, use_ssl=True, mailbox="INBOX"):
+        self.owner = owner
+        self.username = username
+        self.password = password
+        self.host = host
+        self.use_ssl = use_ssl
+        self.port = port or (993 if use_ssl else 143)
+        self.mailbox = mailbox
+
+    @property
+    def key(self):
+        # Same account string fetch_gmail_emails checkpoints under (MailboxSyncState.account)
+        return f"{self.username}@{self.host}"
+
+def load_accounts(path=ACCOUNTS_FILE):
+    """
+    Reads the accounts file: a JSON list of
+    {"owner": "alice", "username": "alice@gmail.com", "password_env": "ALICE_IMAP_PASSWORD",
+     "host": "imap.gmail.com", "port": 993, "use_ssl": true, "mailbox": "INBOX"}
+    ("password" works too, but keep real passwords in the environment).
+    Raises ValueError on a bad entry.
+    """
+    with open(path, encoding='utf-8') as f:
+        entries = json.load(f)
+
+    owners = User.objects.in_bulk([e.get('owner') for e in entries], field_name='username')
+    accounts = []
+    for i, entry in enumerate(entries):
+        owner = owners.get(entry.get('owner'))
+        if owner is None:
+            raise ValueError(f"Account #{i}: owner '{entry.get('owner')}' is not a user.")
+        password = os.environ.get(entry['password_env']) if entry.get('password_env') else entry.get('password')
+        if not entry.get('username') or password is None:
+            raise ValueError(f"Account #{i}: needs a username and a password (or password_env).")
+        accounts.append(MailAccount(
+            owner, entry['username'], password,
+            host=entry.get('host', "imap.gmail.com"), port=entry.get('port'),
+            use_ssl=entry.get('use_ssl', True), mailbox=entry.get('mailbox', "INBOX"),
+        ))
+    return accounts
+
+# ---------------------------------------------------------
+# IDLE CONNECTION
+# ---------------------------------------------------------
+
+class ImapError(Exception):
+    pass
+
+def _quote(value):
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+class IdleConnection:
+    """
+    Minimal asyncio IMAP client: logs in, EXAMINEs one mailbox (read-only)
+    and waits in IDLE for the server to announce new mail. Fetching is left
+    to the imaplib code in utils.py, on a separate connection, so hundreds
+    of these can wait on one event loop without holding a thread each.
+    """
+
+    def __init__(self, account, timeout=NETWORK_TIMEOUT):
+        self.account = account
+        self.timeout = timeout
+        self.reader = self.writer = None
+        self.tag = 0
+        self.idle_supported = False
+
+    async def open(self):
+        account = self.account
+        context = ssl.create_default_context() if account.use_ssl else None
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(account.host, account.port, ssl=context), self.timeout
+        )
+        greeting = await self._readline(self.timeout)
+        if not greeting.startswith(b'* OK'):
+            raise ImapError(f"Unexpected greeting: {greeting[:100]!r}")
+        await self.command(f"LOGIN {_quote(account.username)} {_quote(account.password)}", secret=True)
+        capabilities = b' '.join(
+            line for line in await self.command("CAPABILITY") if line.upper().startswith(b'* CAPABILITY')
+        )
+        self.idle_supported = b'IDLE' in capabilities.upper().split()
+        await self.command(f"EXAMINE {_quote(account.mailbox)}")
+
+    async def command(self, text, secret=False):
+        """Sends one command, returns its untagged response lines. Raises ImapError unless OK."""
+        tag = self._next_tag()
+        self.writer.write(tag + b' ' + text.encode('utf-8') + b'\r\n')
+        await self.writer.drain()
+        untagged = []
+        while True:
+            line = await self._readline(self.timeout)
+            if line.startswith(tag + b' '):
+                if line.split(b' ', 2)[1].upper() != b'OK':
+                    name = text.split(' ', 1)[0] if secret else text
+                    raise ImapError(f"{name} failed: {line.decode('utf-8', errors='replace').strip()}")
+                return untagged
+            untagged.append(line)
+
+    async def idle(self, duration):
+        """Waits in IDLE for up to `duration` seconds. True if the server announced new mail."""
+        tag = self._next_tag()
+        self.writer.write(tag + b' IDLE\r\n')
+        await self.writer.drain()
+
+        new_mail = False
+        while True: # untagged updates may come before the continuation
+            line = await self._readline(self.timeout)
+            if line.startswith(b'+'):
+                break
+            if line.startswith(tag + b' '):
+                raise ImapError(f"IDLE refused: {line.decode('utf-8', errors='replace').strip()}")
+            new_mail = new_mail or bool(EXISTS_RE.match(line))
+
+        deadline = time.monotonic() + duration
+        while not new_mail:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                line = await self._readline(remaining)
+            except asyncio.TimeoutError:
+                break
+            new_mail = bool(EXISTS_RE.match(line))
+
+        self.writer.write(b'DONE\r\n')
+        await self.writer.drain()
+        while not (await self._readline(self.timeout)).startswith(tag + b' '):
+            pass
+        return new_mail
+
+    async def close(self):
+        if self.writer is None:
+            return
+        try:
+            self.writer.write(self._next_tag() + b' LOGOUT\r\n')
+            self.writer.close()
+            await asyncio.wait_for(self.writer.wait_closed(), 5)
+        except (OSError, asyncio.TimeoutError):
+            pass
+        self.writer = None
+
+    def _next_tag(self):
+        self.tag += 1
+        return f"I{self.tag}".encode()
+
+    async def _readline(self, timeout):
+        line = await asyncio.wait_for(self.reader.readline(), timeout)
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        # A literal ({n}) continues the line after n bytes
+        match = LITERAL_RE.search(line)
+        while match:
+            literal = await asyncio.wait_for(self.reader.readexactly(int(match.group(1))), timeout)
+            rest = await asyncio.wait_for(self.reader.readline(), timeout)
+            line += literal + rest
+            match = LITERAL_RE.search(rest)
+        return line
+
+# ---------------------------------------------------------
+# DAEMON
+# ---------------------------------------------------------
+
+class AccountHealth:
+    """What one account is doing and how its last attempts went."""
+
+    def __init__(self):
+        self.status = 'starting' # connecting, syncing, synced, idle, polling, backoff
+        self.failures = 0 # consecutive; reset by a successful sync
+        self.last_error = ''
+        self.last_sync_at = None
+        self.last_new_mail_at = None
+        self.next_retry_at = None
+        self.syncs = 0
+        self.imported = 0
+
+    @property
+    def healthy(self):
+        return self.failures == 0
+
+    def as_dict(self):
+        def iso(moment):
+            return moment.isoformat() if moment else None
+        return {
+            'status': self.status, 'healthy': self.healthy, 'failures': self.failures,
+            'last_error': self.last_error, 'last_sync_at': iso(self.last_sync_at),
+            'last_new_mail_at': iso(self.last_new_mail_at), 'next_retry_at': iso(self.next_retry_at),
+            'syncs': self.syncs, 'imported': self.imported,
+        }
+
+
+class SyncDaemon:
+    """
+    Keeps many mailboxes in sync:
+    - one IdleConnection per account on the event loop, woken by IMAP IDLE
+      (or polling when the server has no IDLE);
+    - the sync itself (imaplib fetch + bulk insert) in a bounded thread
+      pool, so at most `workers` syncs - and DB connections - run at once;
+    - per-account exponential backoff with jitter after errors, and a
+      health record per account (health file, Prometheus text).
+    """
+
+    def __init__(self, accounts, workers=SYNC_WORKERS, idle_refresh=IDLE_REFRESH, poll_interval=POLL_INTERVAL,
+                 health_file=HEALTH_FILE, batch_size=SYNC_BATCH_SIZE, startup_spread=5.0, log=print):
+        self.accounts = accounts
+        self.workers = workers
+        self.idle_refresh = idle_refresh
+        self.poll_interval = poll_interval
+        self.health_file = health_file
+        self.batch_size = batch_size
+        self.startup_spread = startup_spread # seconds over which the first logins are spread
+        self.log = log
+        self.health = {account.key: AccountHealth() for account in accounts}
+        self.executor = None
+
+    async def run(self, stop=None):
+        """Runs until `stop` (an asyncio.Event) is set."""
+        stop = stop or asyncio.Event()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='mail-sync')
+        tasks = [asyncio.create_task(self.watch(account)) for account in self.accounts]
+        tasks.append(asyncio.create_task(self.report_health()))
+        try:
+            await stop.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # Let running syncs finish (each batch is its own transaction anyway)
+            await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+            self.write_health()
+
+    async def sync_all(self):
+        """One sync of every account, no IDLE (cron / tests). Returns {account key: imported or error}."""
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='mail-sync')
+        try:
+            results = await asyncio.gather(*(self.sync(a) for a in self.accounts), return_exceptions=True)
+        finally:
+            self.executor.shutdown()
+        for account, result in zip(self.accounts, results):
+            if isinstance(result, Exception):
+                self.record_failure(account, result)
+        self.write_health()
+        return {a.key: r for a, r in zip(self.accounts, results)}
+
+    async def watch(self, account):
+        """Connect, catch up, then IDLE -> sync forever; back off and reconnect on errors."""
+        health = self.health[account.key]
+        await asyncio.sleep(random.uniform(0, self.startup_spread))
+        while True:
+            connection = IdleConnection(account)
+            try:
+                health.status = 'connecting'
+                await connection.open()
+                await self.sync(account) # whatever arrived while we were away
+                while True:
+                    if connection.idle_supported:
+                        health.status = 'idle'
+                        new_mail = await connection.idle(self.idle_refresh)
+                    else:
+                        health.status = 'polling'
+                        await asyncio.sleep(self.poll_interval)
+                        await connection.command("NOOP")
+                        new_mail = False
+                    if new_mail:
+                        health.last_new_mail_at = timezone.now()
+                    # Also on a plain IDLE refresh / poll: one SEARCH, and it
+                    # catches anything a lost notification would have missed
+                    await self.sync(account)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                delay = self.record_failure(account, e)
+                await asyncio.sleep(delay)
+            finally:
+                await connection.close()
+
+    async def sync(self, account):
+        health = self.health[account.key]
+        health.status = 'syncing'
+        count = await asyncio.get_running_loop().run_in_executor(self.executor, self._sync_blocking, account)
+        health.status = 'synced'
+        health.syncs += 1
+        health.imported += count
+        health.last_sync_at = timezone.now()
+        health.failures = 0
+        health.last_error = ''
+        health.next_retry_at = None
+        return count
+
+    def _sync_blocking(self, account):
+        """Runs in the pool: imaplib fetch + insert on a short-lived connection of its own."""
+        close_old_connections() # pool threads keep their DB connection; drop it if stale
+        try:
+            with span("imap.connect"):
+                mail = open_imap(account.host, account.port, account.use_ssl, timeout=NETWORK_TIMEOUT)
+            try:
+                mail.login(account.username, account.password)
+                with span("imap.sync"):
+                    return sync_mailbox(mail, account.owner, account.key, account.mailbox, self.batch_size)
+            finally:
+                try:
+                    mail.logout()
+                except Exception:
+                    pass
+        finally:
+            close_old_connections()
+
+    def record_failure(self, account, error):
+        """Counts the failure and returns how long to wait before retrying."""
+        health = self.health[account.key]
+        health.failures += 1
+        health.last_error = f"{type(error).__name__}: {error}"[:500]
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** (health.failures - 1)))
+        delay += random.uniform(0, delay / 2)
+        health.status = 'backoff'
+        health.next_retry_at = timezone.now() + timedelta(seconds=delay)
+        self.log(f"{account.key}: {health.last_error} (attempt {health.failures}, retrying in {delay:.0f}s)")
+        return delay
+
+    # ---------------------------------------------------------
+    # HEALTH
+    # ---------------------------------------------------------
+
+    def summary(self):
+        """{'accounts', 'healthy', 'imported', 'status': {status: count}}"""
+        status = {}
+        for health in self.health.values():
+            status[health.status] = status.get(health.status, 0) + 1
+        return {
+            'accounts': len(self.health),
+            'healthy': sum(h.healthy for h in self.health.values()),
+            'imported': sum(h.imported for h in self.health.values()),
+            'status': status,
+        }
+
+    def write_health(self):
+        """Writes the health file atomically (readers never see half a file)."""
+        if not self.health_file:
+            return
+        payload = {
+            'updated_at': timezone.now().isoformat(),
+            'summary': self.summary(),
+            'accounts': {key: health.as_dict() for key, health in self.health.items()},
+        }
+        tmp_path = f"{self.health_file}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, indent=1)
+        os.replace(tmp_path, self.health_file)
+
+    async def report_health(self):
+        while True:
+            await asyncio.sleep(HEALTH_INTERVAL)
+            self.write_health()
+
+    def render_prometheus(self):
+        s = self.summary()
+        lines = [
+            f"# HELP {PREFIX}_accounts Accounts per sync status.",
+            f"# TYPE {PREFIX}_accounts gauge",
+        ]
+        for status, count in sorted(s['status'].items()):
+            lines.append(f'{PREFIX}_accounts{{status="{status}"}} {count}')
+        lines += [
+            f"# HELP {PREFIX}_unhealthy_accounts Accounts whose last attempt failed.",
+            f"# TYPE {PREFIX}_unhealthy_accounts gauge",
+            f"{PREFIX}_unhealthy_accounts {s['accounts'] - s['healthy']}",
+            f"# HELP {PREFIX}_imported_total Emails imported since the daemon started.",
+            f"# TYPE {PREFIX}_imported_total counter",
+            f"{PREFIX}_imported_total {s['imported']}",
+        ]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,28 @@
+import time
+from django.core.management.base import BaseCommand
+from analyzer.models import Email
+from analyzer.jobs import analyze_emails_batch, BATCH_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = "Analyzes existing emails in bulk with the batch engine (no job queue)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=BATCH_CHUNK_SIZE, help="Emails per batch.")
+        parser.add_argument('--all', action='store_true', help="Re-analyze emails that already have a result.")
+        parser.add_argument('--no-replies', action='store_true', help="Skip Gemini reply drafts (much faster).")
+
+    def handle(self, *args, **options):
+        emails = Email.objects.all() if options['all'] else Email.objects.filter(is_analyzed=False)
+
+        self.stdout.write(f"--- Backfilling analysis for {emails.count()} emails ---")
+        started = time.perf_counter()
+        total = analyze_emails_batch(
+            emails,
+            chunk_size=options['chunk_size'],
+            with_replies=not options['no_replies'],
+        )
+        elapsed = time.perf_counter() - started
+
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(f"--- Done! Analyzed {total} emails in {elapsed:.1f}s ({rate:.1f}/s) ---"))
@@ -0,0 +1,224 @@
+import email
+import json
+import os
+import random
+import time
+import tracemalloc
+from email.message import EmailMessage
+from django.core.management.base import BaseCommand
+from analyzer.mime import MAX_BODY_CHARS, MAX_PART_BYTES, cap_text, clean_encoding, decode_subject
+from analyzer.utils import decode_body, find_body_part, parse_bodystructure
+
+WORDS = ("invoice payment account order delivery refund meeting schedule update urgent please "
+         "thanks team report review contract price offer support issue request").split()
+
+
+def sentence(rng, n):
+    return " ".join(rng.choice(WORDS) for _ in range(n)).capitalize() + "."
+
+
+def paragraphs(rng, n):
+    return "\n\n".join(" ".join(sentence(rng, rng.randint(6, 14)) for _ in range(4)) for _ in range(n))
+
+
+def build_corpus(n, seed):
+    """
+    n .eml messages in the shapes real mailboxes are made of: plain,
+    plain+HTML alternative, HTML-only newsletters, big attachments, nested
+    multiparts, quoted-printable latin-1, huge single-part bodies, forwards.
+    """
+    rng = random.Random(seed)
+    shapes = ['plain', 'alternative', 'html_only', 'attachment', 'nested', 'latin1', 'huge', 'forward']
+    corpus = []
+    for i in range(n):
+        shape = shapes[i % len(shapes)]
+        msg = EmailMessage()
+        msg['From'] = f"sender{rng.randint(1, 500)}@example.com"
+        msg['To'] = "inbox@example.com"
+        msg['Subject'] = sentence(rng, 5)
+        text = paragraphs(rng, rng.randint(1, 6))
+        markup = "<html><head><style>p {color: red}</style></head><body>" + "".join(
+            f"<p>{p}</p>" for p in text.split("\n\n")) + "</body></html>"
+
+        if shape == 'plain':
+            msg.set_content(text)
+        elif shape == 'alternative':
+            msg.set_content(text)
+            msg.add_alternative(markup, subtype='html')
+        elif shape == 'html_only':
+            msg.set_content(markup, subtype='html')
+        elif shape == 'attachment':
+            msg.set_content(text)
+            msg.add_attachment(rng.randbytes(rng.randint(200_000, 4_000_000)), maintype='application',
+                               subtype='pdf', filename='statement.pdf')
+        elif shape == 'nested':
+            msg.set_content(text)
+            msg.add_alternative(markup, subtype='html')
+            msg.make_mixed()
+            msg.add_attachment(rng.randbytes(50_000), maintype='image', subtype='png', filename='logo.png')
+        elif shape == 'latin1':
+            msg.set_content(text + "\n\nMerci, à bientôt - l'équipe", charset='latin-1', cte='quoted-printable')
+        elif shape == 'huge':
+            msg.set_content(paragraphs(rng, 3000), cte='base64') # ~1.5MB of text
+        elif shape == 'forward':
+            inner = EmailMessage()
+            inner['From'], inner['Subject'] = "original@example.com", sentence(rng, 4)
+            inner.set_content(paragraphs(rng, 2))
+            msg.set_content(text)
+            msg.add_attachment(inner)
+        corpus.append((shape, msg.as_bytes()))
+    return corpus
+
+
+def _structure(part, spec, contents):
+    """
+    The BODYSTRUCTURE an IMAP server reports for `part`, filling
+    contents[spec] with the transfer-encoded bytes BODY[spec] returns.
+    """
+    if part.is_multipart():
+        children = "".join(
+            _structure(child, f"{spec}.{n}" if spec else str(n), contents)
+            for n, child in enumerate(part.get_payload(), 1)
+        )
+        return f'({children} "{part.get_content_subtype().upper()}")'
+    payload = part.get_payload(decode=False)
+    raw = payload.encode('utf-8', 'surrogateescape') if isinstance(payload, str) else b''
+    contents[spec or '1'] = raw
+    params = f'("CHARSET" "{part.get_content_charset()}")' if part.get_content_charset() else 'NIL'
+    encoding = part.get('Content-Transfer-Encoding', '7BIT').upper()
+    fields = f'"{part.get_content_maintype().upper()}" "{part.get_content_subtype().upper()}" {params} NIL NIL "{encoding}" {len(raw)}'
+    disposition = f'("{part.get_content_disposition().upper()}" NIL)' if part.get_content_disposition() else 'NIL'
+    if part.get_content_maintype() == 'text':
+        lines = raw.count(b'\n') + 1
+        return f'({fields} {lines} NIL {disposition})'
+    return f'({fields} NIL {disposition})'
+
+
+def server_view(raw):
+    """(header bytes, BODYSTRUCTURE, {part spec: bytes}): what the IMAP server answers for one message."""
+    msg = email.message_from_bytes(raw)
+    contents = {}
+    structure = _structure(msg, '', contents)
+    end = raw.find(b'\r\n\r\n')
+    header = raw[:end + 4] if end != -1 else raw[:raw.find(b'\n\n') + 2]
+    return header, structure, contents
+
+
+def baseline_parse(raw):
+    """Download everything, then the stdlib route: full feedparser tree, walk, first text/plain part."""
+    msg = email.message_from_bytes(raw)
+    body = ""
+    for part in msg.walk():
+        if part.get_content_type() == 'text/plain' and part.get_content_disposition() != 'attachment':
+            body = part.get_payload(decode=True).decode(clean_encoding(part.get_content_charset()), errors='replace')
+            break
+    return (decode_subject(msg["Subject"]), msg.get("From", "Unknown Sender"), body), len(raw)
+
+
+def ingestion_parse(view):
+    """
+    What utils.fetch_messages does per message: parse the BODYSTRUCTURE,
+    pick the part, download at most MAIL_MAX_PART_BYTES of it (partial
+    FETCH), decode it and parse the two header fields.
+    """
+    header, structure, contents = view
+    downloaded = len(header) + len(structure)
+    part = find_body_part(parse_bodystructure(structure))
+    body = ""
+    if part:
+        raw = contents.get(part[0], b'')[:MAX_PART_BYTES]
+        downloaded += len(raw)
+        body = cap_text(decode_body(raw, part), MAX_BODY_CHARS)
+    msg = email.message_from_bytes(header)
+    return (decode_subject(msg["Subject"]), msg.get("From", "Unknown Sender"), body), downloaded
+
+
+def measure(fn, inputs):
+    """(results, seconds, peak bytes allocated while parsing one message at a time, bytes downloaded)."""
+    fn(inputs[0]) # warm-up
+    started = time.perf_counter()
+    results = [fn(item) for item in inputs]
+    elapsed = time.perf_counter() - started
+    # Second pass for memory: tracemalloc would distort the timings
+    tracemalloc.start()
+    for item in inputs:
+        fn(item)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return [r for r, _ in results], elapsed, peak, sum(n for _, n in results)
+
+
+class Command(BaseCommand):
+    help = ("Benchmarks the IMAP ingestion path (utils.fetch_messages: BODYSTRUCTURE, one partial part "
+            "fetch, decoding) against downloading whole messages for email.message_from_bytes, on a seeded "
+            "corpus of real-world-shaped .eml messages or on your own .eml files.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=400, help="Size of the generated corpus.")
+        parser.add_argument('--eml-dir', help="Benchmark the .eml files in this folder instead of a generated corpus.")
+        parser.add_argument('--write', metavar='DIR', help="Also save the generated corpus as .eml files here.")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', dest='json_path', help="Also write the results to this file.")
+
+    def handle(self, *args, **options):
+        if options['eml_dir']:
+            names = sorted(f for f in os.listdir(options['eml_dir']) if f.endswith('.eml'))
+            corpus = []
+            for name in names:
+                with open(os.path.join(options['eml_dir'], name), 'rb') as f:
+                    corpus.append(('file', f.read()))
+        else:
+            corpus = build_corpus(options['messages'], options['seed'])
+            if options['write']:
+                os.makedirs(options['write'], exist_ok=True)
+                for i, (shape, raw) in enumerate(corpus):
+                    with open(os.path.join(options['write'], f"{i:05d}_{shape}.eml"), 'wb') as f:
+                        f.write(raw)
+                self.stdout.write(f"Corpus written to {options['write']}")
+        if not corpus:
+            self.stdout.write(self.style.WARNING("No messages to benchmark."))
+            return
+
+        size_mb = sum(len(raw) for _, raw in corpus) / 1e6
+        self.stdout.write(f"{len(corpus)} messages, {size_mb:.1f} MB")
+
+        # The server side of each message, prepared up front (not timed)
+        views = [server_view(raw) for _, raw in corpus]
+
+        rows = []
+        new, new_elapsed, new_peak, new_bytes = measure(ingestion_parse, views)
+        old, old_elapsed, old_peak, old_bytes = measure(baseline_parse, [raw for _, raw in corpus])
+        for name, elapsed, peak, downloaded in (
+            ("full download + message_from_bytes", old_elapsed, old_peak, old_bytes),
+            ("fetch_messages path", new_elapsed, new_peak, new_bytes),
+        ):
+            rows.append({
+                'parser': name,
+                'seconds': elapsed,
+                'msgs_per_sec': len(corpus) / elapsed,
+                'mb_per_sec': size_mb / elapsed,
+                'peak_mb': peak / 1e6,
+                'downloaded_mb': downloaded / 1e6,
+            })
+
+        # Same answer wherever the old route found a body; a body where it found none
+        recovered = sum(1 for (_, _, a), (_, _, b) in zip(old, new) if not a.strip() and b.strip())
+        differ = sum(1 for (_, _, a), (_, _, b) in zip(old, new) if a.strip() and a != b)
+
+        self.stdout.write(self.style.MIGRATE_HEADING("\n=== Message ingestion ==="))
+        self.stdout.write(f"{'parser':<37}{'seconds':>10}{'msgs/s':>12}{'MB/s':>10}{'peak MB':>10}{'download MB':>13}")
+        for r in rows:
+            self.stdout.write(
+                f"{r['parser']:<37}{r['seconds']:>10.3f}{r['msgs_per_sec']:>12.1f}{r['mb_per_sec']:>10.1f}"
+                f"{r['peak_mb']:>10.1f}{r['downloaded_mb']:>13.1f}"
+            )
+        self.stdout.write(f"Speedup: {old_elapsed / new_elapsed:.1f}x")
+        self.stdout.write(f"Bodies recovered (HTML-only mail the old route left empty): {recovered}")
+        self.stdout.write(f"Bodies that differ (capped huge bodies): {differ}")
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump({'messages': len(corpus), 'mb': size_mb, 'rows': rows,
+                           'recovered': recovered, 'differ': differ}, f, indent=2)
+            self.stdout.write(f"Results written to {options['json_path']}")
+        self.stdout.write(self.style.SUCCESS("--- Done! ---"))
@@ -0,0 +1,119 @@
+import json
+import multiprocessing
+import os
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from analyzer.model_registry import SVR_LEGACY_FILE, ModelRegistry
+
+SAMPLE_TEXT = ("Hi team, the invoice for order 4471 was charged twice and I still have not received a refund. "
+               "Please fix this urgently or I will cancel my account.")
+
+
+def memory_mb():
+    """RSS, PSS (shared pages split between the processes mapping them) and USS (private) of this process."""
+    fields = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return {
+        'rss': fields.get('Rss', 0.0),
+        'pss': fields.get('Pss', 0.0),
+        'uss': fields.get('Private_Clean', 0.0) + fields.get('Private_Dirty', 0.0),
+    }
+
+
+def use_models(registry, names):
+    """One call of each model, so the pages an analysis touches are really mapped."""
+    if 'nlp' in names:
+        registry.get_spacy_nlp()(SAMPLE_TEXT)
+    if 'vader' in names:
+        registry.get_vader().polarity_scores(SAMPLE_TEXT)
+    if 'sentiment' in names:
+        registry.get_sentiment_scorer().compound_batch([SAMPLE_TEXT])
+    if 'lda' in names:
+        dictionary, lda_model = registry.get_lda()
+        if lda_model is not None:
+            lda_model.get_document_topics(dictionary.doc2bow(SAMPLE_TEXT.lower().split()))
+    if 'svr' in names:
+        svr = registry.get_svr()
+        if svr is not None:
+            svr.predict([[3, 1, 12.0]])
+
+
+def _worker(registry, names, barrier, results):
+    """Loads (if the parent did not) and uses the models, then reports memory while every worker is alive."""
+    started = time.perf_counter()
+    if registry is None:
+        registry = ModelRegistry(mmap=False, svr_files=(SVR_LEGACY_FILE,))
+    registry.warm_up(names)
+    use_models(registry, names)
+    load_seconds = time.perf_counter() - started
+    barrier.wait() # everybody loaded: shared pages are now counted by all of them
+    memory = memory_mb()
+    barrier.wait() # nobody exits before everybody measured
+    svr = type(registry.get_svr()).__name__ if 'svr' in names else '-'
+    results.put(dict(memory, load_s=load_seconds, svr=svr))
+
+
+class Command(BaseCommand):
+    help = ("Measures per-worker memory (RSS/PSS/USS) and model load time for N forked workers: "
+            "'legacy' = every worker loads its own copy (no mmap, pickled SVR), "
+            "'shared' = the parent preloads (mmap'd LDA, .npz SVR) and forks. Linux only.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help="Only these (nlp, vader, sentiment, stopwords, lda, svr). Default: all.")
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--modes', default="legacy,shared", help="Comma-separated: legacy, shared.")
+        parser.add_argument('--json', dest='json_path', help="Also write the results to this file.")
+
+    def handle(self, *args, **options):
+        if not os.path.exists('/proc/self/smaps_rollup'):
+            raise CommandError("Needs Linux (/proc/self/smaps_rollup).")
+        names = options['models'] or ['nlp', 'vader', 'sentiment', 'stopwords', 'lda', 'svr']
+        context = multiprocessing.get_context('fork')
+        report = {}
+        # 'legacy' first: its workers load in the child, so the parent stays empty for the next mode
+        for mode in [m for m in ('legacy', 'shared') if m in options['modes'].split(',')]:
+            parent_load = 0.0
+            registry = None
+            if mode == 'shared':
+                registry = ModelRegistry()
+                started = time.perf_counter()
+                registry.preload_for_fork(names)
+                parent_load = time.perf_counter() - started
+
+            barrier, results = context.Barrier(options['workers']), context.Queue()
+            children = [context.Process(target=_worker, args=(registry, names, barrier, results)) for _ in range(options['workers'])]
+            for child in children:
+                child.start()
+            rows = [results.get() for _ in children]
+            for child in children:
+                child.join()
+
+            report[mode] = {
+                'workers': options['workers'],
+                'parent_load_s': parent_load,
+                'worker_load_s': statistics.mean(r['load_s'] for r in rows),
+                'rss_mb': statistics.mean(r['rss'] for r in rows),
+                'pss_mb': statistics.mean(r['pss'] for r in rows),
+                'uss_mb': statistics.mean(r['uss'] for r in rows),
+                'total_pss_mb': sum(r['pss'] for r in rows),
+                'svr': rows[0]['svr'],
+            }
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n=== {options['workers']} workers ==="))
+        self.stdout.write(f"{'mode':<8}{'parent load s':>14}{'worker load s':>14}{'RSS MB':>10}{'PSS MB':>10}"
+                          f"{'USS MB':>10}{'total PSS MB':>14}  svr")
+        for mode, r in report.items():
+            self.stdout.write(
+                f"{mode:<8}{r['parent_load_s']:>14.2f}{r['worker_load_s']:>14.2f}{r['rss_mb']:>10.1f}{r['pss_mb']:>10.1f}"
+                f"{r['uss_mb']:>10.1f}{r['total_pss_mb']:>14.1f}  {r['svr']}"
+            )
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Results written to {options['json_path']}")
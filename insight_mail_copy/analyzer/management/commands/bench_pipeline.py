@@ -0,0 +1,152 @@
+import json
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from analyzer.models import Email
+from analyzer.synthetic import CorpusGenerator
+
+
+def summarize(name, timings, queries):
+    timings = sorted(timings)
+    total = sum(timings)
+    return {
+        'stage': name,
+        'n': len(timings),
+        'mean_ms': 1000 * total / len(timings),
+        'p50_ms': 1000 * timings[len(timings) // 2],
+        'p95_ms': 1000 * timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        'per_sec': len(timings) / total if total else float('inf'),
+        'queries_per_op': statistics.mean(queries),
+    }
+
+
+def measure(name, fn, items):
+    """Calls fn(item) for every item; returns latency and query stats."""
+    fn(items[0]) # warm-up (model loading is not what we measure here)
+    timings, queries = [], []
+    for item in items:
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            fn(item)
+            timings.append(time.perf_counter() - started)
+        queries.append(len(ctx.captured_queries))
+    return summarize(name, timings, queries)
+
+
+def measure_batch(name, fn, items):
+    """Calls fn(items) once; reports it per item so it lines up with the single-item stages."""
+    fn(items[:2]) # warm-up
+    with CaptureQueriesContext(connection) as ctx:
+        started = time.perf_counter()
+        fn(items)
+        elapsed = time.perf_counter() - started
+    per_item = elapsed / len(items)
+    return summarize(name, [per_item] * len(items), [len(ctx.captured_queries) / len(items)])
+
+
+class Command(BaseCommand):
+    help = ("Benchmarks every stage of the analysis pipeline on a seeded synthetic corpus. "
+            "Runs in a throwaway test database unless --use-current-db is given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default="1000,10000",
+                            help="Comma-separated corpus sizes (rows in Email), e.g. 1000,10000,100000,1000000")
+        parser.add_argument('--samples', type=int, default=200, help="Emails measured per stage and size.")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', dest='json_path', help="Also write the results to this file.")
+        parser.add_argument('--use-current-db', action='store_true',
+                            help="Benchmark against the configured database instead of a fresh test database.")
+        parser.add_argument('--keepdb', action='store_true', help="Keep the test database between runs.")
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(s) for s in options['sizes'].split(','))
+
+        old_name = None
+        if not options['use_current_db']:
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+
+        # Gemini is stubbed: we measure our own code, not the network
+        from analyzer.reply_service import ReplyService, StaticBackend, set_reply_service
+        previous_service = set_reply_service(
+            ReplyService(StaticBackend(), rate_per_sec=1e9, burst=1e9, max_concurrency=8)
+        )
+
+        try:
+            report = self.run(sizes, options)
+        finally:
+            set_reply_service(previous_service)
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Results written to {options['json_path']}")
+
+    def run(self, sizes, options):
+        from analyzer.ai_engine import (
+            clean_text, get_vader_sentiment, predict_topic_lda, score_keywords,
+            analyze_email_content, analyze_email_contents,
+        )
+        from analyzer.absa_engine import AspectEngine
+        from analyzer.engagement_engine import EngagementEngine
+        from analyzer.analysis_cache import analysis_cache
+
+        generator = CorpusGenerator(seed=options['seed'])
+        rng = random.Random(options['seed'])
+        report = {'seed': options['seed'], 'sizes': {}}
+
+        for size in sizes:
+            have = Email.objects.count()
+            if have < size:
+                self.stdout.write(f"Generating {size - have} emails (corpus -> {size})...")
+                started = time.perf_counter()
+                generator.populate(size - have)
+                self.stdout.write(f"  inserted in {time.perf_counter() - started:.1f}s")
+
+            ids = list(Email.objects.order_by('id').values_list('id', flat=True)[:size])
+            sample_ids = rng.sample(ids, min(options['samples'], len(ids)))
+            emails = list(Email.objects.filter(id__in=sample_ids).select_related('sender', 'recipient'))
+            texts = [f"{e.subject} {e.body}" for e in emails]
+            tokens = [clean_text(t) for t in texts]
+
+            engagement = EngagementEngine()
+            absa = AspectEngine.shared()
+
+            # Engine stages are measured cold; cache hits get their own row
+            analysis_cache.enabled = False
+            rows = [
+                measure("clean_text", clean_text, texts),
+                measure("get_vader_sentiment", get_vader_sentiment, texts),
+                measure("predict_topic_lda", predict_topic_lda, tokens),
+                measure("AspectEngine.get_aspect_sentiment", absa.get_aspect_sentiment, texts),
+                measure_batch("AspectEngine.get_aspect_sentiment_batch", absa.get_aspect_sentiment_batch, texts),
+                measure("EngagementEngine.get_thread_features", engagement.get_thread_features, emails),
+                measure("keyword scoring", lambda t: score_keywords(t, None, "Neutral", 0.0), texts),
+                measure("analyze_email_content (LLM stubbed)", analyze_email_content, emails),
+                measure_batch("analyze_email_contents batch (LLM stubbed)", analyze_email_contents, emails),
+            ]
+            analysis_cache.enabled = True
+            analysis_cache.clear()
+            analyze_email_contents(emails) # fill the cache
+            rows.append(measure("analyze_email_content (cache hit)", analyze_email_content, emails))
+            report['sizes'][size] = rows
+
+            # The batch paths are only a speedup if they give the same answers
+            if absa.get_aspect_sentiment_batch(texts) != [absa.get_aspect_sentiment(t) for t in texts]:
+                self.stderr.write("AspectEngine batch results differ from the single-text path!")
+            self.print_table(size, rows)
+
+        return report
+
+    def print_table(self, size, rows):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n=== Corpus: {size} emails ==="))
+        self.stdout.write(f"{'stage':<45}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'ops/s':>12}{'queries/op':>12}")
+        for r in rows:
+            self.stdout.write(
+                f"{r['stage']:<45}{r['mean_ms']:>10.3f}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}"
+                f"{r['per_sec']:>12.1f}{r['queries_per_op']:>12.2f}"
+            )
@@ -0,0 +1,131 @@
+import json
+import random
+import time
+from django.core.management.base import BaseCommand, CommandError
+from analyzer.model_registry import registry
+from analyzer.sentiment import COMPOUND_TOLERANCE, NEGATIVE_THRESHOLD, POSITIVE_THRESHOLD, SPECIAL_WORDS, VaderScorer
+from analyzer.synthetic import CorpusGenerator
+
+# Every rule of the VADER paper, plus the corner cases of its tokenizer
+EDGE_CASES = [
+    "VADER is smart, handsome, and funny.",
+    "VADER is smart, handsome, and funny!",
+    "VADER is very smart, handsome, and funny.",
+    "VADER is VERY SMART, handsome, and FUNNY.",
+    "VADER is VERY SMART, handsome, and FUNNY!!!",
+    "VADER is VERY SMART, uber handsome, and FRIGGIN FUNNY!!!",
+    "VADER is not smart, handsome, nor funny.",
+    "At least it isn't a horrible book.",
+    "The book was only kind of good.",
+    "The plot was good, but the characters are uncompelling and the dialog is not great.",
+    "Today SUX!",
+    "Today only kinda sux! But I'll get by, lol",
+    "Make sure you :) or :D today!",
+    "Not bad at all",
+    "that was the shit",
+    "yeah right, this is great",
+    "It was the bomb dude",
+    "never so good", "never this bad honestly",
+    "least good thing", "at least good", "very least good",
+    "He is kind of happy", "kind of",
+    "This is not the worst, but it isn't good either???",
+    "WOW!!!!! amazing?? really??",
+    "I don't love it",
+    "good good good bad", "good. GOOD! good?", "\"good\" 'bad' -nice- ...ok", "(good) [bad]", "don't. like",
+    "bad ass movie", "kiss of death indeed bad", "hand to mouth existence sucks", "cut the mustard today well",
+    "", "   ", "a b c", "GREAT",
+]
+
+FILLER = "the a is email order team please update".split()
+
+
+def fuzz_corpus(lexicon, n, seed):
+    """Random token soup over lexicon words, boosters, negations and the words the rules look for."""
+    from nltk.sentiment.vader import VaderConstants as c
+    rng = random.Random(seed)
+    vocab = sorted(w for w in lexicon if ' ' not in w)[::7] + sorted(c.BOOSTER_DICT) + sorted(c.NEGATE)
+    vocab += list(SPECIAL_WORDS) + FILLER * 5
+    texts = []
+    for _ in range(n):
+        words = []
+        for _ in range(rng.randint(0, 30)):
+            word = rng.choice(vocab)
+            roll = rng.random()
+            if roll < 0.1:
+                word = word.upper()
+            elif roll < 0.15:
+                word = word.capitalize()
+            if rng.random() < 0.15:
+                word += rng.choice(['.', '!', ',', '?', '!!', '...', ';'])
+            if rng.random() < 0.05:
+                word = rng.choice(['"', '(', '-', "'"]) + word
+            words.append(word)
+        texts.append(" ".join(words))
+    return texts
+
+
+def label(compound):
+    return 1 if compound >= POSITIVE_THRESHOLD else -1 if compound <= NEGATIVE_THRESHOLD else 0
+
+
+class Command(BaseCommand):
+    help = ("Checks the batch VADER scorer (analyzer/sentiment.py) against NLTK's SentimentIntensityAnalyzer "
+            "on edge cases, random token soup and synthetic mail, and compares their throughput.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fuzz', type=int, default=20000, help="Random texts in the regression corpus.")
+        parser.add_argument('--messages', type=int, default=5000, help="Synthetic emails (also used for timing).")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', dest='json_path', help="Also write the results to this file.")
+
+    def handle(self, *args, **options):
+        sia = registry.get_vader()
+        scorer = VaderScorer(sia.lexicon)
+        generator = CorpusGenerator(seed=options['seed'])
+        mails = [f"{m['subject']}. {m['body']}" for m in generator.messages(options['messages'])]
+        corpus = EDGE_CASES + fuzz_corpus(sia.lexicon, options['fuzz'], options['seed']) + mails
+
+        # Regression: same scores as NLTK
+        expected = [sia.polarity_scores(text) for text in corpus]
+        got = scorer.polarity_scores_batch(corpus)
+        max_error = {key: max(abs(e[key] - g[key]) for e, g in zip(expected, got))
+                     for key in ('compound', 'pos', 'neg', 'neu')}
+        label_agreement = sum(label(e['compound']) == label(g['compound']) for e, g in zip(expected, got)) / len(corpus)
+        worst = max(zip(corpus, expected, got), key=lambda row: abs(row[1]['compound'] - row[2]['compound']))
+
+        # Throughput on the mail
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+        for text in mails:
+            sia.polarity_scores(text)
+        nltk_elapsed = time.perf_counter() - started
+        started = time.perf_counter()
+        for i in range(0, len(mails), batch_size):
+            scorer.compound_batch(mails[i:i + batch_size])
+        batch_elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.MIGRATE_HEADING("\n=== VADER regression ==="))
+        self.stdout.write(f"{len(corpus)} texts ({len(EDGE_CASES)} edge cases, {options['fuzz']} random, {len(mails)} emails)")
+        for key, error in max_error.items():
+            self.stdout.write(f"max |delta| {key:<9}{error:.1e}")
+        self.stdout.write(f"Label agreement: {label_agreement:.4%}")
+
+        self.stdout.write(self.style.MIGRATE_HEADING("\n=== Throughput ==="))
+        self.stdout.write(f"{'scorer':<30}{'seconds':>10}{'texts/s':>12}")
+        self.stdout.write(f"{'nltk polarity_scores':<30}{nltk_elapsed:>10.3f}{len(mails) / nltk_elapsed:>12.0f}")
+        self.stdout.write(f"{f'VaderScorer (batch {batch_size})':<30}{batch_elapsed:>10.3f}{len(mails) / batch_elapsed:>12.0f}")
+        self.stdout.write(f"Speedup: {nltk_elapsed / batch_elapsed:.1f}x")
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump({'texts': len(corpus), 'max_error': max_error, 'label_agreement': label_agreement,
+                           'nltk_seconds': nltk_elapsed, 'batch_seconds': batch_elapsed,
+                           'batch_size': batch_size}, f, indent=2)
+            self.stdout.write(f"Results written to {options['json_path']}")
+
+        if max_error['compound'] > COMPOUND_TOLERANCE:
+            raise CommandError(f"Compound scores differ from NLTK by up to {max_error['compound']:.1e} "
+                               f"(tolerance {COMPOUND_TOLERANCE:.0e}), e.g. {worst[0]!r}: "
+                               f"{worst[1]['compound']} vs {worst[2]['compound']}")
+        self.stdout.write(self.style.SUCCESS("--- Done! ---"))
@@ -0,0 +1,101 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Nothing on the startup path may import these: they belong to the first
+# analysis (or to `manage.py warm_models`), not to every process boot.
+HEAVY_MODULES = ('spacy', 'gensim', 'nltk', 'sklearn', 'google.generativeai', 'pandas', 'numpy', 'torch')
+
+# What a web/worker process imports before serving: the app, its URLconf
+# and views, the queue, and the worker command itself.
+BOOT_SCRIPT = """
+import json, os, sys
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', %(settings)r)
+import django
+django.setup()
+from django.core.management import load_command_class
+import analyzer.jobs, analyzer.signals, analyzer.views, analyzer.urls
+load_command_class('analyzer', 'run_analysis_worker')
+print(json.dumps(sorted(m for m in %(heavy)r if m in sys.modules)))
+"""
+
+
+class Command(BaseCommand):
+    help = ("Measures cold-start time of `manage.py check` and of a worker boot in fresh interpreters, "
+            "and fails if either is over budget or if a heavy ML library got imported on the way.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters per measurement (median is reported).")
+        parser.add_argument('--check-budget', type=float, default=2.0, help="Seconds allowed for `manage.py check`.")
+        parser.add_argument('--boot-budget', type=float, default=2.0, help="Seconds allowed for a worker boot.")
+        parser.add_argument('--importtime', action='store_true', help="Also list the slowest imports of a worker boot.")
+
+    def handle(self, *args, **options):
+        base_dir = str(settings.BASE_DIR)
+        env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+        boot_script = BOOT_SCRIPT % {'settings': os.environ['DJANGO_SETTINGS_MODULE'], 'heavy': HEAVY_MODULES}
+
+        check_cmd = [sys.executable, os.path.join(base_dir, 'manage.py'), 'check']
+        boot_cmd = [sys.executable, '-c', boot_script]
+
+        check_times, _ = self.measure(check_cmd, base_dir, env, options['runs'])
+        boot_times, output = self.measure(boot_cmd, base_dir, env, options['runs'])
+        heavy = json.loads(output.strip().splitlines()[-1])
+
+        rows = [
+            ("manage.py check", check_times, options['check_budget']),
+            ("worker boot", boot_times, options['boot_budget']),
+        ]
+        failures = []
+        self.stdout.write(f"{'stage':<20}{'median s':>10}{'min s':>10}{'max s':>10}{'budget s':>10}")
+        for name, times, budget in rows:
+            median = statistics.median(times)
+            self.stdout.write(f"{name:<20}{median:>10.3f}{min(times):>10.3f}{max(times):>10.3f}{budget:>10.2f}")
+            if median > budget:
+                failures.append(f"{name} took {median:.2f}s (budget {budget:.2f}s)")
+
+        if heavy:
+            failures.append(f"heavy modules imported at startup: {', '.join(heavy)}")
+        else:
+            self.stdout.write("No heavy ML modules imported at startup.")
+
+        if options['importtime']:
+            self.print_importtime(boot_script, base_dir, env)
+
+        if failures:
+            raise CommandError("Startup budget exceeded: " + "; ".join(failures))
+        self.stdout.write(self.style.SUCCESS("--- Startup within budget ---"))
+
+    def measure(self, cmd, cwd, env, runs):
+        times, output = [], ""
+        for _ in range(runs):
+            started = time.perf_counter()
+            result = subprocess.run(cmd, cwd=cwd, env=env, capture_output=True, text=True)
+            times.append(time.perf_counter() - started)
+            if result.returncode != 0:
+                raise CommandError(f"{' '.join(cmd[:3])} failed:\n{result.stderr}")
+            output = result.stdout
+        return times, output
+
+    def print_importtime(self, boot_script, cwd, env, top=15):
+        """`python -X importtime` of one worker boot, slowest (cumulative) imports first."""
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', boot_script],
+            cwd=cwd, env=env, capture_output=True, text=True,
+        )
+        rows = []
+        for line in result.stderr.splitlines():
+            # "import time:       412 |       1890 |   django.db.models"
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            self_us, cumulative_us, name = line.split(':', 1)[1].split('|')
+            rows.append((int(cumulative_us), name.strip()))
+
+        self.stdout.write("\nSlowest imports (cumulative):")
+        for cumulative_us, name in sorted(rows, reverse=True)[:top]:
+            self.stdout.write(f"{cumulative_us / 1000:>10.1f} ms  {name}")
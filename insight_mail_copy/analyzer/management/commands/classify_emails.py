@@ -0,0 +1,141 @@
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from analyzer.models import Email
+from analyzer.classification import classify_ids
+from analyzer.jobs import _iter_id_chunks
+from analyzer.model_registry import registry, MODEL_PATH
+
+CHECKPOINT_FILE = os.path.join(MODEL_PATH, 'classify_checkpoint.json')
+
+
+# The parent's DB connections, as inherited by a forked child. Kept
+# referenced: closing them (or letting them be garbage-collected) would
+# end the parent's session on the shared socket (Terminate on PostgreSQL).
+_inherited_connections = []
+
+
+def _init_worker():
+    # The parent keeps using its connection (it reads the next id chunks
+    # while we work), so the child only forgets it and opens its own
+    for conn in connections.all(initialized_only=True):
+        if conn.connection is not None:
+            _inherited_connections.append(conn.connection)
+            conn.connection = None
+
+
+def _classify_chunk(chunk):
+    return chunk[-1], classify_ids(chunk)
+
+
+class Command(BaseCommand):
+    help = ("Phase 3: classifies emails with the trained SVR, chunk by chunk. "
+            "Progress is checkpointed, so an interrupted run resumes where it stopped.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Emails per predict()/bulk_update.")
+        parser.add_argument('--workers', type=int, default=1, help="Worker processes (1 = in-process).")
+        parser.add_argument('--all', action='store_true',
+                            help="Re-classify every email (e.g. after a retrain), not only 'Unclassified' ones.")
+        parser.add_argument('--checkpoint', default=CHECKPOINT_FILE, help="Progress file.")
+        parser.add_argument('--restart', action='store_true', help="Ignore an existing checkpoint.")
+
+    def handle(self, *args, **options):
+        if registry.get_svr() is None:
+            raise CommandError("Model not found! Run train_svr.py first.")
+
+        self.checkpoint_path = options['checkpoint']
+        mode = 'all' if options['all'] else 'unclassified'
+        checkpoint = None if options['restart'] else self.load_checkpoint()
+        if checkpoint and checkpoint.get('mode') != mode:
+            checkpoint = None
+
+        last_id = checkpoint['last_id'] if checkpoint else 0
+        done = checkpoint['classified'] if checkpoint else 0
+        if last_id:
+            self.stdout.write(f"Resuming after Email #{last_id} ({done} already classified).")
+
+        emails = Email.objects.filter(id__gt=last_id)
+        if not options['all']:
+            emails = emails.filter(classification="Unclassified") # Only process new ones
+
+        total = emails.count()
+        if not total:
+            self.stdout.write("All emails are already classified!")
+            self.clear_checkpoint()
+            return
+
+        self.stdout.write(f"--- Phase 3: Classifying {total} emails ---")
+        started = time.perf_counter()
+        chunks = _iter_id_chunks(emails, options['chunk_size'])
+
+        if options['workers'] > 1:
+            done = self.run_parallel(chunks, options['workers'], mode, done)
+        else:
+            for chunk in chunks:
+                done += classify_ids(chunk)
+                self.save_checkpoint(mode, chunk[-1], done)
+                self.stdout.write(f"Processed {done} emails...")
+
+        self.clear_checkpoint()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"--- Done! Classified {done} emails in {elapsed:.1f}s ---"))
+
+    def run_parallel(self, chunks, workers, mode, done):
+        """
+        Chunks go to a process pool with a bounded number in flight. They can
+        finish out of order, so the checkpoint only advances past a chunk once
+        every chunk before it has finished too.
+        """
+        pending = deque()
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as pool:
+            for chunk in chunks:
+                pending.append(pool.submit(_classify_chunk, chunk))
+                while len(pending) >= workers * 2 or (pending and pending[0].done()):
+                    done = self.collect(pending.popleft(), mode, done)
+            while pending:
+                done = self.collect(pending.popleft(), mode, done)
+        return done
+
+    def collect(self, future, mode, done):
+        last_id, count = future.result()
+        done += count
+        self.save_checkpoint(mode, last_id, done)
+        self.stdout.write(f"Processed {done} emails...")
+        return done
+
+    # ---------------------------------------------------------
+    # CHECKPOINT
+    # ---------------------------------------------------------
+
+    def load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save_checkpoint(self, mode, last_id, classified):
+        os.makedirs(os.path.dirname(self.checkpoint_path) or '.', exist_ok=True)
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'mode': mode,
+                'last_id': last_id,
+                'classified': classified,
+                'updated_at': timezone.now().isoformat(),
+            }, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def clear_checkpoint(self):
+        try:
+            os.remove(self.checkpoint_path)
+        except FileNotFoundError:
+            pass
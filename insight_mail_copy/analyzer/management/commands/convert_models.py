@@ -0,0 +1,45 @@
+import os
+import pickle
+from django.core.management.base import BaseCommand, CommandError
+from analyzer.model_artifacts import export_regressor, load_regressor, save_regressor
+from analyzer.model_registry import MODEL_PATH, SVR_LEGACY_FILE, SVR_MODEL_FILE, registry
+
+
+class Command(BaseCommand):
+    help = ("Converts the pickled engagement model (svr_model.pkl) to the NumPy artifact format "
+            "(svr_model.npz) and checks that both give the same predictions.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model-dir', default=MODEL_PATH)
+        parser.add_argument('--remove-pickle', action='store_true', help="Delete svr_model.pkl once converted.")
+
+    def handle(self, *args, **options):
+        import numpy as np
+        legacy_path = os.path.join(options['model_dir'], SVR_LEGACY_FILE)
+        target_path = os.path.join(options['model_dir'], SVR_MODEL_FILE)
+        if not os.path.exists(legacy_path):
+            raise CommandError(f"{legacy_path} not found: nothing to convert.")
+
+        # The one place we still unpickle: a file we trained ourselves
+        with open(legacy_path, 'rb') as f:
+            model = pickle.load(f)
+        manifest, _ = export_regressor(model) # fails early on unsupported models
+        save_regressor(model, target_path)
+
+        # [Rc, Fc, T] over the ranges real threads have
+        rng = np.random.default_rng(0)
+        probe = np.column_stack([
+            rng.integers(0, 30, 500), rng.integers(0, 10, 500), rng.exponential(48.0, 500),
+        ]).astype(float)
+        error = float(np.max(np.abs(load_regressor(target_path).predict(probe) - model.predict(probe))))
+        if error > 1e-6:
+            os.remove(target_path)
+            raise CommandError(f"Converted model differs from the pickle (max error {error:.2e}); not kept.")
+
+        steps = ' -> '.join(step['op'] for step in manifest['steps'])
+        self.stdout.write(f"{SVR_LEGACY_FILE} -> {SVR_MODEL_FILE} ({steps}), max prediction error {error:.1e}")
+        if options['remove_pickle']:
+            os.remove(legacy_path)
+            self.stdout.write(f"Removed {legacy_path}")
+        registry.reload('svr')
+        self.stdout.write(self.style.SUCCESS("--- Done! Set MODEL_ALLOW_PICKLE = False to stop loading pickles. ---"))
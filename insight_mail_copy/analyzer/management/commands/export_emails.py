@@ -0,0 +1,52 @@
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from analyzer.export import EXPORT_CHUNK_SIZE, FORMATS, ExportError, export_queryset, stream_export
+
+
+class Command(BaseCommand):
+    help = ("Streams emails joined with their analysis results to CSV, NDJSON or Parquet. "
+            "Rows are read through a database cursor in chunks, so memory stays flat for any export size.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--output', '-o', help="File to write (default: stdout; required for parquet).")
+        parser.add_argument('--since', help="Received on/after this date or ISO datetime.")
+        parser.add_argument('--until', help="Received up to this date (inclusive) or before this ISO datetime.")
+        parser.add_argument('--recipient', help="Only this recipient's mail (username).")
+        parser.add_argument('--risk-min', type=int)
+        parser.add_argument('--risk-max', type=int)
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, help="Rows per fetch / write.")
+
+    def handle(self, *args, **options):
+        fmt, path = options['format'], options['output']
+        if fmt == 'parquet' and not path:
+            raise CommandError("Parquet is binary: pass --output FILE.")
+
+        try:
+            rows = export_queryset(
+                since=options['since'], until=options['until'], recipient=options['recipient'],
+                risk_min=options['risk_min'], risk_max=options['risk_max'],
+            )
+            content = stream_export(rows, fmt, chunk_size=options['chunk_size'])
+        except ExportError as exc:
+            raise CommandError(str(exc))
+
+        started = time.perf_counter()
+        written = 0
+        out = open(path, 'wb') if path else sys.stdout.buffer
+        try:
+            for data in content:
+                out.write(data)
+                written += len(data)
+        finally:
+            if path:
+                out.close()
+            else:
+                out.flush()
+
+        if path:
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(
+                f"--- Exported to {path}: {written / 1e6:.1f} MB in {elapsed:.1f}s ---"
+            ))
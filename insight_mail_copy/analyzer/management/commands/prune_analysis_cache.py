@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from analyzer.analysis_cache import ANALYSIS_CACHE_TTL_DAYS, prune
+from analyzer.model_registry import registry
+
+
+class Command(BaseCommand):
+    help = ("Deletes analysis cache rows unused for --days (run it from cron). With --stale-versions, "
+            "also every row written by models other than the ones in this checkout (once all hosts run them).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=ANALYSIS_CACHE_TTL_DAYS)
+        parser.add_argument('--stale-versions', action='store_true')
+
+    def handle(self, *args, **options):
+        keep_version = registry.fingerprint() if options['stale_versions'] else None
+        deleted = prune(options['days'], keep_version=keep_version)
+        self.stdout.write(self.style.SUCCESS(f"--- Done! {deleted} cache rows deleted. ---"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from analyzer.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recomputes the inbox rollups (dashboard counters and trends) from the Email and AnalysisResult tables (after upgrading, or after deleting rows with raw SQL)."
+
+    def handle(self, *args, **options):
+        self.stdout.write("--- Rebuilding inbox rollups ---")
+        count = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(f"--- Done! {count} rollup rows. ---"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+from analyzer.search import rebuild_search_index, is_supported
+
+
+class Command(BaseCommand):
+    help = "Refills the full-text search index (SQLite FTS5) from the Email and AnalysisResult tables."
+
+    def handle(self, *args, **options):
+        if not is_supported():
+            raise CommandError("Full-text search needs SQLite (FTS5); other databases use the fallback search.")
+        self.stdout.write("--- Rebuilding search index ---")
+        count = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"--- Done! {count} emails indexed. ---"))
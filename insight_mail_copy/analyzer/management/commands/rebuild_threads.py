@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from analyzer.threads import rebuild_threads
+
+
+class Command(BaseCommand):
+    help = ("Recomputes the EmailThread counters from the Email table (run once after upgrading, after raw SQL "
+            "deletes, or to narrow the time spans ORM deletes leave as they were).")
+
+    def handle(self, *args, **options):
+        self.stdout.write("--- Rebuilding thread features ---")
+        count = rebuild_threads()
+        self.stdout.write(self.style.SUCCESS(f"--- Done! {count} threads. ---"))
@@ -0,0 +1,98 @@
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+from analyzer.jobs import claim_jobs, run_jobs, reap_expired_jobs, VISIBILITY_TIMEOUT
+
+
+class Command(BaseCommand):
+    help = "Runs a pool of workers that drain the AnalysisJob queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help="Number of worker threads.")
+        parser.add_argument('--processes', type=int, default=1,
+                            help="Worker processes, each running --workers threads. They are forked after "
+                                 "the models are loaded, so they share one copy of them.")
+        parser.add_argument('--batch-size', type=int, default=1,
+                            help="Jobs leased per claim. Above 1, they run through the batch engine together.")
+        parser.add_argument('--visibility-timeout', type=int, default=VISIBILITY_TIMEOUT,
+                            help="Seconds before an unfinished job becomes visible to other workers again.")
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty (useful for backfills/cron).")
+        parser.add_argument('--no-warmup', action='store_true',
+                            help="Don't load the models before claiming jobs (they load on first use instead).")
+
+    def handle(self, *args, **options):
+        if not options['no_warmup']:
+            # Load every model once, up front: otherwise the first jobs of every
+            # thread pay for it, and their leases can expire while they wait.
+            from analyzer.model_registry import registry
+            timings = registry.preload_for_fork() if options['processes'] > 1 else registry.warm_up()
+            self.stdout.write(f"Models loaded in {sum(timings.values()):.1f}s")
+
+        if options['processes'] > 1:
+            self.run_processes(options)
+        else:
+            self.run_pool(options)
+
+    def run_processes(self, options):
+        """Forks the worker processes (they inherit the loaded models) and waits for them."""
+        connections.close_all() # Forked children must not share the parent's DB connection
+        context = multiprocessing.get_context('fork')
+        children = [context.Process(target=self.run_pool, args=(options,)) for _ in range(options['processes'])]
+        for child in children:
+            child.start()
+        try:
+            for child in children:
+                child.join()
+        except KeyboardInterrupt:
+            # Ctrl-C reaches the children too: they stop claiming and finish their jobs
+            for child in children:
+                child.join()
+
+    def run_pool(self, options):
+        self.stop = threading.Event()
+        base_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.stdout.write(f"🚀 Starting {options['workers']} analysis worker(s) [{base_id}]")
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            futures = [
+                pool.submit(self.worker_loop, f"{base_id}:{n}", options)
+                for n in range(options['workers'])
+            ]
+            try:
+                totals = [f.result() for f in futures]
+            except KeyboardInterrupt:
+                self.stop.set()
+                totals = [f.result() for f in futures]
+
+        done = sum(t[0] for t in totals)
+        failed = sum(t[1] for t in totals)
+        self.stdout.write(self.style.SUCCESS(f"--- Worker pool stopped. Done: {done}, Failed attempts: {failed} ---"))
+
+    def worker_loop(self, worker_id, options):
+        done, failed = 0, 0
+        while not self.stop.is_set():
+            close_old_connections()
+            reap_expired_jobs()
+            jobs = claim_jobs(worker_id, limit=options['batch_size'], visibility_timeout=options['visibility_timeout'])
+
+            if not jobs:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            for job, ok in zip(jobs, run_jobs(jobs)):
+                if ok:
+                    done += 1
+                    self.stdout.write(f"✅ [{worker_id}] Analyzed Email #{job.email_id}")
+                else:
+                    failed += 1
+                    self.stdout.write(self.style.WARNING(f"⚠️ [{worker_id}] Email #{job.email_id} failed (attempt {job.attempts})"))
+
+        close_old_connections()
+        return done, failed
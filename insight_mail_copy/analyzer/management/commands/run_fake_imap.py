@@ -0,0 +1,68 @@
+import asyncio
+import json
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from analyzer.fake_imap import FakeImapServer
+from analyzer.synthetic import CorpusGenerator
+
+
+class Command(BaseCommand):
+    help = ("Serves a fake IMAP server (any login is its own mailbox, with IDLE) for offline testing of "
+            "sync_mail_daemon. --write-accounts creates N simulated accounts for the daemon to watch.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=1143)
+        parser.add_argument('--initial', type=int, default=20, help="Messages already in each mailbox.")
+        parser.add_argument('--rate', type=float, default=2.0, help="New messages per second (all mailboxes).")
+        parser.add_argument('--login-failure-rate', type=float, default=0.0, help="Fraction of logins rejected.")
+        parser.add_argument('--write-accounts', metavar='FILE', help="Write a daemon accounts file and create its owners.")
+        parser.add_argument('--accounts', type=int, default=100, help="Simulated accounts in --write-accounts.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if options['write_accounts']:
+            self.write_accounts(options['write_accounts'], options['accounts'], options['port'])
+
+        corpus = CorpusGenerator(seed=options['seed']).messages(10 ** 12)
+
+        def next_message():
+            message = next(corpus)
+            return message['subject'], f"User {message['sender']} <user{message['sender']}@example.com>", message['body']
+
+        server = FakeImapServer(
+            next_message, initial_messages=options['initial'],
+            login_failure_rate=options['login_failure_rate'], seed=options['seed'],
+        )
+        try:
+            asyncio.run(self.serve(server, options))
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"--- {server.stats} ---")
+
+    async def serve(self, server, options):
+        port = await server.start(port=options['port'])
+        self.stdout.write(f"📮 Fake IMAP listening on 127.0.0.1:{port} (no TLS), {options['rate']} msg/s")
+        generator = asyncio.create_task(server.generate(options['rate'])) if options['rate'] > 0 else None
+        try:
+            while True:
+                await asyncio.sleep(30)
+                self.stdout.write(f"{len(server.mailboxes)} mailboxes, {server.stats}")
+        finally:
+            if generator:
+                generator.cancel()
+            await server.close()
+
+    def write_accounts(self, path, n, port):
+        names = [f"imapsim_{i:04d}" for i in range(n)]
+        existing = set(User.objects.filter(username__in=names).values_list('username', flat=True))
+        User.objects.bulk_create([
+            User(username=name, email=f"{name}@example.com", first_name='Simulated', last_name='Account')
+            for name in names if name not in existing
+        ])
+        accounts = [
+            {'owner': name, 'username': name, 'password': 'secret', 'host': '127.0.0.1', 'port': port, 'use_ssl': False}
+            for name in names
+        ]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(accounts, f, indent=1)
+        self.stdout.write(f"Wrote {n} accounts to {path}")
@@ -0,0 +1,51 @@
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = ("Serves a fake LLM endpoint for offline testing of reply generation. "
+            "Point the app at it with LLM_BACKEND=http LLM_ENDPOINT_URL=http://127.0.0.1:<port>/generate")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0.5, help="Seconds each reply takes.")
+        parser.add_argument('--jitter', type=float, default=0.2, help="Random extra latency (seconds).")
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of calls answered with HTTP 500.")
+
+    def handle(self, *args, **options):
+        stats = {'calls': 0, 'errors': 0}
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                prompt = json.loads(self.rfile.read(length) or b'{}').get('prompt', '')
+                stats['calls'] += 1
+
+                time.sleep(options['latency'] + random.uniform(0, options['jitter']))
+                if random.random() < options['error_rate']:
+                    stats['errors'] += 1
+                    self.send_response(500)
+                    self.end_headers()
+                    return
+
+                body = json.dumps({'text': f"Thanks for your email. (fake reply to a {len(prompt)}-char prompt)"})
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(body.encode('utf-8'))
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', options['port']), Handler)
+        self.stdout.write(f"🤖 Fake LLM listening on http://127.0.0.1:{options['port']}/generate")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"--- Served {stats['calls']} calls ({stats['errors']} errors) ---")
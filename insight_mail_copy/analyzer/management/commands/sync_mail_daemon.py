@@ -0,0 +1,113 @@
+import asyncio
+import json
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.core.management.base import BaseCommand, CommandError
+from analyzer.mail_sync import (
+    ACCOUNTS_FILE, HEALTH_FILE, HEALTH_INTERVAL, IDLE_REFRESH, POLL_INTERVAL, SYNC_WORKERS, SyncDaemon, load_accounts,
+)
+
+
+class Command(BaseCommand):
+    help = ("Keeps every configured mailbox in sync: one IMAP IDLE connection per account picks up new mail "
+            "within seconds, and a bounded pool runs the imports. Stop with Ctrl+C or SIGTERM.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', default=ACCOUNTS_FILE, help="JSON accounts file (see analyzer/mail_sync.py).")
+        parser.add_argument('--workers', type=int, default=SYNC_WORKERS, help="Syncs running at once.")
+        parser.add_argument('--idle-refresh', type=float, default=IDLE_REFRESH, help="Seconds before IDLE is re-issued.")
+        parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL, help="Seconds between polls without IDLE.")
+        parser.add_argument('--health-file', default=HEALTH_FILE, help="Where per-account health is written.")
+        parser.add_argument('--http-port', type=int, help="Also serve /health (JSON) and /metrics (Prometheus) on this port.")
+        parser.add_argument('--once', action='store_true', help="Sync every account once and exit (no IDLE).")
+        parser.add_argument('--status', action='store_true', help="Print the health file of a running daemon and exit.")
+
+    def handle(self, *args, **options):
+        if options['status']:
+            return self.print_status(options['health_file'])
+
+        try:
+            accounts = load_accounts(options['accounts'])
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Cannot load accounts from {options['accounts']}: {exc}")
+        if not accounts:
+            raise CommandError("No accounts configured.")
+
+        daemon = SyncDaemon(
+            accounts, workers=options['workers'], idle_refresh=options['idle_refresh'],
+            poll_interval=options['poll_interval'], health_file=options['health_file'], log=self.stdout.write,
+        )
+
+        if options['once']:
+            results = asyncio.run(daemon.sync_all())
+            failed = [key for key, result in results.items() if isinstance(result, Exception)]
+            imported = sum(result for result in results.values() if not isinstance(result, Exception))
+            self.stdout.write(self.style.SUCCESS(
+                f"--- Synced {len(accounts) - len(failed)}/{len(accounts)} accounts, {imported} new emails ---"
+            ))
+            return
+
+        if options['http_port']:
+            self.serve_http(daemon, options['http_port'])
+        self.stdout.write(f"📬 Syncing {len(accounts)} accounts with {options['workers']} workers (Ctrl+C to stop)")
+        asyncio.run(self.run(daemon))
+        s = daemon.summary()
+        self.stdout.write(self.style.SUCCESS(f"--- Stopped. {s['imported']} emails imported. ---"))
+
+    async def run(self, daemon):
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        async def progress():
+            while True:
+                await asyncio.sleep(HEALTH_INTERVAL * 6)
+                s = daemon.summary()
+                states = ", ".join(f"{n} {status}" for status, n in sorted(s['status'].items()))
+                self.stdout.write(f"{s['healthy']}/{s['accounts']} healthy ({states}); {s['imported']} imported")
+
+        reporter = asyncio.create_task(progress())
+        try:
+            await daemon.run(stop)
+        finally:
+            reporter.cancel()
+
+    def serve_http(self, daemon, port):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body, content_type = daemon.render_prometheus(), 'text/plain; version=0.0.4; charset=utf-8'
+                elif self.path == '/health':
+                    s = daemon.summary()
+                    body, content_type = json.dumps(s), 'application/json'
+                else:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.end_headers()
+                self.wfile.write(body.encode('utf-8'))
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.stdout.write(f"Health on http://127.0.0.1:{port}/health, metrics on /metrics")
+
+    def print_status(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                health = json.load(f)
+        except OSError as exc:
+            raise CommandError(f"No health file ({exc}). Is the daemon running?")
+
+        self.stdout.write(f"Updated {health['updated_at']}")
+        self.stdout.write(f"{'account':<45}{'status':<12}{'failures':>9}{'imported':>10}  last sync")
+        for key, h in sorted(health['accounts'].items()):
+            self.stdout.write(f"{key[:44]:<45}{h['status']:<12}{h['failures']:>9}{h['imported']:>10}  {h['last_sync_at'] or '-'}")
+            if h['last_error']:
+                self.stdout.write(f"    {h['last_error']}")
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from analyzer.model_registry import registry
+
+
+class Command(BaseCommand):
+    help = ("Loads the ML models (spaCy, VADER, stop words, LDA, SVR) and reports how long each took. "
+            "Useful to pre-fetch NLTK data on a new machine, or to check a deploy before it takes traffic.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help="Only these (nlp, vader, sentiment, stopwords, lda, svr). Default: all.")
+
+    def handle(self, *args, **options):
+        timings = registry.warm_up(options['models'] or None)
+        for name, seconds in timings.items():
+            self.stdout.write(f"{name:<10} {seconds:>8.2f}s")
+        self.stdout.write(self.style.SUCCESS(f"--- Models ready in {sum(timings.values()):.2f}s ---"))
@@ -0,0 +1,173 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from functools import wraps
+from django.conf import settings
+from django.db import connection
+
+# ---------------------------------------------------------
+# CONFIGURATION (override in settings.py)
+# ---------------------------------------------------------
+METRICS_ENABLED = getattr(settings, 'METRICS_ENABLED', True)
+
+# Histogram bucket upper bounds (seconds)
+# (the long ones are for queue latencies, e.g. analysis.tier2.*)
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+PREFIX = "insightmail_span"
+
+
+class _Stats:
+    """Latency histogram + counters for one span name."""
+    __slots__ = ('buckets', 'count', 'total', 'errors', 'queries')
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1) # last one is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.queries = 0
+
+
+class MetricsRegistry:
+    """
+    In-process store of span measurements.
+    Read it directly in tests (snapshot()) or scrape it at /metrics (render_prometheus()).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def observe(self, name, seconds, queries=0, error=False):
+        with self.lock:
+            s = self.stats.get(name)
+            if s is None:
+                s = self.stats[name] = _Stats()
+            s.buckets[bisect_left(BUCKETS, seconds)] += 1
+            s.count += 1
+            s.total += seconds
+            s.queries += queries
+            if error:
+                s.errors += 1
+
+    def snapshot(self):
+        """{span: {'count', 'sum', 'errors', 'db_queries', 'buckets': {le: cumulative}}}"""
+        with self.lock:
+            result = {}
+            for name, s in self.stats.items():
+                cumulative, buckets = 0, {}
+                for bound, n in zip(BUCKETS + (float('inf'),), s.buckets):
+                    cumulative += n
+                    buckets[bound] = cumulative
+                result[name] = {
+                    'count': s.count, 'sum': s.total, 'errors': s.errors,
+                    'db_queries': s.queries, 'buckets': buckets,
+                }
+            return result
+
+    def reset(self):
+        with self.lock:
+            self.stats = {}
+
+    def render_prometheus(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = [
+            f"# HELP {PREFIX}_seconds Time spent in each instrumented span.",
+            f"# TYPE {PREFIX}_seconds histogram",
+        ]
+        snap = self.snapshot()
+        for name in sorted(snap):
+            s = snap[name]
+            label = name.replace('\\', '\\\\').replace('"', '\\"')
+            for bound, n in s['buckets'].items():
+                le = "+Inf" if bound == float('inf') else repr(bound)
+                lines.append(f'{PREFIX}_seconds_bucket{{span="{label}",le="{le}"}} {n}')
+            lines.append(f'{PREFIX}_seconds_sum{{span="{label}"}} {s["sum"]}')
+            lines.append(f'{PREFIX}_seconds_count{{span="{label}"}} {s["count"]}')
+
+        for metric, key, help_text in (
+            ('errors_total', 'errors', "Spans that ended with an exception."),
+            ('db_queries_total', 'db_queries', "Database queries executed inside each span."),
+        ):
+            lines.append(f"# HELP {PREFIX}_{metric} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{metric} counter")
+            for name in sorted(snap):
+                label = name.replace('\\', '\\\\').replace('"', '\\"')
+                lines.append(f'{PREFIX}_{metric}{{span="{label}"}} {snap[name][key]}')
+
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class _Span:
+    """Times a block and counts the DB queries run inside it."""
+    __slots__ = ('name', 'started', 'queries', 'wrapper', 'failed')
+
+    def __init__(self, name):
+        self.name = name
+        self.queries = 0
+        self.failed = False
+
+    def _count(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self.wrapper = connection.execute_wrapper(self._count)
+        self.wrapper.__enter__()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        self.wrapper.__exit__(exc_type, exc, tb)
+        registry.observe(self.name, elapsed, self.queries, error=self.failed or exc_type is not None)
+        return False
+
+
+_NOOP = nullcontext()
+
+def span(name):
+    """
+    with span("analysis.lda"): ...
+    When METRICS_ENABLED is False this returns a shared no-op context manager.
+    """
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _Span(name)
+
+def timed(name):
+    """Decorator form of span()."""
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class MetricsMiddleware:
+    """Puts every request in a span named after its URL name, e.g. "view.dashboard"."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not METRICS_ENABLED:
+            return self.get_response(request)
+
+        s = _Span("view")
+        with s:
+            response = self.get_response(request)
+            match = getattr(request, 'resolver_match', None)
+            s.name = f"view.{match.url_name}" if match and match.url_name else "view.unresolved"
+            s.failed = response.status_code >= 500
+        return response
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.15 on 2026-10-18 17:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# The schema the app had before it shipped migrations (created by
+# `migrate --run-syncdb`). Databases created that way already have these
+# tables: upgrade them once with `manage.py migrate --fake-initial`.
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Email',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255)),
+                ('body', models.TextField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('is_analyzed', models.BooleanField(default=False)),
+                ('is_read', models.BooleanField(default=False)),
+                ('priority_score', models.FloatField(default=0.0)),
+                ('classification', models.CharField(default='Unclassified', max_length=20)),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='received_emails', to=settings.AUTH_USER_MODEL)),
+                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sent_emails', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AnalysisResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('summary', models.TextField()),
+                ('sentiment', models.CharField(max_length=50)),
+                ('tone', models.CharField(max_length=50)),
+                ('risk_score', models.IntegerField(default=0)),
+                ('flagged_keywords', models.CharField(blank=True, max_length=255, null=True)),
+                ('suggested_category', models.CharField(default='inquiry', max_length=50)),
+                ('suggested_reply', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('email', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='analysis', to='analyzer.email')),
+            ],
+        ),
+    ]
@@ -0,0 +1,100 @@
+import base64
+import html
+import quopri
+import re
+from email.header import decode_header
+from django.conf import settings
+
+# ---------------------------------------------------------
+# CONFIGURATION (override in settings.py)
+# ---------------------------------------------------------
+MAX_BODY_CHARS = getattr(settings, 'MAIL_MAX_BODY_CHARS', 200_000) # stored per Email.body
+MAX_PART_BYTES = getattr(settings, 'MAIL_MAX_PART_BYTES', 1_000_000) # downloaded of the body part (partial FETCH)
+ANALYSIS_MAX_CHARS = getattr(settings, 'ANALYSIS_MAX_TEXT_CHARS', 20_000) # of the body the NLP pipeline reads
+
+# ---------------------------------------------------------
+# DECODING
+# ---------------------------------------------------------
+
+WHITESPACE_BYTES_RE = re.compile(rb'\s+')
+
+def clean_encoding(encoding):
+    """
+    Helper to fix 'unknown-8bit' or None encodings.
+    """
+    if not encoding or encoding.lower() in ['unknown-8bit', 'x-user-defined']:
+        return 'utf-8'
+    return encoding
+
+def decode_subject(raw_subject):
+    """Decodes RFC 2047 '=?utf-8?...?=' fragments (Robust Fix)."""
+    if not raw_subject:
+        return "(No Subject)"
+
+    subject_parts = []
+    for text_bytes, encoding in decode_header(raw_subject):
+        if isinstance(text_bytes, bytes):
+            safe_enc = clean_encoding(encoding)
+            try:
+                subject_parts.append(text_bytes.decode(safe_enc, errors='replace'))
+            except (LookupError, UnicodeDecodeError):
+                subject_parts.append(text_bytes.decode('utf-8', errors='replace'))
+        else:
+            subject_parts.append(str(text_bytes))
+    return "".join(subject_parts)
+
+def decode_payload(payload, transfer_encoding, charset):
+    """Content-Transfer-Encoding + charset -> str"""
+    transfer_encoding = (transfer_encoding or '').lower()
+    try:
+        if transfer_encoding == 'base64':
+            # A capped read can end mid-quantum: decode the whole 4-char groups only
+            data = WHITESPACE_BYTES_RE.sub(b'', payload)
+            payload = base64.b64decode(data[:len(data) // 4 * 4])
+        elif transfer_encoding == 'quoted-printable':
+            payload = quopri.decodestring(payload)
+    except Exception:
+        pass
+
+    try:
+        return payload.decode(clean_encoding(charset), errors='replace')
+    except LookupError:
+        return payload.decode('utf-8', errors='replace')
+
+# ---------------------------------------------------------
+# TEXT
+# ---------------------------------------------------------
+
+HTML_HIDDEN_RE = re.compile(r'<(script|style|head|title|template)\b.*?</\1\s*>|<!--.*?-->', re.IGNORECASE | re.DOTALL)
+HTML_BREAK_RE = re.compile(r'<(?:br|hr|/p|/div|/tr|/h[1-6]|/ul|/ol|/table|/blockquote)\b[^>]*>', re.IGNORECASE)
+HTML_ITEM_RE = re.compile(r'<li\b[^>]*>', re.IGNORECASE)
+HTML_CELL_RE = re.compile(r'</t[dh]\s*>', re.IGNORECASE)
+HTML_TAG_RE = re.compile(r'<[^>]*>')
+SPACES_RE = re.compile(r'[ \t\r\f\v\xa0]+')
+BLANK_LINES_RE = re.compile(r'\n\s*\n\s*\n+')
+
+def html_to_text(markup):
+    """
+    Fast HTML -> plain text for HTML-only mail: drops scripts/styles/comments,
+    turns block ends into line breaks, strips tags, unescapes entities.
+    Not a renderer - just enough for the NLP steps and the preview.
+    """
+    text = HTML_HIDDEN_RE.sub(' ', markup)
+    text = HTML_BREAK_RE.sub('\n', text)
+    text = HTML_ITEM_RE.sub('\n- ', text)
+    text = HTML_CELL_RE.sub(' ', text)
+    text = html.unescape(HTML_TAG_RE.sub('', text))
+    text = SPACES_RE.sub(' ', text)
+    text = BLANK_LINES_RE.sub('\n\n', text)
+    return '\n'.join(line.strip() for line in text.split('\n')).strip()
+
+def cap_text(text, limit):
+    """text cut to at most `limit` characters, at a word boundary when one is close."""
+    if limit is None or len(text) <= limit:
+        return text
+    cut = text.rfind(' ', limit - 200, limit)
+    return text[:cut if cut > 0 else limit]
+
+def analysis_text(body):
+    """The part of a body the NLP pipeline reads (ANALYSIS_MAX_TEXT_CHARS)."""
+    return cap_text(body or '', ANALYSIS_MAX_CHARS)
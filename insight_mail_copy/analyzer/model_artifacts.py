@@ -0,0 +1,141 @@
+import json
+import os
+import zipfile
+
+# ---------------------------------------------------------
+# Portable format for the Phase 2 engagement regressor.
+# A fitted scikit-learn model (SVR, or a pipeline of StandardScaler /
+# Nystroem / LinearSVR) is stored as plain NumPy arrays plus a JSON
+# manifest in one .npz file. Loading it runs no pickle code (safe to read
+# from anywhere), does not import scikit-learn (fast, small), and
+# prediction is a few NumPy operations.
+# ---------------------------------------------------------
+
+FORMAT_VERSION = 1
+
+
+class ArtifactError(ValueError):
+    """A model that cannot be exported, or a file that is not a valid artifact."""
+
+
+# ---------------------------------------------------------
+# EXPORT (needs the fitted scikit-learn model, so only at training time)
+# ---------------------------------------------------------
+
+def _export_step(estimator, n_features):
+    """One estimator -> (manifest step, {array name: array})."""
+    import numpy as np
+    name = type(estimator).__name__
+
+    if name == 'StandardScaler':
+        mean = estimator.mean_ if estimator.mean_ is not None else np.zeros(n_features)
+        scale = estimator.scale_ if estimator.scale_ is not None else np.ones(n_features)
+        return {'op': 'scale'}, {'mean': mean, 'scale': scale}
+
+    if name == 'Nystroem':
+        if estimator.kernel != 'rbf':
+            raise ArtifactError(f"Nystroem kernel '{estimator.kernel}' is not supported (rbf only).")
+        # gamma=None means 1 / n_features in sklearn's rbf_kernel
+        gamma = estimator.gamma if estimator.gamma is not None else 1.0 / estimator.components_.shape[1]
+        return {'op': 'nystroem', 'gamma': float(gamma)}, {
+            'components': estimator.components_, 'normalization': estimator.normalization_,
+        }
+
+    if name in ('SVR', 'LinearSVR'):
+        kernel = getattr(estimator, 'kernel', 'linear')
+        if kernel == 'rbf':
+            return {'op': 'rbf_svr', 'gamma': float(estimator._gamma)}, {
+                'support_vectors': estimator.support_vectors_,
+                'dual_coef': estimator.dual_coef_.ravel(),
+                'intercept': np.asarray(estimator.intercept_).ravel(),
+            }
+        if kernel == 'linear':
+            return {'op': 'linear'}, {
+                'coef': np.asarray(estimator.coef_).ravel(), 'intercept': np.asarray(estimator.intercept_).ravel(),
+            }
+        raise ArtifactError(f"SVR kernel '{kernel}' is not supported (rbf or linear).")
+
+    raise ArtifactError(f"Cannot export a {name}.")
+
+def export_regressor(model):
+    """Fitted estimator or Pipeline -> (manifest, {array name: array})."""
+    import numpy as np
+    estimators = [step for _, step in model.steps] if hasattr(model, 'steps') else [model]
+    n_features = int(getattr(estimators[0], 'n_features_in_', 3))
+
+    manifest = {'format_version': FORMAT_VERSION, 'n_features': n_features, 'steps': []}
+    arrays = {}
+    for i, estimator in enumerate(estimators):
+        step, step_arrays = _export_step(estimator, n_features)
+        step['arrays'] = sorted(step_arrays)
+        manifest['steps'].append(step)
+        for name, array in step_arrays.items():
+            arrays[f'{i}.{name}'] = np.ascontiguousarray(array, dtype=np.float64)
+    return manifest, arrays
+
+def save_regressor(model, path):
+    """
+    Writes the artifact to a temp file and renames it into place, so
+    running workers (which hot-reload the model) never read a half-written file.
+    """
+    import numpy as np
+    manifest, arrays = export_regressor(model)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f: # a file object: np.savez would append '.npz' to a name
+        np.savez(f, manifest=np.array(json.dumps(manifest)), **arrays)
+    os.replace(tmp_path, path)
+
+# ---------------------------------------------------------
+# LOAD + PREDICT (NumPy only)
+# ---------------------------------------------------------
+
+def _rbf(X, centers, gamma):
+    """exp(-gamma * ||x - c||^2) for every row of X and every center (same expansion as sklearn)."""
+    import numpy as np
+    distances = (X * X).sum(axis=1)[:, None] + (centers * centers).sum(axis=1)[None, :] - 2.0 * (X @ centers.T)
+    np.maximum(distances, 0, out=distances)
+    return np.exp(-gamma * distances)
+
+
+class Regressor:
+    """The loaded artifact. predict() matches the scikit-learn model it was exported from."""
+
+    def __init__(self, manifest, arrays):
+        self.manifest = manifest
+        self.n_features = manifest['n_features']
+        self.steps = [
+            (step, {name: arrays[f'{i}.{name}'] for name in step['arrays']})
+            for i, step in enumerate(manifest['steps'])
+        ]
+
+    def predict(self, X):
+        import numpy as np
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.n_features)
+        for step, a in self.steps:
+            op = step['op']
+            if op == 'scale':
+                X = (X - a['mean']) / a['scale']
+            elif op == 'nystroem':
+                X = _rbf(X, a['components'], step['gamma']) @ a['normalization'].T
+            elif op == 'rbf_svr':
+                return _rbf(X, a['support_vectors'], step['gamma']) @ a['dual_coef'] + a['intercept'][0]
+            elif op == 'linear':
+                return X @ a['coef'] + a['intercept'][0]
+        raise ArtifactError("Artifact has no final regressor step.")
+
+    def __repr__(self):
+        return f"Regressor({' -> '.join(step['op'] for step, _ in self.steps)})"
+
+
+def load_regressor(path):
+    """.npz written by save_regressor -> Regressor. Never unpickles anything."""
+    import numpy as np
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            manifest = json.loads(str(data['manifest']))
+            arrays = {name: data[name] for name in data.files if name != 'manifest'}
+    except (KeyError, ValueError, zipfile.BadZipFile) as e:
+        raise ArtifactError(f"{path} is not a regressor artifact: {e}")
+    if manifest.get('format_version') != FORMAT_VERSION:
+        raise ArtifactError(f"{path}: unsupported format version {manifest.get('format_version')}.")
+    return Regressor(manifest, arrays)
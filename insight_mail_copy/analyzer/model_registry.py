@@ -0,0 +1,303 @@
+import gc
+import hashlib
+import os
+import pickle
+import threading
+import time
+from django.conf import settings
+
+# Global paths for saving ML models
+MODEL_PATH = os.path.join(settings.BASE_DIR, 'ml_models')
+
+LDA_DICT_FILE = 'lda_dict.gensim'
+LDA_MODEL_FILE = 'lda_model.gensim'
+# train_ml.py publishes every LDA version into its own folder under lda/,
+# then names that folder in lda_current (one atomic rename). Installs from
+# before that have the two files above directly in ml_models/.
+LDA_VERSIONS_DIR = 'lda'
+LDA_CURRENT_FILE = 'lda_current'
+SVR_MODEL_FILE = 'svr_model.npz' # NumPy arrays + JSON manifest, see model_artifacts.py
+SVR_LEGACY_FILE = 'svr_model.pkl' # pickled scikit-learn model (before the .npz format)
+
+# How often (seconds) we stat() the artifact files to look for a retrain
+CHECK_INTERVAL = getattr(settings, 'MODEL_REGISTRY_CHECK_INTERVAL', 5.0)
+
+# Memory-map the large LDA arrays read-only: processes forked from one
+# parent (or started on the same files) share those pages instead of each
+# holding a private copy
+MODEL_MMAP = getattr(settings, 'MODEL_MMAP', True)
+
+# Load svr_model.pkl when there is no svr_model.npz yet. Unpickling runs
+# code from the file: turn off once `manage.py convert_models` has run.
+MODEL_ALLOW_PICKLE = getattr(settings, 'MODEL_ALLOW_PICKLE', True)
+
+# NLTK data the pipeline needs: (resource path for nltk.data.find, download id)
+NLTK_RESOURCES = (
+    ('corpora/stopwords', 'stopwords'),
+    ('sentiment/vader_lexicon.zip', 'vader_lexicon'),
+)
+
+
+def ensure_nltk_data(resources=NLTK_RESOURCES):
+    """Downloads NLTK data only if it is missing (a local lookup otherwise, no network)."""
+    import nltk
+    for path, package in resources:
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            nltk.download(package, quiet=True)
+
+
+def lda_paths(model_dir=MODEL_PATH):
+    """(dictionary path, model path) of the published LDA version."""
+    try:
+        with open(os.path.join(model_dir, LDA_CURRENT_FILE)) as f:
+            folder = os.path.join(model_dir, LDA_VERSIONS_DIR, f.read().strip())
+    except FileNotFoundError:
+        folder = model_dir
+    return os.path.join(folder, LDA_DICT_FILE), os.path.join(folder, LDA_MODEL_FILE)
+
+
+def content_digest(paths):
+    """sha256 of the files' contents: the same trained artifacts give the same digest on every host."""
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        digest.update(os.path.basename(path).encode('utf-8') + b'\0')
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+class _Slot:
+    """
+    One loaded artifact plus the version (file mtimes/sizes) it was loaded
+    from and, for file-backed models, a digest of the files' contents.
+    The (value, version, digest) triple is replaced as a whole, so readers
+    never see a new model paired with an old version or half of an update.
+    File-backed loaders return (value, paths of the files they read).
+    """
+    def __init__(self, loader, files=()):
+        self.loader = loader
+        self.files = files
+        self.state = None # (value, version, digest)
+        self.last_check = 0.0
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of the ML artifacts used by the analysis pipeline.
+
+    - Each model is loaded lazily, once, on first use.
+    - File-backed models (LDA, SVR) are re-checked every CHECK_INTERVAL seconds;
+      when train_ml.py / train_svr.py write new files the model is reloaded
+      and swapped in. If the reload fails (e.g. files half-written) we keep
+      serving the old model and try again on the next check.
+    - With mmap, the LDA arrays are read-only mappings of the .npy files.
+      Retrains publish new files with os.replace, so a mapping of the old
+      file stays valid until the reload swaps it out.
+    """
+
+    def __init__(self, model_dir=MODEL_PATH, check_interval=CHECK_INTERVAL, mmap=MODEL_MMAP,
+                 svr_files=(SVR_MODEL_FILE, SVR_LEGACY_FILE)):
+        self.model_dir = model_dir
+        self.check_interval = check_interval
+        self.mmap = mmap
+        self._slots = {
+            'nlp': _Slot(self._load_spacy),
+            'vader': _Slot(self._load_vader),
+            'sentiment': _Slot(self._load_sentiment),
+            'stopwords': _Slot(self._load_stopwords),
+            'lda': _Slot(self._load_lda, files=(LDA_CURRENT_FILE, LDA_DICT_FILE, LDA_MODEL_FILE)),
+            'svr': _Slot(self._load_svr, files=tuple(svr_files)), # first existing file wins
+        }
+
+    # ---------------------------------------------------------
+    # PUBLIC ACCESSORS
+    # ---------------------------------------------------------
+
+    def get_spacy_nlp(self):
+        """spacy.Language for en_core_web_sm."""
+        return self._get('nlp')
+
+    def get_vader(self):
+        """nltk SentimentIntensityAnalyzer."""
+        return self._get('vader')
+
+    def get_sentiment_scorer(self):
+        """analyzer.sentiment.VaderScorer (batch VADER, same scores as get_vader())."""
+        return self._get('sentiment')
+
+    def get_stopwords(self):
+        """frozenset of English stop words."""
+        return self._get('stopwords')
+
+    def get_lda(self):
+        """(gensim Dictionary, LdaModel) or (None, None) if not trained yet."""
+        return self._get('lda') or (None, None)
+
+    def get_svr(self):
+        """Fitted regressor (anything with predict()), or None if not trained yet."""
+        return self._get('svr')
+
+    def versions(self):
+        """Version stamp of every loaded artifact, e.g. {'svr': ((mtime_ns, size),)}."""
+        return {name: slot.state[1] for name, slot in self._slots.items() if slot.state}
+
+    def fingerprint(self):
+        """
+        Short hash of the contents of the trained artifacts in use (LDA + SVR).
+        Identical files give the identical fingerprint on every host and
+        checkout, so it can be baked into cache keys shared through the
+        database. The digests are computed when a model (re)loads; this only
+        combines them.
+        """
+        digests = []
+        for name in ('lda', 'svr'):
+            self._get(name) # loads, or reloads after a retrain
+            digests.append(self._slots[name].state[2])
+        return hashlib.sha256(repr(digests).encode('utf-8')).hexdigest()[:16]
+
+    def warm_up(self, names=None):
+        """
+        Loads models now instead of on the first email (all of them if names
+        is None). Call it in worker processes before they take traffic, e.g.
+        `manage.py warm_models`, a gunicorn post_fork hook, or the analysis
+        worker's startup. Returns {name: seconds taken}.
+        """
+        timings = {}
+        for name in names or list(self._slots):
+            started = time.perf_counter()
+            self._get(name)
+            timings[name] = time.perf_counter() - started
+        return timings
+
+    def preload_for_fork(self, names=None):
+        """
+        warm_up() for a parent process that is about to fork its workers
+        (run_analysis_worker --processes, gunicorn with preload_app). The
+        children inherit the loaded models copy-on-write instead of each
+        loading their own. gc.freeze() moves everything allocated so far out
+        of the collector's reach, so garbage collections in the children do
+        not write to (and so un-share) those pages. Returns {name: seconds}.
+        """
+        timings = self.warm_up(names)
+        gc.collect()
+        gc.freeze()
+        return timings
+
+    def reload(self, name=None):
+        """Forces the next access to re-check the files (all models if name is None)."""
+        names = [name] if name else list(self._slots)
+        for n in names:
+            self._slots[n].last_check = 0.0
+
+    # ---------------------------------------------------------
+    # INTERNALS
+    # ---------------------------------------------------------
+
+    def _path(self, filename):
+        return os.path.join(self.model_dir, filename)
+
+    def _file_version(self, files):
+        version = []
+        for filename in files:
+            try:
+                st = os.stat(self._path(filename))
+                version.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                version.append(None)
+        return tuple(version)
+
+    def _get(self, name):
+        slot = self._slots[name]
+        state = slot.state
+
+        # Fast path: already loaded and not due for a file check
+        if state is not None and (not slot.files or time.monotonic() - slot.last_check < self.check_interval):
+            return state[0]
+
+        with slot.lock:
+            state = slot.state
+            if state is not None and not slot.files:
+                return state[0]
+
+            slot.last_check = time.monotonic()
+            version = self._file_version(slot.files)
+            if state is not None and state[1] == version:
+                return state[0]
+
+            try:
+                value, digest = slot.loader(), None
+                if slot.files:
+                    value, paths = value
+                    digest = content_digest(paths)
+            except Exception as e:
+                if state is not None:
+                    print(f"⚠️ Model '{name}' reload failed, keeping previous version: {e}")
+                    return state[0]
+                raise
+
+            slot.state = (value, version, digest) # Atomic swap
+            return value
+
+    # ---------------------------------------------------------
+    # LOADERS
+    # ---------------------------------------------------------
+
+    def _load_spacy(self):
+        import spacy
+        return spacy.load("en_core_web_sm")
+
+    def _load_vader(self):
+        ensure_nltk_data()
+        from nltk.sentiment.vader import SentimentIntensityAnalyzer
+        return SentimentIntensityAnalyzer()
+
+    def _load_sentiment(self):
+        from .sentiment import VaderScorer
+        return VaderScorer(self.get_vader().lexicon)
+
+    def _load_stopwords(self):
+        ensure_nltk_data()
+        from nltk.corpus import stopwords
+        return frozenset(stopwords.words('english'))
+
+    def _load_lda(self):
+        dict_path, model_path = lda_paths(self.model_dir)
+        if not (os.path.exists(dict_path) and os.path.exists(model_path)):
+            return None, []
+        import gensim
+        from gensim import corpora
+        dictionary = corpora.Dictionary.load(dict_path)
+        # mmap='r' maps the arrays gensim stored as separate .npy files
+        # (expElogbeta, and sstats when large) instead of reading them in
+        lda_model = gensim.models.LdaModel.load(model_path, mmap='r' if self.mmap else None)
+        # The model's arrays and state live in side files (lda_model.gensim.*)
+        folder = os.path.dirname(model_path)
+        prefix = os.path.basename(model_path) + '.'
+        paths = [dict_path, model_path] + [os.path.join(folder, n) for n in os.listdir(folder) if n.startswith(prefix)]
+        return (dictionary, lda_model), paths
+
+    def _load_svr(self):
+        for filename in self._slots['svr'].files:
+            path = self._path(filename)
+            if not os.path.exists(path):
+                continue
+            if filename.endswith('.npz'):
+                from .model_artifacts import load_regressor
+                return load_regressor(path), [path]
+            if not MODEL_ALLOW_PICKLE:
+                print(f"⚠️ Ignoring {filename}: pickled models are disabled (MODEL_ALLOW_PICKLE). Run convert_models.")
+                continue
+            try:
+                with open(path, 'rb') as f:
+                    return pickle.load(f), [path]
+            except EOFError:
+                return None, []
+        return None, []
+
+
+# The one registry every module in this process shares
+registry = ModelRegistry()
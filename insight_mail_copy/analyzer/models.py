@@ -1,7 +1,17 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class Email(models.Model):
+    ANALYSIS_PENDING = 'pending'
+    ANALYSIS_DONE = 'done'
+    ANALYSIS_FAILED = 'failed'
+    ANALYSIS_STATUS_CHOICES = [
+        (ANALYSIS_PENDING, 'Analysis pending'),
+        (ANALYSIS_DONE, 'Analysis done'),
+        (ANALYSIS_FAILED, 'Analysis failed'),
+    ]
+
     # Link to the actual User accounts
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_emails')
     recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_emails')
@@ -11,9 +21,21 @@ class Email(models.Model):
     received_at = models.DateTimeField(auto_now_add=True)
     
     is_analyzed = models.BooleanField(default=False)
+    analysis_status = models.CharField(max_length=10, choices=ANALYSIS_STATUS_CHOICES, default=ANALYSIS_PENDING)
     is_read = models.BooleanField(default=False)
     priority_score = models.FloatField(default=0.0) # The raw AI score (0.0 to 1.0)
     classification = models.CharField(max_length=20, default="Unclassified") # The human label
+
+    class Meta:
+        indexes = [
+            # Inbox / sent box pages: WHERE recipient|sender = ? ORDER BY received_at DESC, id DESC
+            models.Index(fields=['recipient', '-received_at', '-id'], name='email_inbox_idx'),
+            models.Index(fields=['sender', '-received_at', '-id'], name='email_sent_idx'),
+            # Conversation history: both directions of a sender/recipient pair, newest first
+            models.Index(fields=['sender', 'recipient', '-received_at'], name='email_pair_idx'),
+            # classify_emails: WHERE classification = 'Unclassified' AND id > ? ORDER BY id
+            models.Index(fields=['classification', 'id'], name='email_classification_idx'),
+        ]
     
     def __str__(self):
         return f"{self.sender} -> {self.recipient}: {self.subject}"
@@ -30,3 +52,126 @@ class AnalysisResult(models.Model):
     
 
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # High-risk counters/filters (risk_score > 50); email_id makes it covering for the join
+            models.Index(fields=['risk_score', 'email'], name='analysis_risk_idx'),
+        ]
+
+class AnalysisCacheEntry(models.Model):
+    """
+    Memoized engine output for one piece of content (see analysis_cache.py).
+    Identical newsletters / notifications hit this instead of re-running
+    spaCy, VADER, LDA and the LLM. model_version is the ML artifacts'
+    fingerprint at write time; `manage.py prune_analysis_cache` expires rows.
+    """
+    key = models.CharField(max_length=64, unique=True) # sha256 hex
+    model_version = models.CharField(max_length=16, db_index=True)
+    result = models.JSONField() # the analysis dict (AnalysisResult fields)
+
+    hits = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.key[:12]}… ({self.hits} hits)"
+
+class AnalysisJob(models.Model):
+    """
+    One queued run of the analysis pipeline for an Email.
+    Workers claim jobs by taking a lease (locked_until); if a worker dies
+    the lease expires and another worker picks the job up again.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    email = models.ForeignKey(Email, on_delete=models.CASCADE, related_name='analysis_jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    priority = models.IntegerField(default=0) # Tier-1 triage score (0-100), higher runs first
+
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now) # Pushed forward on retry (backoff)
+    locked_until = models.DateTimeField(null=True, blank=True) # Visibility timeout of the current lease
+    locked_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+            models.Index(fields=['status', '-priority', 'run_after'], name='analysisjob_claim_order'),
+        ]
+
+    def __str__(self):
+        return f"Job #{self.id} for Email #{self.email_id} ({self.status})"
+
+class EmailThread(models.Model):
+    """
+    Running engagement counters for one conversation (Phase 2 features).
+    Keyed on the normalized root subject ("Re: Fwd: Invoice" -> "invoice")
+    and updated on every Email insert and delete, so reading a thread's
+    features is a single indexed lookup.
+    """
+    root_subject = models.CharField(max_length=255, unique=True)
+
+    message_count = models.IntegerField(default=0)
+    reply_count = models.IntegerField(default=0) # Rc: subjects starting with "Re:"
+    forward_count = models.IntegerField(default=0) # Fc: subjects starting with "Fwd:"
+    first_received_at = models.DateTimeField()
+    last_received_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.root_subject} ({self.message_count} messages)"
+
+class InboxRollup(models.Model):
+    """
+    Count of one recipient's mail on one day for one dimension value, e.g.
+    (alice, 2024-05-01, 'category', 'complaint') -> 12. Kept current by
+    rollups.py on every Email / AnalysisResult write and delete, so dashboard counters
+    and trends are a read of a few rows, not a scan of the mailbox.
+    """
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='inbox_rollups')
+    day = models.DateField() # local date the email was received
+    dimension = models.CharField(max_length=20) # 'total', 'risk', 'category', 'sentiment', 'tone'
+    value = models.CharField(max_length=50, blank=True)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['recipient', 'dimension', 'day', 'value'], name='inbox_rollup_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.recipient_id} {self.day} {self.dimension}={self.value}: {self.count}"
+
+class MailboxSyncState(models.Model):
+    """
+    IMAP checkpoint for one (user, account, mailbox).
+    UIDs only grow while UIDVALIDITY stays the same, so "everything above
+    last_uid" is exactly the mail we have not imported yet.
+    """
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='mailbox_states')
+    account = models.CharField(max_length=254) # e.g. "someone@gmail.com@imap.gmail.com"
+    mailbox = models.CharField(max_length=255, default="INBOX")
+
+    uidvalidity = models.BigIntegerField(null=True, blank=True)
+    last_uid = models.BigIntegerField(default=0)
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('owner', 'account', 'mailbox')
+
+    def __str__(self):
+        return f"{self.account}/{self.mailbox} @ UID {self.last_uid}"
@@ -0,0 +1,180 @@
+import hashlib
+import json
+import random
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+
+# ---------------------------------------------------------
+# CONFIGURATION (override in settings.py)
+# ---------------------------------------------------------
+LLM_BACKEND = getattr(settings, 'LLM_BACKEND', 'gemini') # 'gemini', 'http' or 'static'
+LLM_MODEL_NAME = getattr(settings, 'LLM_MODEL_NAME', 'models/gemini-2.0-flash')
+LLM_ENDPOINT_URL = getattr(settings, 'LLM_ENDPOINT_URL', 'http://127.0.0.1:8765/generate')
+LLM_MAX_CONCURRENCY = getattr(settings, 'LLM_MAX_CONCURRENCY', 4)
+LLM_RATE_PER_SEC = getattr(settings, 'LLM_RATE_PER_SEC', 5.0)
+LLM_BURST = getattr(settings, 'LLM_BURST', 10)
+LLM_TIMEOUT = getattr(settings, 'LLM_TIMEOUT', 20.0) # seconds per call
+LLM_MAX_RETRIES = getattr(settings, 'LLM_MAX_RETRIES', 2)
+LLM_CACHE_TIMEOUT = getattr(settings, 'LLM_CACHE_TIMEOUT', 7 * 24 * 3600) # seconds
+
+# ---------------------------------------------------------
+# BACKENDS: prompt in, text out (raise on failure)
+# ---------------------------------------------------------
+
+class GeminiBackend:
+    """Google Gemini. One GenerativeModel, reused for every call."""
+    def __init__(self, model_name=LLM_MODEL_NAME, api_key=None):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key or getattr(settings, 'GOOGLE_API_KEY', None))
+        self.name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    def generate(self, prompt, timeout):
+        response = self.model.generate_content(prompt, request_options={'timeout': timeout})
+        return response.text.strip()
+
+class HTTPBackend:
+    """
+    Any endpoint that takes {"prompt": "..."} and answers {"text": "..."}.
+    Used with `manage.py run_fake_llm` to test throughput offline.
+    """
+    def __init__(self, url=LLM_ENDPOINT_URL):
+        self.name = url
+        self.url = url
+
+    def generate(self, prompt, timeout):
+        request = urllib.request.Request(
+            self.url, data=json.dumps({'prompt': prompt}).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+        )
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read().decode('utf-8'))['text'].strip()
+
+class StaticBackend:
+    """Answers instantly with a fixed text. For benchmarks and tests (no network)."""
+    name = 'static'
+
+    def __init__(self, text="Thanks, we are looking into it."):
+        self.text = text
+
+    def generate(self, prompt, timeout):
+        return self.text
+
+# ---------------------------------------------------------
+# RATE LIMITING
+# ---------------------------------------------------------
+
+class TokenBucket:
+    """Allows `rate` calls per second on average, with bursts up to `capacity`."""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# ---------------------------------------------------------
+# SERVICE
+# ---------------------------------------------------------
+
+class ReplyService:
+    """
+    Reply generation with:
+    - at most max_concurrency backend calls in flight, whether they come
+      through the pool (submit / generate_many) or straight from generate(),
+    - a token-bucket rate limit shared by the whole process,
+    - a timeout per call and retries with exponential backoff + jitter,
+    - a cache keyed on a hash of (model, prompt), so identical prompts are paid for once.
+    On final failure the caller's fallback text is returned (and not cached).
+    """
+
+    def __init__(self, backend, max_concurrency=LLM_MAX_CONCURRENCY, rate_per_sec=LLM_RATE_PER_SEC,
+                 burst=LLM_BURST, timeout=LLM_TIMEOUT, max_retries=LLM_MAX_RETRIES,
+                 cache_timeout=LLM_CACHE_TIMEOUT):
+        self.backend = backend
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.cache_timeout = cache_timeout
+        self.bucket = TokenBucket(rate_per_sec, burst)
+        self.slots = threading.BoundedSemaphore(max_concurrency) # shared by pool threads and direct callers
+        self.pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='llm')
+
+    def cache_key(self, prompt):
+        digest = hashlib.sha256(f"{self.backend.name}\n{prompt}".encode('utf-8')).hexdigest()
+        return f"llm-reply:{digest}"
+
+    def submit(self, prompt, fallback=""):
+        """Returns a Future whose result() is the reply text."""
+        return self.pool.submit(self.generate, prompt, fallback)
+
+    def generate_many(self, prompts, fallbacks=None):
+        """Runs many prompts concurrently; results come back in the same order."""
+        fallbacks = fallbacks or [""] * len(prompts)
+        futures = [self.submit(p, f) for p, f in zip(prompts, fallbacks)]
+        return [f.result() for f in futures]
+
+    def generate(self, prompt, fallback=""):
+        """Blocking call for one prompt (cache -> rate limit -> backend, with retries)."""
+        key = self.cache_key(prompt)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                with self.slots:
+                    text = self.backend.generate(prompt, self.timeout)
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    print(f"⚠️ LLM call failed after {attempt + 1} attempts: {e}")
+                    return fallback
+                # Full jitter: sleep somewhere in [0, 0.5s * 2^attempt]
+                time.sleep(random.uniform(0, 0.5 * (2 ** attempt)))
+                continue
+
+            cache.set(key, text, self.cache_timeout)
+            return text
+        return fallback
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_reply_service():
+    """The process-wide ReplyService, built from settings on first use."""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                if LLM_BACKEND == 'http':
+                    backend = HTTPBackend()
+                elif LLM_BACKEND == 'static':
+                    backend = StaticBackend()
+                else:
+                    backend = GeminiBackend()
+                _service = ReplyService(backend)
+    return _service
+
+def set_reply_service(service):
+    """Swaps the process-wide service (e.g. a StaticBackend one in benchmarks). Returns the old one."""
+    global _service
+    with _service_lock:
+        old, _service = _service, service
+    return old
@@ -0,0 +1,166 @@
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from .models import Email, InboxRollup
+
+# ---------------------------------------------------------
+# CONFIGURATION (override in settings.py)
+# ---------------------------------------------------------
+TREND_DAYS = getattr(settings, 'DASHBOARD_TREND_DAYS', 14)
+
+# Same cut-off as the dashboard's "high risk" counter
+HIGH_RISK_THRESHOLD = 50
+
+# rollup dimension -> AnalysisResult field
+ANALYSIS_DIMENSIONS = {
+    'category': 'suggested_category',
+    'sentiment': 'sentiment',
+    'tone': 'tone',
+}
+# What record_analyses needs to know about an analysis
+ROLLUP_FIELDS = ['risk_score'] + list(ANALYSIS_DIMENSIONS.values())
+
+# ---------------------------------------------------------
+# KEYS: (recipient_id, day, dimension, value)
+# ---------------------------------------------------------
+
+def local_day(moment):
+    return timezone.localdate(moment) if timezone.is_aware(moment) else moment.date()
+
+def _analysis_keys(recipient_id, day, values):
+    """values: {AnalysisResult field: value} -> the rollup keys one analysis counts towards."""
+    keys = [
+        (recipient_id, day, dimension, str(values[field] or '')[:50])
+        for dimension, field in ANALYSIS_DIMENSIONS.items()
+    ]
+    if values['risk_score'] > HIGH_RISK_THRESHOLD:
+        keys.append((recipient_id, day, 'risk', 'high'))
+    return keys
+
+def apply_deltas(deltas):
+    """
+    Adds {key: n} to the rollup rows (creating missing ones), in one
+    transaction. Relative UPDATEs, so concurrent writers never lose counts;
+    keys are visited in sorted order so two writers cannot deadlock.
+    """
+    deltas = {key: n for key, n in deltas.items() if n}
+    if not deltas:
+        return
+    with transaction.atomic():
+        InboxRollup.objects.bulk_create([
+            InboxRollup(recipient_id=recipient_id, day=day, dimension=dimension, value=value)
+            for recipient_id, day, dimension, value in deltas
+        ], ignore_conflicts=True)
+        for (recipient_id, day, dimension, value), n in sorted(deltas.items()):
+            InboxRollup.objects.filter(
+                recipient_id=recipient_id, day=day, dimension=dimension, value=value
+            ).update(count=F('count') + n)
+
+# ---------------------------------------------------------
+# WRITE PATHS
+# ---------------------------------------------------------
+
+def record_emails(email_objs):
+    """New Emails (post_save for single inserts; bulk inserters call it themselves)."""
+    apply_deltas(Counter(
+        (e.recipient_id, local_day(e.received_at), 'total', '') for e in email_objs
+    ))
+
+def record_email(email_obj):
+    record_emails([email_obj])
+
+def record_analyses(changes):
+    """
+    changes: [(email_obj, old values or None, new values)], values being
+    {AnalysisResult field: value}. A re-analysis moves the email from its
+    old category/sentiment/tone/risk buckets to the new ones.
+    """
+    deltas = Counter()
+    for email_obj, old, new in changes:
+        day = local_day(email_obj.received_at)
+        if old is not None:
+            deltas.subtract(_analysis_keys(email_obj.recipient_id, day, old))
+        deltas.update(_analysis_keys(email_obj.recipient_id, day, new))
+    apply_deltas(deltas)
+
+def forget_email(email_obj):
+    """A deleted Email (post_delete) leaves the 'total' counter."""
+    apply_deltas({(email_obj.recipient_id, local_day(email_obj.received_at), 'total', ''): -1})
+
+def forget_analysis(email_obj, values):
+    """A deleted AnalysisResult (post_delete, also when its Email is deleted) leaves its buckets."""
+    keys = _analysis_keys(email_obj.recipient_id, local_day(email_obj.received_at), values)
+    apply_deltas({key: -1 for key in keys})
+
+# ---------------------------------------------------------
+# READ PATH
+# ---------------------------------------------------------
+
+def dashboard_stats(user, days=TREND_DAYS):
+    """
+    Everything the dashboard shows about a mailbox, in two queries whatever
+    its size: all-time counters per dimension, and daily totals / high-risk
+    counts for the last `days` days (oldest first, missing days as 0).
+    """
+    totals = {}
+    for row in InboxRollup.objects.filter(recipient=user).values('dimension', 'value').annotate(n=Sum('count')):
+        totals.setdefault(row['dimension'], {})[row['value']] = row['n']
+
+    today = timezone.localdate()
+    since = today - timedelta(days=days - 1)
+    per_day = {}
+    for day, dimension, count in InboxRollup.objects.filter(
+        recipient=user, dimension__in=('total', 'risk'), day__gte=since
+    ).values_list('day', 'dimension', 'count'):
+        per_day[(day, dimension)] = count
+
+    trend = []
+    for i in range(days):
+        day = since + timedelta(days=i)
+        trend.append({'day': day, 'total': per_day.get((day, 'total'), 0), 'high_risk': per_day.get((day, 'risk'), 0)})
+    peak = max([point['total'] for point in trend] + [1])
+    for point in trend:
+        point['height'] = round(100 * point['total'] / peak) # bar height in %
+
+    def top(dimension):
+        return sorted(totals.get(dimension, {}).items(), key=lambda item: -item[1])
+
+    return {
+        'total': totals.get('total', {}).get('', 0),
+        'high_risk': totals.get('risk', {}).get('high', 0),
+        'by_category': top('category'),
+        'by_sentiment': top('sentiment'),
+        'by_tone': top('tone'),
+        'trend': trend,
+    }
+
+# ---------------------------------------------------------
+# REBUILD
+# ---------------------------------------------------------
+
+def rebuild_rollups(chunk_size=2000):
+    """
+    Recomputes the whole rollup table from Email + AnalysisResult in one
+    streaming pass (for existing data, or after raw SQL deletes). Returns the number of rows.
+    """
+    fields = ['recipient_id', 'received_at'] + [f'analysis__{field}' for field in ROLLUP_FIELDS]
+    counts = Counter()
+    for row in Email.objects.values_list(*fields).iterator(chunk_size=chunk_size):
+        recipient_id, received_at = row[:2]
+        day = local_day(received_at)
+        counts[(recipient_id, day, 'total', '')] += 1
+        values = dict(zip(ROLLUP_FIELDS, row[2:]))
+        if values['risk_score'] is not None: # analyzed
+            counts.update(_analysis_keys(recipient_id, day, values))
+
+    rows = [
+        InboxRollup(recipient_id=recipient_id, day=day, dimension=dimension, value=value, count=n)
+        for (recipient_id, day, dimension, value), n in counts.items()
+    ]
+    with transaction.atomic():
+        InboxRollup.objects.all().delete()
+        InboxRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
@@ -0,0 +1,194 @@
+import re
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+from .models import Email
+
+# ---------------------------------------------------------
+# FULL-TEXT INDEX (SQLite FTS5)
+# ---------------------------------------------------------
+# One row per Email (rowid = email id) holding the text we search:
+# subject/body from analyzer_email, summary/keywords/category from
+# analyzer_analysisresult. Triggers keep it in sync, so every write path
+# (save(), bulk_create, .update(), raw SQL) is covered, not only signals.
+
+FTS_TABLE = 'analyzer_email_fts'
+
+# bm25 column weights: a hit in the subject or flagged keywords counts more than one in the body
+RANK_WEIGHTS = (5.0, 1.0, 2.0, 3.0, 2.0) # subject, body, summary, flagged_keywords, category
+
+SEARCH_PAGE_SIZE = 20
+
+# Snippet markers: control characters that never appear in stored text, swapped for <mark> after escaping
+_MARK_START, _MARK_END = '\x02', '\x03'
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        subject, body, summary, flagged_keywords, category,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+
+    # Email rows
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_email_ai AFTER INSERT ON analyzer_email BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, subject, body, summary, flagged_keywords, category)
+        VALUES (new.id, new.subject, new.body, '', '', '');
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_email_au AFTER UPDATE OF subject, body ON analyzer_email BEGIN
+        UPDATE {FTS_TABLE} SET subject = new.subject, body = new.body WHERE rowid = new.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_email_ad AFTER DELETE ON analyzer_email BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END""",
+
+    # AnalysisResult rows (one per email)
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_analysis_ai AFTER INSERT ON analyzer_analysisresult BEGIN
+        UPDATE {FTS_TABLE}
+        SET summary = new.summary, flagged_keywords = coalesce(new.flagged_keywords, ''), category = new.suggested_category
+        WHERE rowid = new.email_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_analysis_au AFTER UPDATE ON analyzer_analysisresult BEGIN
+        UPDATE {FTS_TABLE}
+        SET summary = new.summary, flagged_keywords = coalesce(new.flagged_keywords, ''), category = new.suggested_category
+        WHERE rowid = new.email_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_analysis_ad AFTER DELETE ON analyzer_analysisresult BEGIN
+        UPDATE {FTS_TABLE} SET summary = '', flagged_keywords = '', category = '' WHERE rowid = old.email_id;
+    END""",
+]
+
+def is_supported(using=DEFAULT_DB_ALIAS):
+    return connections[using].vendor == 'sqlite'
+
+def install_search_index(using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Creates the FTS table and triggers if missing (idempotent).
+    Hooked to post_migrate, so `migrate` and test databases get it too.
+    Does nothing on databases other than SQLite.
+    """
+    if not is_supported(using):
+        return
+    with connections[using].cursor() as cursor:
+        for statement in SCHEMA:
+            cursor.execute(statement)
+
+def rebuild_search_index(using=DEFAULT_DB_ALIAS):
+    """Refills the index from the tables (after a restore, or for rows older than the triggers)."""
+    install_search_index(using)
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(f"""
+            INSERT INTO {FTS_TABLE}(rowid, subject, body, summary, flagged_keywords, category)
+            SELECT e.id, e.subject, e.body,
+                   coalesce(a.summary, ''), coalesce(a.flagged_keywords, ''), coalesce(a.suggested_category, '')
+            FROM analyzer_email e LEFT JOIN analyzer_analysisresult a ON a.email_id = e.id
+        """)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f"SELECT count(*) FROM {FTS_TABLE}")
+        return cursor.fetchone()[0]
+
+# ---------------------------------------------------------
+# QUERYING
+# ---------------------------------------------------------
+
+def to_match_query(text):
+    """
+    User input -> safe FTS5 query: every word must match, the last one as a
+    prefix (search-as-you-type). Quotes/operators typed by the user are
+    treated as plain text, so input can never be an FTS syntax error.
+    Returns '' when there is nothing to search for.
+    """
+    terms = TERM_RE.findall(text or '')
+    if not terms:
+        return ''
+    quoted = [f'"{t}"' for t in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+def _render_snippet(raw):
+    return mark_safe(escape(raw or '').replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>'))
+
+def search_emails(user, text, risk_min=None, risk_max=None, sentiment=None, category=None,
+                  page=1, page_size=SEARCH_PAGE_SIZE, using=DEFAULT_DB_ALIAS):
+    """
+    Ranked search over the user's mailbox (sent or received).
+    Returns (hits, has_next) where hits is a list of
+    {'email': Email, 'rank': float, 'snippet': safe HTML}.
+    """
+    page = max(1, page)
+    filters = {
+        'risk_min': risk_min, 'risk_max': risk_max,
+        'sentiment': sentiment, 'category': category,
+    }
+    if not is_supported(using):
+        return _search_fallback(user, text, filters, page, page_size)
+
+    match = to_match_query(text)
+    if not match:
+        return [], False
+
+    where = [f"{FTS_TABLE} MATCH %s", "(e.recipient_id = %s OR e.sender_id = %s)"]
+    params = [match, user.id, user.id]
+    if risk_min is not None:
+        where.append("a.risk_score >= %s")
+        params.append(risk_min)
+    if risk_max is not None:
+        where.append("a.risk_score <= %s")
+        params.append(risk_max)
+    if sentiment:
+        where.append("a.sentiment = %s")
+        params.append(sentiment)
+    if category:
+        where.append("a.suggested_category = %s")
+        params.append(category)
+
+    weights = ', '.join(str(w) for w in RANK_WEIGHTS)
+    sql = f"""
+        SELECT {FTS_TABLE}.rowid, bm25({FTS_TABLE}, {weights}) AS score,
+               snippet({FTS_TABLE}, -1, '{_MARK_START}', '{_MARK_END}', '…', 16)
+        FROM {FTS_TABLE}
+        JOIN analyzer_email e ON e.id = {FTS_TABLE}.rowid
+        LEFT JOIN analyzer_analysisresult a ON a.email_id = e.id
+        WHERE {' AND '.join(where)}
+        ORDER BY score
+        LIMIT %s OFFSET %s
+    """
+    # One row more than the page tells us whether there is a next page
+    params += [page_size + 1, (page - 1) * page_size]
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    has_next = len(rows) > page_size
+    rows = rows[:page_size]
+    emails = Email.objects.using(using).select_related('sender', 'recipient', 'analysis').in_bulk(
+        [row[0] for row in rows]
+    )
+    hits = [
+        {'email': emails[email_id], 'rank': rank, 'snippet': _render_snippet(snippet)}
+        for email_id, rank, snippet in rows if email_id in emails
+    ]
+    return hits, has_next
+
+def _search_fallback(user, text, filters, page, page_size):
+    """Non-SQLite databases: unranked icontains scan, newest first (same result shape)."""
+    emails = Email.objects.filter(Q(recipient=user) | Q(sender=user))
+    for term in TERM_RE.findall(text or ''):
+        emails = emails.filter(Q(subject__icontains=term) | Q(body__icontains=term))
+    if filters['risk_min'] is not None:
+        emails = emails.filter(analysis__risk_score__gte=filters['risk_min'])
+    if filters['risk_max'] is not None:
+        emails = emails.filter(analysis__risk_score__lte=filters['risk_max'])
+    if filters['sentiment']:
+        emails = emails.filter(analysis__sentiment=filters['sentiment'])
+    if filters['category']:
+        emails = emails.filter(analysis__suggested_category=filters['category'])
+
+    start = (page - 1) * page_size
+    rows = list(
+        emails.select_related('sender', 'recipient', 'analysis').order_by('-received_at', '-id')[start:start + page_size + 1]
+    )
+    hits = [{'email': e, 'rank': 0.0, 'snippet': escape(e.body[:200])} for e in rows[:page_size]]
+    return hits, len(rows) > page_size
@@ -0,0 +1,299 @@
+import re
+import string
+
+# ---------------------------------------------------------
+# Batch VADER. Same rules, constants and lexicon as NLTK's
+# SentimentIntensityAnalyzer, but a batch of texts is scored with NumPy:
+# texts are tokenized in one pass into flat token-id arrays (Python only
+# touches each distinct token once), and the rules (capitals, boosters,
+# negations, "never so", idioms, "least", "but", punctuation emphasis)
+# run as array operations over the lexicon words of all texts at once.
+#
+# Tolerance: polarity_scores_batch() returns NLTK's dict, rounded like
+# NLTK (compound to 4 decimals). Checked against NLTK with
+# `manage.py bench_sentiment`; the scores agree within COMPOUND_TOLERANCE
+# (one unit in the last rounded place, from float summation order).
+# ---------------------------------------------------------
+
+COMPOUND_TOLERANCE = 1e-4
+
+# Labels used throughout the pipeline
+POSITIVE_THRESHOLD = 0.05
+NEGATIVE_THRESHOLD = -0.05
+
+PUNCTUATION = string.punctuation
+HAS_PUNCTUATION = re.compile(f"[{re.escape(PUNCTUATION)}]").search
+ALPHA = 15 # VADER's normalization constant
+
+# Words the rules look at by name
+SPECIAL_WORDS = ('least', 'at', 'very', 'never', 'so', 'this', 'but', 'kind', 'of')
+
+
+class VaderScorer:
+    """
+    Compiled VADER lexicon. lexicon: {word: valence}, e.g. the one NLTK's
+    analyzer loaded (SentimentIntensityAnalyzer().lexicon).
+    """
+
+    def __init__(self, lexicon):
+        import numpy as np
+        from nltk.sentiment.vader import VaderConstants
+        c = self.constants = VaderConstants
+
+        phrase_words = {w for phrase in list(c.SPECIAL_CASE_IDIOMS) + list(c.BOOSTER_DICT) for w in phrase.split()}
+        words = sorted(set(lexicon) | set(c.BOOSTER_DICT) | c.NEGATE | set(SPECIAL_WORDS) | phrase_words)
+        self.ids = {word: i for i, word in enumerate(words, 1)} # 0 = any other token
+        size = len(words) + 1
+
+        self.valence = np.zeros(size)
+        self.in_lexicon = np.zeros(size, dtype=bool)
+        self.booster = np.zeros(size)
+        self.is_booster = np.zeros(size, dtype=bool)
+        self.negation = np.zeros(size, dtype=bool)
+        for word, i in self.ids.items():
+            if word in lexicon:
+                self.valence[i], self.in_lexicon[i] = lexicon[word], True
+            if word in c.BOOSTER_DICT:
+                self.booster[i], self.is_booster[i] = c.BOOSTER_DICT[word], True
+            self.negation[i] = word in c.NEGATE
+        self.special = {word: self.ids[word] for word in SPECIAL_WORDS}
+
+        # Idioms and multi-word boosters as tuples of ids (they match lowercase tokens only)
+        self.idioms = [(tuple(self.ids[w] for w in phrase.split()), value) for phrase, value in c.SPECIAL_CASE_IDIOMS.items()]
+        self.phrase_boosters = [tuple(self.ids[w] for w in phrase.split()) for phrase in c.BOOSTER_DICT if ' ' in phrase]
+        self.punctuation_list = frozenset(c.PUNC_LIST)
+
+    @classmethod
+    def from_nltk(cls, analyzer=None):
+        if analyzer is None:
+            from nltk.sentiment.vader import SentimentIntensityAnalyzer
+            analyzer = SentimentIntensityAnalyzer()
+        return cls(analyzer.lexicon)
+
+    # ---------------------------------------------------------
+    # TOKENIZING
+    # ---------------------------------------------------------
+
+    def _token(self, token):
+        """NLTK's words_and_emoticons: one leading or trailing PUNC_LIST item is dropped from a word."""
+        if token[0] in PUNCTUATION:
+            core = token.lstrip(PUNCTUATION)
+            lead = token[:len(token) - len(core)]
+        elif token[-1] in PUNCTUATION:
+            core = token.rstrip(PUNCTUATION)
+            lead = token[len(core):]
+        else:
+            return token
+        if len(core) > 1 and lead in self.punctuation_list and not HAS_PUNCTUATION(core):
+            return core
+        return token
+
+    def _tokenize(self, texts):
+        """
+        Flat token arrays for the whole batch. Text is only handled per text
+        (split, counts) and per distinct token (normalizing, lookups); each
+        token occurrence is just an index into the distinct-token tables.
+        """
+        import numpy as np
+        raw, raw_lengths, amplifiers = [], [], []
+        for text in texts:
+            if not isinstance(text, str):
+                text = '' if text is None else str(text)
+            words = text.split()
+            raw.extend(words)
+            raw_lengths.append(len(words))
+            # Punctuation emphasis (_amplify_ep + _amplify_qm)
+            questions = text.count("?")
+            amplifiers.append(min(text.count("!"), 4) * 0.292 + (
+                0 if questions <= 1 else questions * 0.18 if questions <= 3 else 0.96
+            ))
+
+        distinct = list(dict.fromkeys(raw))
+        codes = np.fromiter(map({word: i for i, word in enumerate(distinct)}.__getitem__, raw), dtype=np.int64, count=len(raw))
+
+        # Per distinct raw token
+        get = self.ids.get
+        keep, ids, upper, lowercase, negated, norm = [], [], [], [], [], []
+        norm_codes = {}
+        for word in distinct:
+            token = self._token(word) if len(word) > 1 else word
+            low = token.lower()
+            keep.append(len(word) > 1)
+            ids.append(get(low, 0))
+            upper.append(token.isupper())
+            lowercase.append(token == low)
+            negated.append("n't" in low)
+            norm.append(norm_codes.setdefault(token, len(norm_codes)))
+
+        doc = np.repeat(np.arange(len(raw_lengths)), raw_lengths)
+        kept = np.array(keep, dtype=bool)[codes]
+        codes, doc = codes[kept], doc[kept]
+        ids = np.array(ids, dtype=np.int64)
+        return {
+            'ids': ids[codes],
+            'upper': np.array(upper, dtype=bool)[codes],
+            'lowercase': np.array(lowercase, dtype=bool)[codes],
+            'negated': (np.array(negated, dtype=bool) | self.negation[ids])[codes],
+            'norm': np.array(norm, dtype=np.int64)[codes],
+            'n_norm': max(len(norm_codes), 1),
+            'doc': doc,
+            'lengths': np.bincount(doc, minlength=len(raw_lengths)),
+            'amplifiers': np.array(amplifiers),
+        }
+
+    # ---------------------------------------------------------
+    # SCORING
+    # ---------------------------------------------------------
+
+    def polarity_scores_batch(self, texts):
+        """[{'neg', 'neu', 'pos', 'compound'}, ...] - what NLTK's polarity_scores gives for each text."""
+        import numpy as np
+        t = self._tokenize(texts)
+        ids, upper, doc, lengths = t['ids'], t['upper'], t['doc'], t['lengths']
+        n_docs = len(lengths)
+        if not n_docs:
+            return []
+        position = np.arange(len(ids)) - (np.cumsum(lengths) - lengths)[doc] # index of the token in its text
+        caps = np.bincount(doc, weights=upper, minlength=n_docs)
+        cap_diff = (caps > 0) & (caps < lengths) # some, but not all, tokens in capitals
+
+        # Only lexicon words get a valence (boosters never do). NLTK scores every
+        # occurrence of a token in the context of its first occurrence in the
+        # text, so the rules run once per (text, token), at that first position.
+        scored = np.flatnonzero(self.in_lexicon[ids] & ~self.is_booster[ids])
+        keys = doc[scored] * t['n_norm'] + t['norm'][scored]
+        _, first, occurrence = np.unique(keys, return_index=True, return_inverse=True)
+        rows = scored[first]
+        valence = self._valence(rows, t, position, lengths[doc[rows]], cap_diff[doc[rows]])
+
+        sentiments = valence[occurrence.ravel()]
+        sentiment_doc, sentiment_position = doc[scored], position[scored]
+
+        # "but": everything before it counts half, everything after 1.5x
+        but = np.full(n_docs, -1)
+        is_but = np.flatnonzero(ids == self.special['but'])[::-1] # reversed: the first "but" of a text is written last
+        but[doc[is_but]] = position[is_but]
+        but = but[sentiment_doc]
+        sentiments = np.where(but < 0, sentiments, np.where(
+            sentiment_position < but, sentiments * 0.5,
+            np.where(sentiment_position > but, sentiments * 1.5, sentiments)
+        ))
+
+        return self._summarize(sentiments, sentiment_doc, n_docs, lengths, t['amplifiers'])
+
+    def _valence(self, rows, t, position, length, cap_diff):
+        """sentiment_valence() of the tokens at rows (lexicon words, first occurrences)."""
+        import numpy as np
+        c = self.constants
+        ids, upper, negated = t['ids'], t['upper'], t['negated']
+        exact = np.where(t['lowercase'], ids, -1) # ids of tokens written in lowercase (idioms, "never so")
+        here = position[rows]
+
+        def at(values, offset, fill):
+            """values of the token `offset` places from each row (fill outside its text)."""
+            inside = (here + offset >= 0) & (here + offset < length)
+            return np.where(inside, values[np.clip(rows + offset, 0, len(values) - 1)], fill)
+
+        def is_word(offset, *words):
+            found = at(exact, offset, -1)
+            return np.isin(found, [self.special[w] for w in words])
+
+        valence = self.valence[ids[rows]]
+        shout = upper[rows] & cap_diff
+        valence = np.where(shout, np.where(valence > 0, valence + c.C_INCR, valence - c.C_INCR), valence)
+
+        # The three preceding tokens: boosters, then negations ("never so/this" emphasizes instead)
+        for s in range(3):
+            k = s + 1
+            prev = at(ids, -k, 0)
+            cond = (here >= k) & ~self.in_lexicon[prev]
+            scalar = self.booster[prev]
+            scalar = np.where(valence < 0, -scalar, scalar)
+            boosted_caps = self.is_booster[prev] & at(upper, -k, False) & cap_diff
+            scalar = np.where(boosted_caps, np.where(valence > 0, scalar + c.C_INCR, scalar - c.C_INCR), scalar)
+            scalar *= (1.0, 0.95, 0.9)[s]
+            valence = np.where(cond, valence + scalar, valence)
+
+            negation = cond & at(negated, -k, False)
+            if s == 0:
+                valence = np.where(negation, valence * c.N_SCALAR, valence)
+            else:
+                if s == 1:
+                    emphasis = is_word(-2, 'never') & is_word(-1, 'so', 'this')
+                else:
+                    emphasis = (is_word(-3, 'never') & is_word(-2, 'so', 'this')) | is_word(-1, 'so', 'this')
+                factor = 1.5 if s == 1 else 1.25
+                valence = np.where(cond & emphasis, valence * factor,
+                                   np.where(negation, valence * c.N_SCALAR, valence))
+            if s == 2:
+                valence = np.where(cond, self._idioms(valence, lambda offset: at(exact, offset, -1)), valence)
+
+        # "least" (but not "at least" / "very least") negates
+        least = (at(ids, -1, 0) == self.special['least']) & ~self.in_lexicon[self.special['least']]
+        before_least = at(ids, -2, 0)
+        at_very = (before_least == self.special['at']) | (before_least == self.special['very'])
+        valence = np.where(least & (((here > 1) & ~at_very) | (here == 1)), valence * c.N_SCALAR, valence)
+
+        # "kind" followed by "of" is skipped like a booster
+        kind_of = (ids[rows] == self.special['kind']) & (at(ids, 1, 0) == self.special['of'])
+        return np.where(kind_of, 0.0, valence)
+
+    def _idioms(self, valence, word_at):
+        """_idioms_check: word_at(offset) -> lowercase token ids at that offset from each row."""
+        import numpy as np
+        c = self.constants
+        words = {offset: word_at(offset) for offset in (-3, -2, -1, 0, 1, 2)}
+
+        def matches(offsets, phrase):
+            if len(offsets) != len(phrase):
+                return False
+            hit = True
+            for offset, word in zip(offsets, phrase):
+                hit = hit & (words[offset] == word)
+            return hit
+
+        # The first matching preceding sequence wins; sequences through the following tokens override it
+        new = valence
+        preceding = [(-1, 0), (-2, -1, 0), (-2, -1), (-3, -2, -1), (-3, -2)]
+        for offsets in reversed(preceding):
+            for phrase, value in self.idioms:
+                new = np.where(matches(offsets, phrase), value, new)
+        for offsets in [(0, 1), (0, 1, 2)]:
+            for phrase, value in self.idioms:
+                new = np.where(matches(offsets, phrase), value, new)
+        for offsets in [(-3, -2), (-2, -1)]:
+            for phrase in self.phrase_boosters:
+                new = np.where(matches(offsets, phrase), new + c.B_DECR, new)
+        return new
+
+    def _summarize(self, sentiments, doc, n_docs, lengths, amplifiers):
+        """score_valence for every text at once (tokens missing from sentiments scored 0)."""
+        import numpy as np
+        total = np.bincount(doc, weights=sentiments, minlength=n_docs)
+        total = np.where(total > 0, total + amplifiers, np.where(total < 0, total - amplifiers, total))
+        compound = total / np.sqrt(total * total + ALPHA)
+
+        pos_sum = np.bincount(doc, weights=np.where(sentiments > 0, sentiments + 1, 0.0), minlength=n_docs)
+        neg_sum = np.bincount(doc, weights=np.where(sentiments < 0, sentiments - 1, 0.0), minlength=n_docs)
+        neu_count = lengths - np.bincount(doc, weights=sentiments != 0, minlength=n_docs)
+        pos_sum, neg_sum = (np.where(pos_sum > -neg_sum, pos_sum + amplifiers, pos_sum),
+                            np.where(pos_sum < -neg_sum, neg_sum - amplifiers, neg_sum))
+        grand = np.maximum(pos_sum - neg_sum + neu_count, 1e-12)
+
+        results = []
+        rows = zip(compound.tolist(), (pos_sum / grand).tolist(), (-neg_sum / grand).tolist(),
+                   (neu_count / grand).tolist(), lengths.tolist())
+        for comp, pos, neg, neu, n in rows:
+            if not n:
+                results.append({'neg': 0.0, 'neu': 0.0, 'pos': 0.0, 'compound': 0.0})
+            else:
+                results.append({'neg': round(abs(neg), 3), 'neu': round(abs(neu), 3),
+                                'pos': round(abs(pos), 3), 'compound': round(comp, 4)})
+        return results
+
+    def compound_batch(self, texts):
+        """Compound score of each text (-1 .. 1)."""
+        return [scores['compound'] for scores in self.polarity_scores_batch(texts)]
+
+    def polarity_scores(self, text):
+        return self.polarity_scores_batch([text])[0]
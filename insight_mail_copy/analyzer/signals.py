@@ -1,48 +1,32 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from django.db.models import Q
 from .models import Email, AnalysisResult
-from .ai_engine import analyze_email_content
+from .jobs import enqueue_analysis
+from .threads import record_email, forget_email as leave_thread
+from . import rollups
 
 @receiver(post_save, sender=Email)
 def auto_analyze_email(sender, instance, created, **kwargs):
     if created:
-        print(f"⚡ Analyzing for: {instance.recipient.username}...")
-        
-        # 1. FETCH HISTORY
-        previous_emails = Email.objects.filter(
-            (Q(sender=instance.sender) & Q(recipient=instance.recipient)) |
-            (Q(sender=instance.recipient) & Q(recipient=instance.sender))
-        ).exclude(id=instance.id).order_by('-received_at')[:3]
+        # Keep the thread counters (Rc, Fc, T) current. Runs before the job is
+        # queued so the analysis sees this email in its thread.
+        record_email(instance)
+        rollups.record_email(instance) # dashboard counters
 
-        history_data = [{'sender': e.sender.username, 'body': e.body} for e in previous_emails]
-        
-        # 2. GET USER NAME
-        if instance.recipient.first_name:
-            my_name = f"{instance.recipient.first_name} {instance.recipient.last_name}"
-        else:
-            my_name = instance.recipient.username
+        # Only queue the work here. The heavy pipeline (spaCy, VADER, LDA, SVR, Gemini)
+        # runs in `python manage.py run_analysis_worker`, so inserts stay fast.
+        # on_commit: workers must not see the job before the Email row is visible.
+        transaction.on_commit(lambda: enqueue_analysis(instance))
 
-        # --- FIX IS HERE ---
-        # OLD: analyze_email_content(instance.subject, instance.body, history=..., agent_name=...)
-        # NEW: Just pass 'instance'
-        
-        analysis_data = analyze_email_content(
-            instance,                 # <--- ONLY PASS THE OBJECT
-            history=history_data, 
-            agent_name=my_name
-        )
-        
-        # 4. SAVE RESULT
-        AnalysisResult.objects.create(
-            email=instance,
-            summary=analysis_data['summary'],
-            sentiment=analysis_data['sentiment'],
-            tone=analysis_data['tone'],
-            risk_score=analysis_data['risk_score'],
-            suggested_category=analysis_data['suggested_category'],
-            suggested_reply=analysis_data['suggested_reply']
-        )
-        
-        instance.is_analyzed = True
-        instance.save(update_fields=['is_analyzed'])
\ No newline at end of file
+@receiver(post_delete, sender=AnalysisResult)
+def forget_analysis(sender, instance, **kwargs):
+    # Runs before the Email's own post_delete when the Email is deleted (cascade)
+    rollups.forget_analysis(instance.email, {field: getattr(instance, field) for field in rollups.ROLLUP_FIELDS})
+
+@receiver(post_delete, sender=Email)
+def forget_email(sender, instance, **kwargs):
+    # Only deletes through the ORM (admin, queryset.delete()) are seen: after raw SQL,
+    # run rebuild_rollups and rebuild_threads
+    leave_thread(instance)
+    rollups.forget_email(instance)
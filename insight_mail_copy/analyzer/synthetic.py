@@ -0,0 +1,166 @@
+import random
+from django.contrib.auth.models import User
+from django.db import transaction
+from .models import Email
+from .keywords import DANGER_KEYWORDS, COMPLAINT_KEYWORDS, FINANCE_KEYWORDS
+from .threads import record_emails
+from . import rollups
+
+# ---------------------------------------------------------
+# Seeded synthetic mail for benchmarks.
+# Same seed -> same corpus, so numbers are comparable between runs.
+# ---------------------------------------------------------
+
+FILLER = (
+    "please find the update below regarding our last call we discussed the timeline "
+    "for the next phase and the team agreed to review the document before friday "
+    "let me know if you have any questions about the plan or the attached notes "
+    "thanks again for your help with the project and looking forward to hearing back"
+).split()
+
+TOPICS = ["Invoice", "Order", "Login problem", "Meeting", "Contract renewal", "Delivery",
+          "Account access", "Quarterly report", "Support ticket", "Refund request"]
+
+ASPECT_SENTENCES = [
+    "The support agent was rude.", "The delivery was fast.", "The price is expensive.",
+    "The app is buggy.", "The service was great.", "The website is slow.",
+    "The staff were friendly.", "The package arrived broken.",
+]
+
+BROADCAST_SUBJECTS = ["Weekly newsletter", "Your monthly digest", "Product updates", "Webinar invitation"]
+
+KINDS = ('short', 'long', 'html', 'broadcast', 'reply_chain')
+
+
+class CorpusGenerator:
+    """
+    Generates emails of five shapes:
+    short (one or two lines), long (several paragraphs), html (tag soup),
+    broadcast (identical newsletter bodies) and reply_chain (a root message
+    followed by "Re:" / "Fwd:" replies quoting it).
+    """
+
+    def __init__(self, seed=42, n_users=50, mix=None):
+        self.rng = random.Random(seed)
+        self.n_users = n_users
+        # Relative frequency of each shape
+        self.mix = mix or {'short': 35, 'long': 15, 'html': 15, 'broadcast': 15, 'reply_chain': 20}
+        self.thread_no = 0
+
+    # --- text helpers ---
+
+    def _words(self, n):
+        return " ".join(self.rng.choice(FILLER) for _ in range(n))
+
+    def _keyword_sprinkle(self):
+        # Roughly a third of mail carries a lexicon hit, a few carry danger words
+        roll = self.rng.random()
+        if roll < 0.05:
+            return f" This is a {self.rng.choice(DANGER_KEYWORDS)} matter."
+        if roll < 0.20:
+            return f" There is a {self.rng.choice(COMPLAINT_KEYWORDS)} with my order."
+        if roll < 0.35:
+            return f" Please check the {self.rng.choice(FINANCE_KEYWORDS)}."
+        return ""
+
+    def _paragraph(self, sentences):
+        parts = []
+        for _ in range(sentences):
+            if self.rng.random() < 0.3:
+                parts.append(self.rng.choice(ASPECT_SENTENCES))
+            else:
+                parts.append(self._words(self.rng.randint(8, 20)).capitalize() + ".")
+        return " ".join(parts) + self._keyword_sprinkle()
+
+    # --- message shapes ---
+
+    def short(self):
+        return f"{self.rng.choice(TOPICS)} #{self.rng.randint(1, 9999)}", self._paragraph(2)
+
+    def long(self):
+        body = "\n\n".join(self._paragraph(self.rng.randint(5, 12)) for _ in range(self.rng.randint(4, 10)))
+        return f"{self.rng.choice(TOPICS)} #{self.rng.randint(1, 9999)}", body
+
+    def html(self):
+        paragraphs = "".join(f"<p style=\"margin:0\">{self._paragraph(4)}</p>" for _ in range(self.rng.randint(2, 6)))
+        body = f"<html><body><table><tr><td>{paragraphs}</td></tr></table></body></html>"
+        return f"{self.rng.choice(TOPICS)} #{self.rng.randint(1, 9999)}", body
+
+    def broadcast(self):
+        subject = self.rng.choice(BROADCAST_SUBJECTS)
+        # Same body for every copy of a given newsletter
+        body = f"{subject}: " + " ".join(FILLER[:40]) + " Unsubscribe at any time."
+        return subject, body
+
+    def reply_chain(self):
+        """Returns a list of (subject, body) making one conversation."""
+        self.thread_no += 1
+        root = f"{self.rng.choice(TOPICS)} thread {self.thread_no}"
+        body = self._paragraph(3)
+        messages = [(root, body)]
+        for _ in range(self.rng.randint(1, 6)):
+            prefix = "Fwd: " if self.rng.random() < 0.15 else "Re: "
+            reply = self._paragraph(2) + "\n\n> " + body[:200]
+            messages.append((prefix + root, reply))
+        return messages
+
+    def messages(self, n):
+        """Yields n dicts: {kind, subject, body, sender, recipient} (user indexes)."""
+        kinds = list(self.mix)
+        weights = [self.mix[k] for k in kinds]
+        produced = 0
+        while produced < n:
+            kind = self.rng.choices(kinds, weights)[0]
+            a, b = self.rng.sample(range(self.n_users), 2)
+
+            if kind == 'reply_chain':
+                for i, (subject, body) in enumerate(self.reply_chain()):
+                    if produced >= n:
+                        break
+                    sender, recipient = (a, b) if i % 2 == 0 else (b, a)
+                    yield {'kind': kind, 'subject': subject, 'body': body, 'sender': sender, 'recipient': recipient}
+                    produced += 1
+                continue
+
+            subject, body = getattr(self, kind)()
+            yield {'kind': kind, 'subject': subject, 'body': body, 'sender': a, 'recipient': b}
+            produced += 1
+
+    # --- database ---
+
+    def users(self):
+        """The synthetic accounts, created on first use."""
+        names = [f"synthetic_user_{i}" for i in range(self.n_users)]
+        existing = set(User.objects.filter(username__in=names).values_list('username', flat=True))
+        User.objects.bulk_create([
+            User(username=name, email=f"{name}@example.com", first_name='Synthetic', last_name=str(i))
+            for i, name in enumerate(names) if name not in existing
+        ])
+        by_name = {u.username: u for u in User.objects.filter(username__in=names)}
+        return [by_name[name] for name in names]
+
+    def populate(self, n, batch_size=5000):
+        """
+        Inserts n emails with bulk_create (no analysis jobs are queued)
+        and updates the thread counters and inbox rollups. Returns the number inserted.
+        """
+        users = self.users()
+        batch, total = [], 0
+        for message in self.messages(n):
+            batch.append(Email(
+                sender=users[message['sender']], recipient=users[message['recipient']],
+                subject=message['subject'][:255], body=message['body'],
+            ))
+            if len(batch) >= batch_size:
+                total += self._insert(batch)
+                batch = []
+        if batch:
+            total += self._insert(batch)
+        return total
+
+    def _insert(self, batch):
+        with transaction.atomic():
+            created = Email.objects.bulk_create(batch)
+            record_emails(created)
+            rollups.record_emails(created)
+        return len(created)
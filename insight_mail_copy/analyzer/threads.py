@@ -0,0 +1,115 @@
+import re
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Least, Greatest
+from .models import Email, EmailThread
+
+# Leading "Re:", "Fwd:", "Fw:" (any case, repeated) are not part of the conversation's subject
+PREFIX_RE = re.compile(r'^\s*((re|fwd?)\s*:\s*)+', re.IGNORECASE)
+SPACES_RE = re.compile(r'\s+')
+
+def normalize_subject(subject):
+    """'Re: FWD:  Invoice  #42' -> 'invoice #42'"""
+    root = PREFIX_RE.sub('', subject or '')
+    return SPACES_RE.sub(' ', root).strip().lower()[:255]
+
+def is_reply(subject):
+    return (subject or '')[:3].lower() == 're:'
+
+def is_forward(subject):
+    return (subject or '')[:4].lower() == 'fwd:'
+
+def _apply(root_subject, messages, replies, forwards, first_at, last_at):
+    """Adds one batch of counts to a thread row (creating it if needed)."""
+    thread, created = EmailThread.objects.get_or_create(
+        root_subject=root_subject,
+        defaults={
+            'message_count': messages,
+            'reply_count': replies,
+            'forward_count': forwards,
+            'first_received_at': first_at,
+            'last_received_at': last_at,
+        }
+    )
+    if created:
+        return
+
+    # Relative UPDATE: safe when several workers insert into the same thread at once
+    EmailThread.objects.filter(pk=thread.pk).update(
+        message_count=F('message_count') + messages,
+        reply_count=F('reply_count') + replies,
+        forward_count=F('forward_count') + forwards,
+        first_received_at=Least('first_received_at', Value(first_at)),
+        last_received_at=Greatest('last_received_at', Value(last_at)),
+    )
+
+def record_email(email_obj):
+    """Called once per inserted Email (see signals.py)."""
+    _apply(
+        normalize_subject(email_obj.subject), 1,
+        int(is_reply(email_obj.subject)), int(is_forward(email_obj.subject)),
+        email_obj.received_at, email_obj.received_at,
+    )
+
+def forget_email(email_obj):
+    """
+    Called once per deleted Email (see signals.py): it leaves its thread's
+    counters, and the thread row goes with its last message. The time span
+    is not narrowed (that needs the thread's other emails, and Email.subject
+    is not indexed): rebuild_threads recomputes it.
+    """
+    root_subject = normalize_subject(email_obj.subject)
+    with transaction.atomic():
+        EmailThread.objects.filter(root_subject=root_subject).update(
+            message_count=F('message_count') - 1,
+            reply_count=F('reply_count') - int(is_reply(email_obj.subject)),
+            forward_count=F('forward_count') - int(is_forward(email_obj.subject)),
+        )
+        EmailThread.objects.filter(root_subject=root_subject, message_count__lte=0).delete()
+
+def _group(rows):
+    """(subject, received_at) rows -> {root: [messages, replies, forwards, first, last]}"""
+    groups = {}
+    for subject, received_at in rows:
+        root_subject = normalize_subject(subject)
+        g = groups.get(root_subject)
+        if g is None:
+            groups[root_subject] = [1, int(is_reply(subject)), int(is_forward(subject)), received_at, received_at]
+            continue
+        g[0] += 1
+        g[1] += is_reply(subject)
+        g[2] += is_forward(subject)
+        g[3] = min(g[3], received_at)
+        g[4] = max(g[4], received_at)
+    return groups
+
+def record_emails(email_objs):
+    """
+    Same as record_email for many emails (bulk_create skips signals, so bulk
+    inserters call this). One UPDATE per thread touched, not per email.
+    """
+    groups = _group((e.subject, e.received_at) for e in email_objs)
+    with transaction.atomic():
+        for root_subject, (messages, replies, forwards, first_at, last_at) in groups.items():
+            _apply(root_subject, messages, replies, forwards, first_at, last_at)
+
+def rebuild_threads(chunk_size=2000):
+    """
+    Recomputes the whole thread table from the Email table in one streaming
+    pass (for existing data, after raw SQL deletes, or to narrow time spans
+    left wide by deletes). Returns the number of threads.
+    """
+    rows = Email.objects.values_list('subject', 'received_at').iterator(chunk_size=chunk_size)
+    groups = _group(rows)
+
+    threads = [
+        EmailThread(
+            root_subject=root_subject, message_count=messages, reply_count=replies,
+            forward_count=forwards, first_received_at=first_at, last_received_at=last_at,
+        )
+        for root_subject, (messages, replies, forwards, first_at, last_at) in groups.items()
+    ]
+    with transaction.atomic():
+        EmailThread.objects.all().delete()
+        EmailThread.objects.bulk_create(threads, batch_size=1000)
+    return len(threads)
@@ -0,0 +1,170 @@
+import re
+import threading
+import time
+from django.conf import settings
+from django.db.models import Avg
+from .keyword_matcher import keyword_matcher
+from .metrics import span
+
+# ---------------------------------------------------------
+# CONFIGURATION (override in settings.py)
+# ---------------------------------------------------------
+# Tier 1 only reads the start of the body: enough for a threat or a refund
+# demand, and it keeps the cost flat for huge newsletters.
+TRIAGE_TEXT_LIMIT = getattr(settings, 'ANALYSIS_TRIAGE_TEXT_LIMIT', 4000) # characters
+SENDER_HISTORY_TTL = getattr(settings, 'ANALYSIS_TRIAGE_SENDER_TTL', 300) # seconds
+
+# Latency objectives: tier 1 per email at insert time, tier 2 from enqueue to
+# finished analysis, per priority band
+TIER1_SLO = getattr(settings, 'ANALYSIS_TIER1_SLO', 0.005) # seconds
+TIER2_SLO = getattr(settings, 'ANALYSIS_TIER2_SLO', {'high': 60, 'normal': 900, 'low': 3600}) # seconds
+
+PREFIX = "insightmail_analysis"
+
+# Priority bands (priority is 0..100, higher is analyzed first)
+HIGH_PRIORITY = 60
+NORMAL_PRIORITY = 20
+
+def priority_band(priority):
+    if priority >= HIGH_PRIORITY:
+        return 'high'
+    if priority >= NORMAL_PRIORITY:
+        return 'normal'
+    return 'low'
+
+URGENT_RE = re.compile(r'\b(urgent|asap|immediately|final notice|action required|legal|overdue|complaint)\b', re.IGNORECASE)
+BULK_RE = re.compile(r'\b(unsubscribe|newsletter|digest|no-?reply|do not reply|view in browser)\b', re.IGNORECASE)
+
+# ---------------------------------------------------------
+# SENDER HISTORY
+# ---------------------------------------------------------
+
+class SenderRiskCache:
+    """
+    Average risk_score of each sender's analyzed mail, kept in memory for a
+    few minutes. Tier 1 runs on every insert, so it must not query the
+    database for senders it has seen recently.
+    """
+
+    def __init__(self, ttl=SENDER_HISTORY_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.values = {} # sender_id -> (avg risk or None, loaded_at)
+
+    def get_many(self, sender_ids):
+        now = time.monotonic()
+        fresh = {}
+        with self.lock:
+            for sid in sender_ids:
+                entry = self.values.get(sid)
+                if entry and now - entry[1] < self.ttl:
+                    fresh[sid] = entry[0]
+        missing = set(sender_ids) - set(fresh)
+        if missing:
+            from .models import AnalysisResult
+            rows = dict(
+                AnalysisResult.objects.filter(email__sender_id__in=missing)
+                .values('email__sender_id').annotate(avg=Avg('risk_score'))
+                .values_list('email__sender_id', 'avg')
+            )
+            loaded = {sid: rows.get(sid) for sid in missing}
+            with self.lock:
+                for sid, avg in loaded.items():
+                    self.values[sid] = (avg, now)
+            fresh.update(loaded)
+        return fresh
+
+sender_risk = SenderRiskCache()
+
+# ---------------------------------------------------------
+# SLO TRACKING
+# ---------------------------------------------------------
+
+class SLOTracker:
+    """Counts work per (tier, band) and how much of it missed its latency objective."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {} # (tier, band) -> [total, breaches]
+
+    def record(self, tier, band, seconds, target, n=1):
+        with self.lock:
+            entry = self.counts.setdefault((tier, band), [0, 0])
+            entry[0] += n
+            if seconds > target:
+                entry[1] += n
+
+    def snapshot(self):
+        with self.lock:
+            return {key: tuple(value) for key, value in self.counts.items()}
+
+    def render_prometheus(self, queue_depth):
+        """SLO counters plus the current queue depth per band ({band: jobs})."""
+        lines = [
+            f"# HELP {PREFIX}_slo_total Emails processed per tier and priority band.",
+            f"# TYPE {PREFIX}_slo_total counter",
+        ]
+        snap = self.snapshot()
+        for (tier, band), (total, _) in sorted(snap.items()):
+            lines.append(f'{PREFIX}_slo_total{{tier="{tier}",band="{band}"}} {total}')
+        lines += [
+            f"# HELP {PREFIX}_slo_breaches_total Emails that took longer than their tier's latency objective.",
+            f"# TYPE {PREFIX}_slo_breaches_total counter",
+        ]
+        for (tier, band), (_, breaches) in sorted(snap.items()):
+            lines.append(f'{PREFIX}_slo_breaches_total{{tier="{tier}",band="{band}"}} {breaches}')
+        lines += [
+            f"# HELP {PREFIX}_queue_depth Queued analysis jobs per priority band.",
+            f"# TYPE {PREFIX}_queue_depth gauge",
+        ]
+        for band in ('high', 'normal', 'low'):
+            lines.append(f'{PREFIX}_queue_depth{{band="{band}"}} {queue_depth.get(band, 0)}')
+        return "\n".join(lines) + "\n"
+
+slo = SLOTracker()
+
+# ---------------------------------------------------------
+# TIER 1 SCORING
+# ---------------------------------------------------------
+
+def score_email(subject, body, sender_avg_risk=None):
+    """
+    Cheap priority (0..100) from what we can see without any model:
+    keyword hits, subject wording and the sender's past risk.
+    """
+    subject = subject or ''
+    text = f"{subject} {(body or '')[:TRIAGE_TEXT_LIMIT]}"
+    hits = keyword_matcher.find_by_category(text)
+
+    priority = 10
+    priority += 25 * len(hits.get('danger', ()))
+    priority += 8 * len(hits.get('complaint', ()))
+    priority += 4 * len(hits.get('finance', ()))
+
+    if URGENT_RE.search(subject):
+        priority += 15
+    if len(subject) > 8 and subject.isupper():
+        priority += 10 # SHOUTING
+    if BULK_RE.search(text):
+        priority -= 25 # newsletters / notifications can wait
+
+    if sender_avg_risk is not None:
+        # Senders whose mail was risky before get a head start
+        priority += int((sender_avg_risk - 10) / 3)
+
+    return max(0, min(100, priority))
+
+def triage_priorities(email_objs):
+    """Tier 1 for a list of emails: [priority, ...] (one history query at most)."""
+    if not email_objs:
+        return []
+    started = time.perf_counter()
+    with span("analysis.tier1"):
+        history = sender_risk.get_many({e.sender_id for e in email_objs})
+        priorities = [score_email(e.subject, e.body, history.get(e.sender_id)) for e in email_objs]
+    per_email = (time.perf_counter() - started) / len(email_objs)
+    slo.record('tier1', 'all', per_email, TIER1_SLO, n=len(email_objs))
+    return priorities
+
+def triage_priority(email_obj):
+    return triage_priorities([email_obj])[0]
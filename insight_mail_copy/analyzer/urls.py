@@ -13,4 +13,10 @@ urlpatterns = [
     path('email/<int:email_id>/', views.email_detail, name='email_detail'),
     path('analyze/<int:email_id>/', views.analyze_email, name='analyze_email'),
     path('sync-gmail/', views.sync_gmail_view, name='sync_gmail'),
+
+    path('search/', views.search_view, name='search'),
+    path('api/search/', views.search_api, name='search_api'),
+    path('api/export/', views.export_view, name='export'),
+
+    path('metrics', views.metrics_view, name='metrics'),
 ]
\ No newline at end of file
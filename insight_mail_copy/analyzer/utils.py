@@ -1,122 +1,379 @@
 import imaplib
 import email
-from email.header import decode_header
+import re
 from django.contrib.auth.models import User
-from .models import Email
+from django.db import transaction
+from django.utils import timezone
+from .models import Email, MailboxSyncState
+from .jobs import enqueue_analysis_bulk
+from .threads import record_emails
+from . import rollups
+from .metrics import span, timed
+from .mime import MAX_BODY_CHARS, MAX_PART_BYTES, cap_text, decode_payload, decode_subject, html_to_text
 
-def clean_encoding(encoding):
+# UIDs fetched per round-trip
+SYNC_BATCH_SIZE = 100
+
+HEADER_FIELDS = "BODY.PEEK[HEADER.FIELDS (FROM SUBJECT)]"
+
+# ---------------------------------------------------------
+# IMAP RESPONSE PARSING
+# ---------------------------------------------------------
+
+UID_RE = re.compile(rb'UID (\d+)')
+LITERAL_RE = re.compile(rb'\{\d+\}$')
+BODYSTRUCTURE_TOKEN_RE = re.compile(r'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()"]+')
+
+def parse_bodystructure(text):
+    """'("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 12 1)' -> nested lists."""
+    stack = [[]]
+    for token in BODYSTRUCTURE_TOKEN_RE.findall(text):
+        if token == '(':
+            stack.append([])
+        elif token == ')':
+            if len(stack) == 1:
+                break # closing paren of the FETCH response itself
+            done = stack.pop()
+            stack[-1].append(done)
+        elif token.startswith('"'):
+            stack[-1].append(token[1:-1].replace('\\"', '"').replace('\\\\', '\\'))
+        elif token.upper() == 'NIL':
+            stack[-1].append(None)
+        else:
+            stack[-1].append(token)
+    return stack[0][0] if stack[0] else None
+
+def _params(value):
+    """("CHARSET" "utf-8" "NAME" "x.pdf") -> {'charset': 'utf-8', 'name': 'x.pdf'}"""
+    if not isinstance(value, list):
+        return {}
+    return {str(k).lower(): v for k, v in zip(value[::2], value[1::2])}
+
+def find_text_part(node, spec='', subtype='plain'):
     """
-    Helper to fix 'unknown-8bit' or None encodings.
+    Walks a BODYSTRUCTURE and returns (part_spec, charset, transfer_encoding)
+    of the first inline text/<subtype> part, or None. Attachments are never
+    downloaded: we only fetch the one part we need.
     """
-    if not encoding or encoding.lower() in ['unknown-8bit', 'x-user-defined']:
-        return 'utf-8'
-    return encoding
+    if not isinstance(node, list) or not node:
+        return None
+
+    # Multipart: children come first, then the subtype string
+    if isinstance(node[0], list):
+        n = 0
+        for child in node:
+            if not isinstance(child, list):
+                break
+            n += 1
+            found = find_text_part(child, f"{spec}.{n}" if spec else str(n), subtype)
+            if found:
+                return found
+        return None
+
+    # Single part: type, subtype, params, id, description, encoding, size, ...
+    main_type = str(node[0]).lower()
+    sub_type = str(node[1]).lower() if len(node) > 1 else ''
+    if main_type != 'text' or sub_type != subtype:
+        return None
 
-def fetch_gmail_emails(username, password, current_user):
+    # text/* has an extra "lines" field, so disposition is at index 9
+    disposition = node[9] if len(node) > 9 else None
+    if isinstance(disposition, list) and disposition and str(disposition[0]).lower() == 'attachment':
+        return None
+
+    charset = _params(node[2] if len(node) > 2 else None).get('charset')
+    transfer_encoding = node[5] if len(node) > 5 else None
+    return (spec or '1', charset, transfer_encoding)
+
+def find_body_part(node):
     """
-    Connects to Gmail, fetches UNSEEN emails (Newest First), saves them to Django DB.
+    The part to download as the body: text/plain, else text/html (HTML-only
+    mail, converted to text after download). (spec, charset, encoding, subtype) or None.
     """
-    # 1. Connect to Gmail
-    mail = imaplib.IMAP4_SSL("imap.gmail.com")
-    
-    try:
-        mail.login(username, password)
-    except Exception as e:
-        return f"Login Failed: {e}"
+    for subtype in ('plain', 'html'):
+        found = find_text_part(node, subtype=subtype)
+        if found:
+            return found + (subtype,)
+    return None
 
-    mail.select("inbox")
+def decode_body(raw, part):
+    """Fetched bytes of the part find_body_part chose -> body text (HTML converted)."""
+    _, charset, transfer_encoding, subtype = part
+    body = decode_payload(raw, transfer_encoding, charset)
+    return html_to_text(body) if subtype == 'html' else body
 
-    # 2. Search for Unread Emails
-    status, messages = mail.search(None, "UNSEEN")
-    email_ids = messages[0].split()
+def _iter_fetch_literals(data):
+    """
+    Yields (uid, literal_bytes) from a UID FETCH response.
+    imaplib gives tuples (b'7 (UID 42 BODY[..] {123}', b'...'); some servers
+    send the UID after the literal instead, in the following bytes item.
+    """
+    for i, item in enumerate(data):
+        if not isinstance(item, tuple):
+            continue
+        m = UID_RE.search(item[0])
+        if not m and i + 1 < len(data) and isinstance(data[i + 1], bytes):
+            m = UID_RE.search(data[i + 1])
+        if m:
+            yield int(m.group(1)), item[1]
 
-    if not email_ids:
-        return "No new emails found."
+def _fetch_lines(data):
+    """
+    Yields each message's whole line from a UID FETCH response.
+    A string the server sends as a literal ({n} then raw bytes, e.g. a
+    non-ASCII attachment name in a BODYSTRUCTURE) splits the line: imaplib
+    gives a (line, literal) tuple per literal, then the rest of the line.
+    The literals are put back inline as quoted strings.
+    """
+    line = b''
+    for item in data:
+        if isinstance(item, tuple):
+            head, literal = item
+            line += LITERAL_RE.sub(b'', head) + b'"' + literal.replace(b'\\', b'\\\\').replace(b'"', b'\\"') + b'"'
+        elif isinstance(item, bytes):
+            yield line + item
+            line = b''
+    if line:
+        yield line
+
+def _header(msg, name):
+    """Raw header value; 8-bit bytes (not RFC 2047 encoded) are read as UTF-8."""
+    for key, value in msg.raw_items():
+        if key.lower() == name.lower():
+            return value.encode('utf-8', 'surrogateescape').decode('utf-8', 'replace')
+    return None
+
+def _skip(uid, error):
+    print(f"Skipping a bad email (UID {uid}) due to error: {error}")
+
+def _uid_set(uids):
+    return ",".join(str(u) for u in uids)
+
+def _select(mail, mailbox):
+    """SELECT (read-only, so nothing gets marked as read) -> (uidvalidity, uidnext)"""
+    status, _ = mail.select(mailbox, readonly=True)
+    if status != 'OK':
+        raise imaplib.IMAP4.error(f"Cannot select mailbox {mailbox}")
+
+    def first_int(name):
+        _, values = mail.response(name)
+        try:
+            return int(values[0])
+        except (TypeError, ValueError, IndexError):
+            return None
+
+    return first_int('UIDVALIDITY'), first_int('UIDNEXT')
+
+def _search_uids(mail, criteria):
+    status, data = mail.uid('SEARCH', None, criteria)
+    if status != 'OK' or not data or not data[0]:
+        return []
+    return sorted(int(u) for u in data[0].split())
+
+def fetch_messages(mail, uids):
+    """
+    Fetches one batch of messages: headers + one text part (plain, else HTML
+    converted to text), at most MAIL_MAX_PART_BYTES of it.
+    Returns [(uid, subject, sender_str, body)] sorted by UID. A message that
+    cannot be decoded is left out (and logged) instead of failing the batch.
+    """
+    uid_set = _uid_set(uids)
+
+    # 1. Structure (to pick the part) and headers, for the whole batch at once
+    with span("imap.fetch"):
+        _, structure_data = mail.uid('FETCH', uid_set, '(UID BODYSTRUCTURE)')
+        _, header_data = mail.uid('FETCH', uid_set, f'(UID {HEADER_FIELDS})')
+
+    with span("imap.parse"):
+        parts, bad = {}, set()
+        for line in _fetch_lines(structure_data):
+            m = UID_RE.search(line)
+            idx = line.find(b'BODYSTRUCTURE')
+            if not m or idx == -1:
+                continue
+            uid = int(m.group(1))
+            try:
+                text = line[idx + len(b'BODYSTRUCTURE'):].decode('utf-8', errors='replace')
+                parts[uid] = find_body_part(parse_bodystructure(text))
+            except Exception as e:
+                _skip(uid, e)
+                bad.add(uid)
+
+        headers = {uid: email.message_from_bytes(raw) for uid, raw in _iter_fetch_literals(header_data)}
 
-    # --- THE FIX: PROCESS NEWEST FIRST ---
-    # IMAP gives IDs as [1, 2, 3] (Oldest to Newest). 
-    # We reverse it to [3, 2, 1] so we get the latest emails first.
-    email_ids.reverse()
+    # 2. Bodies: one FETCH per distinct part spec (usually just "1" and "1.1").
+    # <0.N> is a partial fetch: a huge part costs at most MAX_PART_BYTES of download.
+    bodies = {}
+    by_spec = {}
+    for uid, part in parts.items():
+        if part:
+            by_spec.setdefault(part[0], []).append(uid)
+    for spec, spec_uids in by_spec.items():
+        with span("imap.fetch"):
+            _, body_data = mail.uid('FETCH', _uid_set(spec_uids), f'(UID BODY.PEEK[{spec}]<0.{MAX_PART_BYTES}>)')
+        with span("imap.parse"):
+            for uid, raw in _iter_fetch_literals(body_data):
+                try:
+                    bodies[uid] = decode_body(raw, parts[uid])
+                except Exception as e:
+                    _skip(uid, e)
+                    bad.add(uid)
 
+    messages = []
+    for uid in sorted(set(headers) - bad):
+        msg = headers[uid]
+        try:
+            messages.append((
+                uid,
+                decode_subject(_header(msg, "Subject")),
+                _header(msg, "From") or "Unknown Sender",
+                bodies.get(uid, ""),
+            ))
+        except Exception as e:
+            _skip(uid, e)
+    return messages
+
+# ---------------------------------------------------------
+# SAVING
+# ---------------------------------------------------------
+
+class SenderCache:
+    """
+    In-memory map of sender username -> User for one sync run.
+    Looks up / creates all senders of a batch with two queries instead of a
+    get_or_create per message.
+    """
+    def __init__(self):
+        self.users = {}
+
+    def resolve(self, sender_strs):
+        wanted = {}
+        for sender_str in sender_strs:
+            clean_address = email.utils.parseaddr(sender_str)[1] or "unknown@example.com"
+            username = clean_address.split('@')[0][:30]
+            if username not in self.users:
+                wanted.setdefault(username, clean_address)
+
+        if wanted:
+            for user in User.objects.filter(username__in=list(wanted)):
+                self.users[user.username] = user
+            missing = [u for u in wanted if u not in self.users]
+            if missing:
+                User.objects.bulk_create([
+                    User(username=u, email=wanted[u], first_name='External', last_name='User')
+                    for u in missing
+                ], ignore_conflicts=True)
+                for user in User.objects.filter(username__in=missing):
+                    self.users[user.username] = user
+
+    def get(self, sender_str):
+        clean_address = email.utils.parseaddr(sender_str)[1] or "unknown@example.com"
+        return self.users[clean_address.split('@')[0][:30]]
+
+def save_batch(messages, current_user, senders, state, last_uid):
+    """
+    Inserts one batch with bulk_create and moves the checkpoint, in one
+    transaction: after a crash the batch is either fully there (and skipped
+    next time) or not at all (and fetched again). last_uid is the batch's
+    highest UID, so messages fetch_messages skipped are not fetched again.
+    """
+    senders.resolve(sender_str for _, _, sender_str, _ in messages)
+    rows = [
+        Email(
+            sender=senders.get(sender_str),
+            recipient=current_user,
+            subject=subject[:255],
+            body=cap_text(body, MAX_BODY_CHARS),
+            is_read=False,
+        )
+        for _, subject, sender_str, body in messages
+    ]
+
+    with transaction.atomic():
+        created = Email.objects.bulk_create(rows)
+        # bulk_create skips post_save, so do what the signal would have done
+        record_emails(created)
+        rollups.record_emails(created)
+        state.last_uid = last_uid
+        state.last_synced_at = timezone.now()
+        state.save(update_fields=['uidvalidity', 'last_uid', 'last_synced_at'])
+        transaction.on_commit(lambda: enqueue_analysis_bulk(created))
+    return len(created)
+
+# ---------------------------------------------------------
+# SYNC
+# ---------------------------------------------------------
+
+def sync_mailbox(mail, current_user, account, mailbox="INBOX", batch_size=SYNC_BATCH_SIZE):
+    """
+    Imports new messages from an already logged-in IMAP connection.
+    - First sync: only UNSEEN mail (like before), then the checkpoint jumps to the newest UID.
+    - Later syncs: only UIDs above the checkpoint, oldest first, in batches.
+    - UIDVALIDITY changed: the server renumbered the mailbox, start over.
+    Returns the number of emails imported.
+    """
+    uidvalidity, uidnext = _select(mail, mailbox)
+    state, _ = MailboxSyncState.objects.get_or_create(owner=current_user, account=account, mailbox=mailbox)
+
+    first_sync = state.uidvalidity is None or state.uidvalidity != uidvalidity
+    if first_sync:
+        if state.uidvalidity is not None:
+            print(f"UIDVALIDITY changed for {account}/{mailbox}, resyncing.")
+        state.uidvalidity = uidvalidity
+        state.last_uid = 0
+        uids = _search_uids(mail, "UNSEEN")
+    else:
+        # "N:*" always returns the highest UID even if it is below N, hence the filter
+        uids = [u for u in _search_uids(mail, f"UID {state.last_uid + 1}:*") if u > state.last_uid]
+
+    senders = SenderCache()
     count = 0
-    for e_id in email_ids:
+    for i in range(0, len(uids), batch_size):
+        batch = uids[i:i + batch_size]
+        messages = fetch_messages(mail, batch)
+        with span("imap.insert"):
+            count += save_batch(messages, current_user, senders, state, batch[-1])
+
+    # Nothing older than UIDNEXT needs looking at again
+    newest = (uidnext - 1) if uidnext else (uids[-1] if uids else state.last_uid)
+    if first_sync or newest > state.last_uid:
+        state.last_uid = max(state.last_uid, newest)
+        state.last_synced_at = timezone.now()
+        state.save(update_fields=['uidvalidity', 'last_uid', 'last_synced_at'])
+
+    return count
+
+def open_imap(host="imap.gmail.com", port=None, use_ssl=True, timeout=None):
+    """imaplib connection (not logged in yet). timeout: socket timeout in seconds."""
+    if use_ssl:
+        return imaplib.IMAP4_SSL(host, port or imaplib.IMAP4_SSL_PORT, timeout=timeout)
+    return imaplib.IMAP4(host, port or imaplib.IMAP4_PORT, timeout=timeout)
+
+@timed("imap.sync")
+def fetch_gmail_emails(username, password, current_user, host="imap.gmail.com", port=None,
+                       use_ssl=True, mailbox="INBOX", batch_size=SYNC_BATCH_SIZE):
+    """
+    Connects to Gmail (or any IMAP server, e.g. a local test server with
+    use_ssl=False), imports mail newer than the last checkpoint into the Django DB.
+    """
+    # 1. Connect
+    with span("imap.connect"):
+        mail = open_imap(host, port, use_ssl)
         try:
-            # Fetch the email data
-            res, msg_data = mail.fetch(e_id, "(RFC822)")
-            
-            for response_part in msg_data:
-                if isinstance(response_part, tuple):
-                    msg = email.message_from_bytes(response_part[1])
-                    
-                    # --- A. Decode Subject (Robust Fix) ---
-                    raw_subject = msg["Subject"]
-                    subject = "(No Subject)"
-                    
-                    if raw_subject:
-                        decoded_fragments = decode_header(raw_subject)
-                        subject_parts = []
-                        for text_bytes, encoding in decoded_fragments:
-                            if isinstance(text_bytes, bytes):
-                                safe_enc = clean_encoding(encoding)
-                                try:
-                                    subject_parts.append(text_bytes.decode(safe_enc, errors='replace'))
-                                except (LookupError, UnicodeDecodeError):
-                                    subject_parts.append(text_bytes.decode('utf-8', errors='replace'))
-                            else:
-                                subject_parts.append(str(text_bytes))
-                        subject = "".join(subject_parts)
-                    
-                    # --- B. Decode Sender ---
-                    sender_str = msg.get("From", "Unknown Sender")
-                    
-                    # --- C. Extract Body ---
-                    body = ""
-                    if msg.is_multipart():
-                        for part in msg.walk():
-                            content_type = part.get_content_type()
-                            content_disposition = str(part.get("Content-Disposition"))
-                            
-                            try:
-                                if content_type == "text/plain" and "attachment" not in content_disposition:
-                                    payload = part.get_payload(decode=True)
-                                    charset = part.get_content_charset()
-                                    safe_charset = clean_encoding(charset)
-                                    
-                                    body = payload.decode(safe_charset, errors='replace')
-                                    break 
-                            except:
-                                pass
-                    else:
-                        try:
-                            payload = msg.get_payload(decode=True)
-                            charset = msg.get_content_charset()
-                            safe_charset = clean_encoding(charset)
-                            body = payload.decode(safe_charset, errors='replace')
-                        except:
-                            body = "(Could not decode email body)"
-
-                    # --- D. Save to Database ---
-                    clean_address = email.utils.parseaddr(sender_str)[1]
-                    if not clean_address:
-                        clean_address = "unknown@example.com"
-
-                    sender_user, _ = User.objects.get_or_create(
-                        username=clean_address.split('@')[0][:30],
-                        defaults={'email': clean_address, 'first_name': 'External', 'last_name': 'User'}
-                    )
-
-                    Email.objects.create(
-                        sender=sender_user,
-                        recipient=current_user,
-                        subject=subject,
-                        body=body,
-                        is_read=False 
-                    )
-                    count += 1
+            mail.login(username, password)
         except Exception as e:
-            print(f"Skipping a bad email due to error: {e}")
-            continue
+            return f"Login Failed: {e}"
 
-    mail.close()
-    mail.logout()
-    return f"Successfully synced {count} emails!"
\ No newline at end of file
+    # 2. Sync everything above the checkpoint
+    try:
+        count = sync_mailbox(mail, current_user, f"{username}@{host}", mailbox, batch_size)
+    finally:
+        try:
+            mail.close()
+        except Exception:
+            pass
+        mail.logout()
+
+    if not count:
+        return "No new emails found."
+    return f"Successfully synced {count} emails!"
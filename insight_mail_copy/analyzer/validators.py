@@ -1,10 +1,11 @@
-import dns.resolver
 from django.core.exceptions import ValidationError
 
 def validate_email_existence(email):
     """
     Checks if the domain of the email address actually has valid MX (Mail Exchange) records.
     """
+    import dns.resolver # only needed when a form is validated
+
     try:
         domain = email.split('@')[1]
         
@@ -1,8 +1,11 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
 from .models import Email, AnalysisResult
 from .forms import SignUpForm, ComposeEmailForm # <--- Make sure to import SignUpForm
 from .utils import fetch_gmail_emails # Import the tool we just made
@@ -50,34 +53,70 @@ def logout_view(request):
 
 # --- EMAIL SYSTEM VIEWS ---
 
+INBOX_PAGE_SIZE = 50
+
+def _keyset_page(emails, cursor, page_size=INBOX_PAGE_SIZE):
+    """
+    Cursor pagination on (received_at, id), newest first.
+    The cursor is "<received_at ISO>|<id>" of the last row on the previous page,
+    so every page is an index range scan, no matter how deep you go
+    (OFFSET would have to skip all earlier rows).
+    Returns (rows, next_cursor or None).
+    """
+    if cursor:
+        try:
+            ts, last_id = cursor.rsplit('|', 1)
+            ts, last_id = parse_datetime(ts), int(last_id)
+        except ValueError:
+            ts = None
+        if ts is not None:
+            emails = emails.filter(Q(received_at__lt=ts) | Q(received_at=ts, id__lt=last_id))
+
+    rows = list(emails.order_by('-received_at', '-id')[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    return rows, f"{rows[-1].received_at.isoformat()}|{rows[-1].id}"
+
+def _mailbox(emails):
+    """Sender, recipient and analysis come in the same query as the email (no per-row lookups)."""
+    return emails.select_related('sender', 'recipient', 'analysis')
+
 @login_required
 def dashboard(request):
     """Acts as the INBOX (Emails received by the user)"""
     # Filter: Recipient = Current User
-    emails = Email.objects.filter(recipient=request.user).order_by('-received_at')
+    from .rollups import dashboard_stats
+    emails = Email.objects.filter(recipient=request.user)
+    page, next_cursor = _keyset_page(_mailbox(emails), request.GET.get('cursor'))
     
-    total_emails = emails.count()
-    # Filter High Risk in MY inbox
-    high_risk_count = AnalysisResult.objects.filter(email__recipient=request.user, risk_score__gt=50).count()
+    # Counters and trends come from the rollup table (a few rows), not from scanning MY inbox
+    stats = dashboard_stats(request.user)
     
     context = {
-        'emails': emails,
+        'emails': page,
         'box_type': 'Inbox',
-        'total_emails': total_emails,
-        'high_risk_count': high_risk_count
+        'total_emails': stats['total'],
+        'high_risk_count': stats['high_risk'],
+        'stats': stats,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
     }
     return render(request, 'dashboard.html', context)
 
 @login_required
 def sent_box(request):
     """Acts as SENT ITEMS (Emails sent by the user)"""
-    emails = Email.objects.filter(sender=request.user).order_by('-received_at')
+    emails = Email.objects.filter(sender=request.user)
+    page, next_cursor = _keyset_page(_mailbox(emails), request.GET.get('cursor'))
     
     context = {
-        'emails': emails,
+        'emails': page,
         'box_type': 'Sent',
         'total_emails': emails.count(),
-        'high_risk_count': 0 # We don't usually count risk on sent items
+        'high_risk_count': 0, # We don't usually count risk on sent items
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
     }
     return render(request, 'dashboard.html', context)
 
@@ -130,31 +169,112 @@ def email_detail(request, email_id):
     # NEW: Mark as read if I am the recipient
     if request.user == email.recipient and not email.is_read:
         email.is_read = True
-        email.save()
+        # Only this column: a queue worker may have just saved the analysis fields
+        email.save(update_fields=['is_read'])
         
     return render(request, 'email_detail.html', {'email': email})
 
 @login_required
 def analyze_email(request, email_id):
-    from .ai_engine import analyze_email_content
+    from .jobs import process_email
     email = get_object_or_404(Email, id=email_id)
     
-    # --- FIX IS HERE ---
-    # OLD: analysis_data = analyze_email_content(email.subject, email.body)
-    # NEW: Just pass 'email'
-    analysis_data = analyze_email_content(email) 
-    
-    AnalysisResult.objects.update_or_create(
-        email=email,
-        defaults={
-            'summary': analysis_data['summary'],
-            'sentiment': analysis_data['sentiment'],
-            'tone': analysis_data['tone'],
-            'risk_score': analysis_data['risk_score'],
-            'suggested_category': analysis_data['suggested_category'],
-            'suggested_reply': analysis_data['suggested_reply'],
-        }
-    )
-    email.is_analyzed = True
-    email.save()
-    return redirect('dashboard')
\ No newline at end of file
+    # Manual "Run Analysis Now": runs inline (same pipeline the queue workers use)
+    process_email(email)
+    return redirect('dashboard')
+
+def metrics_view(request):
+    """Prometheus scrape endpoint (span latency histograms, errors, DB query counts, analysis cache, queue SLOs)."""
+    from .metrics import registry
+    from .analysis_cache import analysis_cache
+    from .jobs import queue_depth
+    from .triage import slo
+    body = registry.render_prometheus() + analysis_cache.render_prometheus() + slo.render_prometheus(queue_depth())
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def _search_params(request):
+    """Query string -> keyword arguments for search_emails (bad numbers are ignored)."""
+    def as_int(name):
+        try:
+            return int(request.GET[name])
+        except (KeyError, ValueError):
+            return None
+
+    return {
+        'text': request.GET.get('q', ''),
+        'risk_min': as_int('risk_min'),
+        'risk_max': as_int('risk_max'),
+        'sentiment': request.GET.get('sentiment') or None,
+        'category': request.GET.get('category') or None,
+        'page': as_int('page') or 1,
+    }
+
+@login_required
+def search_view(request):
+    """Full-text search over my mailbox (ranked, with highlighted snippets)."""
+    from .search import search_emails
+    params = _search_params(request)
+    hits, has_next = search_emails(request.user, **params)
+
+    # Same filters, other page (for the pager links)
+    query = request.GET.copy()
+    query.pop('page', None)
+    context = {
+        'hits': hits,
+        'params': params,
+        'has_next': has_next,
+        'base_query': query.urlencode(),
+    }
+    return render(request, 'search.html', context)
+
+@login_required
+def search_api(request):
+    """JSON version of search_view: /api/search/?q=refund&risk_min=50&page=2"""
+    from .search import search_emails
+    params = _search_params(request)
+    hits, has_next = search_emails(request.user, **params)
+
+    results = []
+    for hit in hits:
+        email = hit['email']
+        analysis = getattr(email, 'analysis', None)
+        results.append({
+            'id': email.id,
+            'subject': email.subject,
+            'sender': email.sender.username,
+            'recipient': email.recipient.username,
+            'received_at': email.received_at.isoformat(),
+            'rank': hit['rank'],
+            'snippet': hit['snippet'],
+            'risk_score': analysis.risk_score if analysis else None,
+            'sentiment': analysis.sentiment if analysis else None,
+            'category': analysis.suggested_category if analysis else None,
+        })
+    return JsonResponse({'page': params['page'], 'has_next': has_next, 'results': results})
+
+@login_required
+def export_view(request):
+    """
+    Streams Email + AnalysisResult rows for BI tools:
+    /api/export/?format=csv|ndjson|parquet&since=2024-01-01&until=2024-01-31&recipient=alice&risk_min=50
+    Staff export every mailbox, everyone else only their own.
+    """
+    from .export import FORMATS, export_queryset, stream_export
+    fmt = request.GET.get('format', 'csv')
+    try:
+        risk = {name: int(request.GET[name]) if request.GET.get(name) else None for name in ('risk_min', 'risk_max')}
+        rows = export_queryset(
+            user=None if request.user.is_staff else request.user,
+            since=request.GET.get('since'),
+            until=request.GET.get('until'),
+            recipient=request.GET.get('recipient'),
+            **risk,
+        )
+        content = stream_export(rows, fmt)
+    except ValueError as exc: # bad number, or an ExportError (bad date/user/format)
+        return HttpResponseBadRequest(str(exc))
+
+    _, content_type, extension = FORMATS[fmt]
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="insightmail-export.{extension}"'
+    return response
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -48,6 +49,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'analyzer.metrics.MetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'insight_mail.urls'
@@ -74,12 +76,28 @@ WSGI_APPLICATION = 'insight_mail.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# SQLite by default (development). Set DB_ENGINE=postgres for production;
+# connections are then kept open between requests (DB_CONN_MAX_AGE seconds).
+if os.environ.get('DB_ENGINE', 'sqlite') == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'insight_mail'),
+            'USER': os.environ.get('POSTGRES_USER', 'insight_mail'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
     }
-}
 
 
 # Password validation
@@ -123,3 +141,64 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+
+# Analysis job queue (see analyzer/jobs.py and `manage.py run_analysis_worker`)
+
+ANALYSIS_JOB_MAX_ATTEMPTS = 3
+
+ANALYSIS_JOB_VISIBILITY_TIMEOUT = 300  # seconds a worker may hold a job before it is retried
+
+ANALYSIS_JOB_RETRY_BACKOFF = 30  # seconds, doubled on every failed attempt
+
+MODEL_REGISTRY_CHECK_INTERVAL = 5.0  # seconds between checks of ml_models/ for retrained files
+
+MODEL_MMAP = True  # memory-map the LDA arrays read-only, shared by every process on the machine
+
+MODEL_ALLOW_PICKLE = True  # load a legacy svr_model.pkl; set False after `manage.py convert_models`
+
+ANALYSIS_BATCH_CHUNK_SIZE = 256  # emails per call of the batch engine (backfills, multi-job claims)
+
+ANALYSIS_CACHE_ENABLED = True  # reuse results for identical content (see analyzer/analysis_cache.py)
+
+ANALYSIS_TIER1_SLO = 0.005  # seconds of insert-time triage per email (see analyzer/triage.py)
+
+ANALYSIS_TIER2_SLO = {'high': 60, 'normal': 900, 'low': 3600}  # seconds from enqueue to finished analysis, per priority band
+
+ANALYSIS_CACHE_SIZE = 2048  # entries kept in each process's in-memory LRU (the DB table is unbounded)
+
+ANALYSIS_CACHE_TTL_DAYS = 30  # `manage.py prune_analysis_cache` deletes cache rows unused for this long
+
+
+# Reply drafts (see analyzer/reply_service.py)
+
+# SECURITY NOTE: set GOOGLE_API_KEY in the environment, never commit it
+GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY', 'YOUR_GEMINI_API')
+
+LLM_BACKEND = os.environ.get('LLM_BACKEND', 'gemini')  # 'gemini', 'http' (local/fake endpoint) or 'static' (no calls)
+
+LLM_ENDPOINT_URL = os.environ.get('LLM_ENDPOINT_URL', 'http://127.0.0.1:8765/generate')
+
+LLM_MAX_CONCURRENCY = 4  # calls in flight at once
+
+LLM_RATE_PER_SEC = 5.0  # average calls per second (token bucket)
+
+LLM_BURST = 10  # token bucket size
+
+LLM_TIMEOUT = 20.0  # seconds per call
+
+LLM_MAX_RETRIES = 2
+
+LLM_CACHE_TIMEOUT = 7 * 24 * 3600  # seconds a generated reply stays cached
+
+
+# Timing spans + /metrics endpoint (see analyzer/metrics.py)
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+
+# Mail bodies (see analyzer/mime.py)
+
+MAIL_MAX_BODY_CHARS = 200_000  # characters of body stored per email
+
+MAIL_MAX_PART_BYTES = 1_000_000  # bytes of the body part downloaded / decoded (IMAP partial fetch)
+
+ANALYSIS_MAX_TEXT_CHARS = 20_000  # characters of body the NLP pipeline reads
@@ -1,48 +1,176 @@
 import os
+import json
+import argparse
+import shutil
+import tempfile
+import uuid
 import django
 import gensim
 from gensim import corpora
+from django.utils import timezone
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'insight_mail.settings')
 django.setup()
 
 from analyzer.models import Email
 from analyzer.ai_engine import clean_text, MODEL_PATH
+from analyzer.model_registry import LDA_CURRENT_FILE, LDA_DICT_FILE, LDA_MODEL_FILE, LDA_VERSIONS_DIR, lda_paths
 
-def train_lda():
-    print("Fetching emails from database...")
-    emails = Email.objects.all()
-    
-    if not emails.exists():
+# Which emails the saved model has already seen (for --incremental)
+CHECKPOINT_FILE = os.path.join(MODEL_PATH, 'lda_checkpoint.json')
+
+# Published LDA versions kept in ml_models/lda/ (the current one included)
+KEEP_VERSIONS = 3
+
+class EmailTokens:
+    """
+    Streams clean tokens for emails with id > min_id, reading the DB in chunks.
+    Iterable more than once (gensim makes one pass per training pass), and
+    never holds more than one chunk of bodies in memory.
+    """
+    def __init__(self, min_id=0, chunk_size=2000):
+        self.min_id = min_id
+        self.chunk_size = chunk_size
+        self.last_id = min_id
+
+    def __iter__(self):
+        rows = Email.objects.filter(id__gt=self.min_id).order_by('id').values_list('id', 'subject', 'body')
+        for email_id, subject, body in rows.iterator(chunk_size=self.chunk_size):
+            self.last_id = max(self.last_id, email_id)
+            yield clean_text(subject + " " + body)
+
+class BowCorpus:
+    """Streams bag-of-words vectors (what LdaModel trains on)."""
+    def __init__(self, tokens, dictionary):
+        self.tokens = tokens
+        self.dictionary = dictionary
+
+    def __iter__(self):
+        for doc in self.tokens:
+            yield self.dictionary.doc2bow(doc)
+
+def load_checkpoint():
+    try:
+        with open(CHECKPOINT_FILE) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def save_checkpoint(last_id, trained_docs):
+    checkpoint = {
+        'last_email_id': last_id,
+        'trained_docs': trained_docs,
+        'updated_at': timezone.now().isoformat(),
+    }
+    tmp_path = CHECKPOINT_FILE + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, CHECKPOINT_FILE)
+
+def publish_lda(dictionary, lda_model):
+    """
+    Saves the dictionary and the model (with its .npy arrays) into a new
+    folder ml_models/lda/<version>/, then points lda_current at it with one
+    os.replace. Running workers only watch lda_current, so they switch from
+    the complete old set of files to the complete new one, never a mix.
+    """
+    versions_dir = os.path.join(MODEL_PATH, LDA_VERSIONS_DIR)
+    os.makedirs(versions_dir, exist_ok=True)
+    version = f"{timezone.now():%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+    staging = tempfile.mkdtemp(dir=versions_dir, prefix='.staging-')
+    try:
+        dictionary.save(os.path.join(staging, LDA_DICT_FILE))
+        lda_model.save(os.path.join(staging, LDA_MODEL_FILE))
+        os.rename(staging, os.path.join(versions_dir, version))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    tmp_path = os.path.join(MODEL_PATH, LDA_CURRENT_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(MODEL_PATH, LDA_CURRENT_FILE))
+
+    # Old versions go; workers still mapping their arrays keep valid mappings
+    older = sorted(n for n in os.listdir(versions_dir) if not n.startswith('.') and n != version)
+    for name in older[:max(len(older) - (KEEP_VERSIONS - 1), 0)]:
+        shutil.rmtree(os.path.join(versions_dir, name), ignore_errors=True)
+
+def build_model(corpus, dictionary, num_topics, passes, workers):
+    """LdaMulticore when workers > 1, otherwise the classic single-core LdaModel."""
+    if workers > 1:
+        return gensim.models.ldamulticore.LdaMulticore(
+            corpus, num_topics=num_topics, id2word=dictionary, passes=passes, workers=workers
+        )
+    return gensim.models.ldamodel.LdaModel(
+        corpus, num_topics=num_topics, id2word=dictionary, passes=passes
+    )
+
+def train_lda(num_topics=3, passes=20, workers=1, chunk_size=2000):
+    """Full retrain: new dictionary + new model over every email (streamed)."""
+    if not Email.objects.exists():
         print("No emails found! Sync some emails first.")
         return
 
-    print(f"Preprocessing {emails.count()} emails...")
-    doc_clean = [clean_text(e.subject + " " + e.body) for e in emails]
+    print(f"Streaming {Email.objects.count()} emails from the database...")
+    tokens = EmailTokens(chunk_size=chunk_size)
 
-    # 2. Create Dictionary (ID <-> Word)
+    # 2. Create Dictionary (ID <-> Word), one streaming pass
     print("Creating Dictionary...")
-    dictionary = corpora.Dictionary(doc_clean)
-    dictionary.save(os.path.join(MODEL_PATH, 'lda_dict.gensim'))
+    dictionary = corpora.Dictionary(tokens)
 
-    # 3. Create Corpus (Document Term Matrix)
-    print("Creating Corpus...")
-    corpus = [dictionary.doc2bow(text) for text in doc_clean]
+    # 3. Corpus (Document Term Matrix), streamed again on every training pass
+    corpus = BowCorpus(tokens, dictionary)
 
     # 4. Train LDA Model
-    print("Training LDA Model (Finding 3 Topics)...")
-    lda_model = gensim.models.ldamodel.LdaModel(
-        corpus, 
-        num_topics=3, 
-        id2word=dictionary, 
-        passes=20
-    )
-    lda_model.save(os.path.join(MODEL_PATH, 'lda_model.gensim'))
+    print(f"Training LDA Model (Finding {num_topics} Topics, {workers} worker(s))...")
+    lda_model = build_model(corpus, dictionary, num_topics, passes, workers)
+    publish_lda(dictionary, lda_model)
+    save_checkpoint(tokens.last_id, dictionary.num_docs)
 
     print("--- Training Complete! ---")
     print("Topics Found:")
     for idx, topic in lda_model.print_topics(-1):
         print(f"Topic: {idx} \nWords: {topic}\n")
 
+def update_lda(passes=1, chunk_size=2000):
+    """
+    Incremental: folds only the emails added since the last checkpoint into
+    the saved model (online LDA update). The vocabulary stays that of the
+    last full retrain, because the topic-word matrix has a fixed width;
+    words it has never seen are ignored until the next full run.
+    """
+    checkpoint = load_checkpoint()
+    dict_path, model_path = lda_paths(MODEL_PATH)
+    if checkpoint is None or not os.path.exists(model_path):
+        print("No checkpoint/model yet, running a full training instead.")
+        return train_lda()
+
+    tokens = EmailTokens(min_id=checkpoint['last_email_id'], chunk_size=chunk_size)
+    new_count = Email.objects.filter(id__gt=checkpoint['last_email_id']).count()
+    if not new_count:
+        print("No new emails since the last checkpoint.")
+        return
+
+    print(f"Updating LDA with {new_count} new emails (since Email #{checkpoint['last_email_id']})...")
+    dictionary = corpora.Dictionary.load(dict_path)
+    lda_model = gensim.models.LdaModel.load(model_path)
+    lda_model.update(BowCorpus(tokens, dictionary), passes=passes)
+
+    publish_lda(dictionary, lda_model)
+    save_checkpoint(tokens.last_id, checkpoint.get('trained_docs', 0) + new_count)
+    print("--- Update Complete! ---")
+
 if __name__ == "__main__":
-    train_lda()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train the LDA topic model on stored emails.")
+    parser.add_argument('--incremental', action='store_true', help="Only learn from emails added since the last run.")
+    parser.add_argument('--workers', type=int, default=1, help="Cores for training (LdaMulticore when > 1).")
+    parser.add_argument('--topics', type=int, default=3)
+    parser.add_argument('--passes', type=int, default=None, help="Default: 20 for full, 1 for incremental.")
+    parser.add_argument('--chunk-size', type=int, default=2000, help="Emails read from the DB per query.")
+    args = parser.parse_args()
+
+    if args.incremental:
+        update_lda(passes=args.passes or 1, chunk_size=args.chunk_size)
+    else:
+        train_lda(num_topics=args.topics, passes=args.passes or 20, workers=args.workers, chunk_size=args.chunk_size)
@@ -1,61 +1,183 @@
 import os
+import time
+import argparse
 import django
-import pickle
 import numpy as np
-from sklearn.svm import SVR
+import pandas as pd
+from sklearn.svm import SVR, LinearSVR
+from sklearn.kernel_approximation import Nystroem
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.metrics import mean_absolute_error, r2_score
 
 # Setup Django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'insight_mail.settings') # <--- CHANGE THIS
 django.setup()
 
 from analyzer.models import Email # <--- CHANGE THIS
-from analyzer.engagement_engine import EngagementEngine
+from analyzer.threads import normalize_subject
+from analyzer.model_registry import MODEL_PATH, SVR_MODEL_FILE
+from analyzer.model_artifacts import save_regressor
 
-def train_svr():
+# Exact RBF SVR above this many samples gets slow (quadratic memory/time), 'auto' switches to Nystroem
+AUTO_RBF_LIMIT = 20000
+
+def extract_features(chunk_size=20000):
+    """
+    Features [Rc, Fc, T] for every email in ONE aggregated pass:
+    stream (subject, received_at), normalize the subject, then a pandas
+    GROUP BY root subject gives each thread's counts and time span,
+    which are joined back onto the emails. Returns an (n, 3) float array.
+    """
+    rows = Email.objects.order_by('id').values_list('subject', 'received_at').iterator(chunk_size=chunk_size)
+    df = pd.DataFrame.from_records(rows, columns=['subject', 'received_at'])
+    if df.empty:
+        return np.empty((0, 3))
+
+    df['subject'] = df['subject'].fillna('')
+    lowered = df['subject'].str.lower()
+    df['root'] = df['subject'].map(normalize_subject)
+    df['is_reply'] = lowered.str.startswith('re:')
+    df['is_forward'] = lowered.str.startswith('fwd:')
+
+    threads = df.groupby('root').agg(
+        rc=('is_reply', 'sum'),
+        fc=('is_forward', 'sum'),
+        first=('received_at', 'min'),
+        last=('received_at', 'max'),
+    )
+    threads['t'] = (threads['last'] - threads['first']).dt.total_seconds() / 3600 # hours
+
+    features = threads.loc[df['root'], ['rc', 'fc', 't']]
+    return features.to_numpy(dtype=float)
+
+def auto_label(X):
+    """
+    AUTO-LABELING (Creating Training Data)
+    Since we don't have human labels, we use the Research Rules to create "Ground Truth":
+    1.0 Interested (Rc > 2 and Fc > 0), 0.5 Uninterested (Rc >= 1), 0.0 Individual.
+    """
+    rc, fc = X[:, 0], X[:, 1]
+    return np.where((rc > 2) & (fc > 0), 1.0, np.where(rc >= 1, 0.5, 0.0))
+
+def to_class(scores):
+    """Same thresholds as EngagementEngine._score_to_class."""
+    return np.where(scores > 0.7, 2, np.where(scores > 0.3, 1, 0))
+
+def max_samples_for(model_name, memory_mb, n_components):
+    """How many training rows fit in the memory budget for this model."""
+    budget = memory_mb * 1024 * 1024
+    if model_name == 'rbf':
+        # Kernel matrix: n * n float64
+        return int(np.sqrt(budget / 8))
+    if model_name == 'nystroem':
+        # Transformed design matrix: n * n_components float64
+        return int(budget / (8 * n_components))
+    return int(budget / (8 * 3))
+
+def make_model(model_name, n_components, seed):
+    if model_name == 'rbf':
+        return SVR(kernel='rbf', C=1.0, epsilon=0.1)
+    if model_name == 'linear':
+        return make_pipeline(StandardScaler(), LinearSVR(C=1.0, epsilon=0.1, random_state=seed, max_iter=5000))
+    # RBF kernel approximated with n_components landmarks, then a linear SVR: O(n) instead of O(n^2)
+    return make_pipeline(
+        StandardScaler(),
+        Nystroem(kernel='rbf', n_components=n_components, random_state=seed),
+        LinearSVR(C=1.0, epsilon=0.1, random_state=seed, max_iter=5000),
+    )
+
+def subsample(X, y, limit, rng):
+    if len(X) <= limit:
+        return X, y
+    idx = rng.choice(len(X), size=limit, replace=False)
+    return X[idx], y[idx]
+
+def fit_and_score(model_name, X_train, y_train, X_test, y_test, args, rng):
+    limit = max_samples_for(model_name, args.memory_mb, args.components)
+    X_fit, y_fit = subsample(X_train, y_train, limit, rng)
+
+    model = make_model(model_name, args.components, args.seed)
+    started = time.perf_counter()
+    model.fit(X_fit, y_fit)
+    fit_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    predictions = model.predict(X_test) if len(X_test) else np.empty(0)
+    predict_seconds = time.perf_counter() - started
+
+    report = {
+        'model': model_name,
+        'train_rows': len(X_fit),
+        'fit_s': fit_seconds,
+        'predict_s': predict_seconds,
+    }
+    if len(X_test):
+        report['mae'] = mean_absolute_error(y_test, predictions)
+        report['r2'] = r2_score(y_test, predictions) if len(X_test) > 1 else float('nan')
+        report['class_acc'] = float(np.mean(to_class(predictions) == to_class(y_test)))
+    return model, report
+
+def print_report(rows):
+    print(f"{'model':<10}{'train rows':>12}{'fit s':>10}{'predict s':>11}{'MAE':>8}{'R2':>8}{'class acc':>11}")
+    for r in rows:
+        print(
+            f"{r['model']:<10}{r['train_rows']:>12}{r['fit_s']:>10.2f}{r['predict_s']:>11.3f}"
+            f"{r.get('mae', float('nan')):>8.3f}{r.get('r2', float('nan')):>8.3f}{r.get('class_acc', float('nan')):>11.3f}"
+        )
+
+def train_svr(model_name='auto', memory_mb=512, components=300, test_size=0.2, compare=True, seed=42):
     print("--- Phase 2: Training SVR Engagement Model ---")
-    
-    engine = EngagementEngine()
-    emails = Email.objects.all()
-    
-    if not emails.exists():
+    args = argparse.Namespace(memory_mb=memory_mb, components=components, seed=seed)
+    rng = np.random.default_rng(seed)
+
+    started = time.perf_counter()
+    X = extract_features()
+    if not len(X):
         print("No emails to train on! Sync some emails first.")
         return
+    y = auto_label(X)
+    print(f"Extracted features for {len(X)} emails in {time.perf_counter() - started:.2f}s")
+
+    if model_name == 'auto':
+        model_name = 'rbf' if len(X) <= AUTO_RBF_LIMIT else 'nystroem'
+
+    # Hold out a test split to compare models on the same rows
+    order = rng.permutation(len(X))
+    n_test = int(len(X) * test_size)
+    test_idx, train_idx = order[:n_test], order[n_test:]
+    X_train, y_train, X_test, y_test = X[train_idx], y[train_idx], X[test_idx], y[test_idx]
+
+    print(f"Training {model_name} model...")
+    svr, report = fit_and_score(model_name, X_train, y_train, X_test, y_test, args, rng)
+    rows = [report]
+
+    if compare and model_name != 'rbf':
+        print("Training RBF baseline (subsampled to the memory budget) for comparison...")
+        _, baseline = fit_and_score('rbf', X_train, y_train, X_test, y_test, args, rng)
+        rows.append(baseline)
+
+    print_report(rows)
 
-    X = [] # Features [Rc, Fc, T]
-    y = [] # Labels (0, 0.5, 1.0)
-
-    print(f"Extracting features from {emails.count()} emails...")
-    
-    for email in emails:
-        features = engine.get_thread_features(email)
-        X.append(features)
-        
-        # AUTO-LABELING (Creating Training Data)
-        # Since we don't have human labels, we use the Research Rules to create "Ground Truth"
-        rc, fc, t = features
-        
-        if rc > 2 and fc > 0:
-            label = 1.0 # Interested
-        elif rc >= 1:
-            label = 0.5 # Uninterested
-        else:
-            label = 0.0 # Individual
-            
-        y.append(label)
-
-    # Train SVR
-    print("Training SVR Model...")
-    svr = SVR(kernel='rbf', C=1.0, epsilon=0.1)
-    svr.fit(X, y)
-    
     # Save Model
-    save_path = os.path.join('ml_models', 'svr_model.pkl')
-    os.makedirs('ml_models', exist_ok=True) # Ensure folder exists
-    with open(save_path, 'wb') as f:
-        pickle.dump(svr, f)
-        
+    # As NumPy arrays (no pickle), written to a temp file and renamed, so
+    # running workers (which hot-reload the model) never read a half-written file.
+    save_path = os.path.join(MODEL_PATH, SVR_MODEL_FILE)
+    os.makedirs(MODEL_PATH, exist_ok=True) # Ensure folder exists
+    save_regressor(svr, save_path)
+
     print(f"Model saved to {save_path}")
     print("--- Training Complete! ---")
 
 if __name__ == "__main__":
-    train_svr()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train the Phase 2 engagement regressor.")
+    parser.add_argument('--model', choices=['auto', 'rbf', 'nystroem', 'linear'], default='auto',
+                        help=f"auto = exact RBF SVR up to {AUTO_RBF_LIMIT} emails, Nystroem approximation above.")
+    parser.add_argument('--memory-mb', type=int, default=512, help="Training rows are subsampled to fit this budget.")
+    parser.add_argument('--components', type=int, default=300, help="Nystroem landmarks.")
+    parser.add_argument('--test-size', type=float, default=0.2)
+    parser.add_argument('--no-compare', action='store_true', help="Skip training the RBF baseline for the report.")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    train_svr(args.model, args.memory_mb, args.components, args.test_size, not args.no_compare, args.seed)